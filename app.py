@@ -1,74 +1,607 @@
+# Inicio del arranque del worker, antes de cualquier importación pesada
+import time
+INICIO_ARRANQUE = time.perf_counter()
+
 import dash
-from dash import dcc, html, Input, Output
-import pandas as pd
-import plotly.express as px
+from dash import dcc, html, Input, Output, State
 import plotly.graph_objects as go
-import numpy as np
+import plotly.io as pio
+import hashlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import traceback
 import warnings
+from collections import OrderedDict
+from flask import Response, abort, g, has_request_context, redirect, request
+from arranque import ModuloDiferido, RegistroArranque, instalar as instalar_arranque
+from compacto import memoria, memoria_residente, reducir_enteros
+from departamentos import DATOS_DEPARTAMENTOS, REGIONES, REGIONES_DEPARTAMENTOS
+from epidemiologia import DIAS_MINIMOS_METRICAS, METRICAS_EPIDEMIOLOGICAS, MetricasEpidemiologicas
+from geometria import GeometriaDepartamentos, NIVELES_SIMPLIFICACION
+from espacial import IndicePoligonos, IndicePuntos, zona_de_seleccion
+from ingesta import cargar_cache, crear_mapa_departamentos, normalizar_nombre
+from kpis import AgregadosKPI
+from metricas import (Cronometro, instalar as instalar_metricas, instrumentar, instrumentar_trabajo, medir_fase,
+                      registrar_cache)
+from municipios import RejillaMunicipios, cargar_municipios, limites_vista
+from ranking import IndiceRanking, top_de_valores
+from segundo_plano import GestorSegundoPlano
+from snapshot import abrir_snapshot, bloqueo, limpiar_snapshots, publicar_snapshot, version_publicada
+from teselas import ATRIBUCION_OSM, ORIGEN_OSM, AlmacenTeselas
 warnings.filterwarnings("ignore")
 
+# pandas, numpy y plotly.express se importan la primera vez que se usan
+pd = ModuloDiferido('pandas')
+np = ModuloDiferido('numpy')
+px = ModuloDiferido('plotly.express')
+
+# Codificador JSON rápido y compresión de respuestas, si están instalados
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import flask_compress
+except ImportError:
+    flask_compress = None
+
 # Inicializar la app Dash
-app = dash.Dash(__name__)
+app = dash.Dash(__name__, compress=flask_compress is not None)
 server = app.server
 app.title = "Dashboard COVID-19 Colombia"
 
+# Tiempos de arranque; el reporte se imprime al terminar de importar y tener los datos
+registro_arranque = RegistroArranque(INICIO_ARRANQUE, hitos_finales=('importado', 'listo'))
+registro_arranque.registrar('importaciones', INICIO_ARRANQUE)
+
+# =============================================================================
+# CONFIGURACIÓN
+# =============================================================================
+
+def leer_bandera(nombre, por_defecto=False):
+    """Lee una variable de entorno booleana (1/true/si/yes)"""
+    valor = os.environ.get(nombre)
+    if valor is None:
+        return por_defecto
+    return valor.strip().lower() in ('1', 'true', 'si', 'sí', 'yes')
+
+# En modo cliente el cambio de visualización se resuelve en el navegador
+MODO_CLIENTE = leer_bandera('DASHBOARD_MODO_CLIENTE')
+
+# Con arranque diferido el worker acepta conexiones antes de cargar los datos;
+# las peticiones que los necesitan esperan como máximo ESPERA_DATOS segundos
+ARRANQUE_DIFERIDO = leer_bandera('DASHBOARD_ARRANQUE_DIFERIDO')
+ESPERA_DATOS = float(os.environ.get('DASHBOARD_ESPERA_DATOS', 30))
+
+# En modo segundo plano el callback principal corre en un pool de procesos y el
+# navegador consulta el resultado cada INTERVALO_SEGUNDO_PLANO ms; los trabajos
+# y resultados se guardan en disco (requiere dash[diskcache])
+SEGUNDO_PLANO = leer_bandera('DASHBOARD_SEGUNDO_PLANO') and not MODO_CLIENTE
+DIRECTORIO_SEGUNDO_PLANO = os.environ.get('DASHBOARD_SEGUNDO_PLANO_CACHE', 'cache/segundo_plano')
+PROCESOS_SEGUNDO_PLANO = int(os.environ.get('DASHBOARD_PROCESOS', 2))
+INTERVALO_SEGUNDO_PLANO = int(os.environ.get('DASHBOARD_INTERVALO_SEGUNDO_PLANO', 250))
+
+# URL donde se publica la exportación estática (ver exportar.py); con ella el
+# navegador pide a esa URL los estados exportados y solo los demás al servidor
+URL_ESTATICA = os.environ.get('DASHBOARD_ESTATICO', '')
+ESTATICO = bool(URL_ESTATICA) and not MODO_CLIENTE
+
+# ETags débiles derivados de la versión de los datos en el layout, las
+# dependencias y los callbacks; con SEGUNDOS_CACHE_HTTP > 0 el navegador puede
+# reusar la respuesta ese tiempo sin revalidarla
+CACHE_HTTP = leer_bandera('DASHBOARD_CACHE_HTTP', True)
+SEGUNDOS_CACHE_HTTP = int(os.environ.get('DASHBOARD_CACHE_HTTP_SEGUNDOS', 0))
+
+# Mapa base: un estilo de mapbox de plotly, o 'local' para usar las teselas que
+# sirve la app desde su caché en disco (ver teselas.py; conviene sembrarla
+# antes). La exportación estática no tiene servidor de teselas.
+ESTILO_MAPA = os.environ.get('DASHBOARD_ESTILO_MAPA', 'open-street-map')
+RUTA_TESELAS = os.environ.get('DASHBOARD_TESELAS', 'cache/teselas')
+MAX_MB_TESELAS = float(os.environ.get('DASHBOARD_TESELAS_MAX_MB', 512))
+# Servidor de donde se descargan las teselas que faltan; vacío para servir solo las del disco
+ORIGEN_TESELAS = os.environ.get('DASHBOARD_TESELAS_ORIGEN', ORIGEN_OSM)
+
+# Decimales de coordenadas y tamaños en las figuras (4 decimales ~ 11 m)
+DECIMALES_FIGURAS = int(os.environ.get('DASHBOARD_DECIMALES', 4))
+
+# Plotly y Dash serializan con orjson cuando está configurado como motor
+if orjson is not None:
+    pio.json.config.default_engine = 'orjson'
+    cargar_json = orjson.loads
+else:
+    cargar_json = json.loads
+
+# Brotli si el navegador lo acepta, gzip en otro caso; las respuestas pequeñas van sin comprimir
+server.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+server.config['COMPRESS_LEVEL'] = int(os.environ.get('DASHBOARD_NIVEL_GZIP', 6))
+server.config['COMPRESS_BR_LEVEL'] = int(os.environ.get('DASHBOARD_NIVEL_BROTLI', 4))
+server.config['COMPRESS_MIN_SIZE'] = 500
+
+def redondear(valores, decimales=None):
+    """Redondea un arreglo para no enviar floats con precisión completa"""
+    return np.round(np.asarray(valores, dtype=float), DECIMALES_FIGURAS if decimales is None else decimales)
+
 # =============================================================================
 # DATOS ACTUALIZADOS CON LA INFORMACIÓN PROPORCIONADA
 # =============================================================================
 
-def cargar_datos_actualizados():
+# Caché Parquet con los casos diarios generada por ingesta.py
+RUTA_CACHE_DATOS = os.environ.get('DASHBOARD_DATOS_CACHE', 'cache/casos_diarios.parquet')
+
+def cargar_casos_diarios():
+    """Casos diarios por departamento desde la caché de ingesta, o None si no existe"""
+    if not os.path.exists(RUTA_CACHE_DATOS):
+        return None
+    return cargar_cache(RUTA_CACHE_DATOS)
+
+def calcular_incidencia(casos, poblacion):
+    """Casos por 100,000 habitantes, redondeados a un decimal"""
+    return ((casos / poblacion) * 100000).round(1)
+
+def cargar_datos_actualizados(diarios=None):
     """Función para crear datos con la información real proporcionada"""
     
-    # Datos actualizados basados en la información que proporcionaste
-    datos_departamentos = [
-        # Departamento, Lat, Lon, Casos, Población (aproximada)
-        ['Bogotá D.C.', 4.6097, -74.0817, 65908, 8000000],
-        ['Antioquia', 6.2442, -75.5736, 39941, 6400000],
-        ['Valle del Cauca', 3.8009, -76.6413, 27108, 4500000],
-        ['Atlántico', 10.9639, -74.7964, 17058, 2500000],
-        ['Córdoba', 8.0493, -75.5740, 15566, 1700000],
-        ['Santander', 6.6437, -73.6536, 15000, 2200000],
-        ['Cundinamarca', 4.7979, -74.1925, 14000, 2800000],
-        ['Bolívar', 8.6704, -74.0300, 12000, 2100000],
-        ['Nariño', 1.2136, -77.2811, 11000, 1600000],
-        ['Boyacá', 5.5350, -73.3678, 10000, 1200000],
-        ['Magdalena', 10.4113, -74.4057, 9500, 1400000],
-        ['Cesar', 9.3373, -73.6536, 9000, 1200000],
-        ['Tolima', 4.0925, -75.1545, 8500, 1300000],
-        ['Caldas', 5.2982, -75.2479, 8000, 1000000],
-        ['Huila', 2.5359, -75.5277, 7500, 1100000],
-        ['Sucre', 8.8140, -74.7233, 7000, 850000],
-        ['La Guajira', 11.3548, -72.5205, 6500, 880000],
-        ['Cauca', 2.4417, -76.6066, 6000, 1300000],
-        ['Risaralda', 4.8080, -75.7002, 5500, 940000],
-        ['Norte de Santander', 7.9076, -72.5045, 5000, 1600000],
-        ['Quindío', 4.5310, -75.6801, 4500, 540000],
-        ['Meta', 3.2719, -73.0877, 4000, 1000000],
-        ['Chocó', 5.6919, -76.6582, 3500, 500000],
-        ['Casanare', 5.7589, -71.5724, 3000, 420000],
-        ['Arauca', 6.5474, -70.9977, 2500, 300000],
-        ['Putumayo', 0.8850, -76.5086, 2000, 350000],
-        ['Caquetá', 1.6146, -75.6062, 1500, 400000],
-        ['San Andrés', 12.5567, -81.7185, 3000, 75000],
-        # Departamentos amazónicos con aproximadamente 5 casos
-        ['Amazonas', -1.4429, -71.5724, 5, 76000],
-        ['Guainía', 2.5854, -68.5247, 5, 48000],
-        ['Guaviare', 2.0439, -72.3311, 5, 82000],
-        ['Vaupés', 0.3853, -70.5771, 5, 44000],
-        ['Vichada', 4.4234, -69.2878, 5, 110000]
-    ]
-    
-    df = pd.DataFrame(datos_departamentos, 
+    df = pd.DataFrame(DATOS_DEPARTAMENTOS, 
                      columns=['Departamento', 'Latitud', 'Longitud', 'casos', 'poblacion'])
     
+    # Si hay casos diarios del archivo nacional, los totales salen de ellos
+    if diarios is not None:
+        totales = diarios.groupby('Departamento', observed=True)['casos'].sum()
+        df['casos'] = df['Departamento'].map(totales).fillna(0).astype('int64')
+    
     # Calcular incidencia
-    df['incidencia'] = (df['casos'] / df['poblacion']) * 100000
-    df['incidencia'] = df['incidencia'].round(1)
+    df['incidencia'] = calcular_incidencia(df['casos'], df['poblacion'])
     
     return df
 
-# Cargar datos
-df_datos = cargar_datos_actualizados()
+# Fecha del corte usada cuando solo se tienen los totales de la tabla anterior
+FECHA_CORTE = '2021-12-31'
+
+class CuboCasos:
+    """Casos acumulados por departamento y día.
+    
+    Guarda la suma prefija de los casos diarios con una columna inicial de
+    ceros, de modo que los casos de cualquier rango [inicio, fin] salen de
+    una sola resta vectorizada, sin importar cuántos días haya cargados.
+    La suma se guarda en int32 mientras el total quepa.
+    """
+    
+    def __init__(self, departamentos, fechas, casos_diarios):
+        self.departamentos = list(departamentos)
+        self.fechas = pd.DatetimeIndex(fechas)
+        acumulado = np.zeros((len(self.departamentos), len(self.fechas) + 1), dtype=np.int64)
+        np.cumsum(casos_diarios, axis=1, out=acumulado[:, 1:])
+        self.acumulado = reducir_enteros(acumulado, minimo='int32')
+    
+    @classmethod
+    def desde_datos(cls, df, diarios=None):
+        departamentos = df['Departamento']
+        if diarios is None or diarios.empty:
+            return cls(departamentos, [FECHA_CORTE], df[['casos']].to_numpy())
+        
+        fechas = pd.date_range(diarios['fecha'].min(), diarios['fecha'].max(), freq='D')
+        filas = pd.Index(departamentos).get_indexer(diarios['Departamento'])
+        columnas = fechas.get_indexer(pd.to_datetime(diarios['fecha']))
+        validos = (filas >= 0) & (columnas >= 0)
+        
+        matriz = np.zeros((len(departamentos), len(fechas)), dtype=np.int64)
+        np.add.at(matriz, (filas[validos], columnas[validos]), diarios['casos'].to_numpy()[validos])
+        return cls(departamentos, fechas, matriz)
+    
+    @classmethod
+    def desde_acumulado(cls, departamentos, fechas, acumulado):
+        """Cubo sobre un acumulado ya calculado (por ejemplo, mapeado desde un snapshot)"""
+        cubo = cls.__new__(cls)
+        cubo.departamentos = list(departamentos)
+        cubo.fechas = pd.DatetimeIndex(fechas)
+        cubo.acumulado = acumulado
+        return cubo
+    
+    @property
+    def n_dias(self):
+        return len(self.fechas)
+    
+    def normalizar_rango(self, rango):
+        """Rango de índices de día acotado; None si cubre todos los días"""
+        if not rango:
+            return None
+        inicio = min(max(int(rango[0]), 0), self.n_dias - 1)
+        fin = min(max(int(rango[1]), inicio), self.n_dias - 1)
+        if inicio == 0 and fin == self.n_dias - 1:
+            return None
+        return (inicio, fin)
+    
+    def casos_en_rango(self, rango=None):
+        """Casos por departamento entre dos índices de día (ambos incluidos)"""
+        inicio, fin = rango if rango is not None else (0, self.n_dias - 1)
+        return self.acumulado[:, fin + 1] - self.acumulado[:, inicio]
+
+def calcular_version_datos(df, cubo):
+    """Huella corta del contenido de los datos, usada como versión del dataset"""
+    huella = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    huella.update(cubo.fechas.asi8.tobytes())
+    huella.update(cubo.acumulado.tobytes())
+    return huella.hexdigest()[:12]
+
+def construir_datos():
+    """Tabla de departamentos, cubo de casos y versión, construidos desde las fuentes"""
+    diarios = cargar_casos_diarios()
+    df = cargar_datos_actualizados(diarios)
+    cubo = CuboCasos.desde_datos(df, diarios)
+    return df, cubo, calcular_version_datos(df, cubo)
+
+# =============================================================================
+# SNAPSHOT COMPARTIDO ENTRE WORKERS
+# =============================================================================
+
+# Directorio de snapshots; sin él cada worker construye su propia copia de los datos
+DIRECTORIO_SNAPSHOTS = os.environ.get('DASHBOARD_SNAPSHOTS')
+# Segundos entre revisiones del puntero ACTUAL en busca de una versión nueva
+INTERVALO_REVISION = float(os.environ.get('DASHBOARD_REVISION_SNAPSHOT', 5))
+
+def datos_a_snapshot(df, cubo):
+    arreglos = {
+        'latitud': df['Latitud'].to_numpy(),
+        'longitud': df['Longitud'].to_numpy(),
+        'casos': df['casos'].to_numpy(),
+        'poblacion': df['poblacion'].to_numpy(),
+        'incidencia': df['incidencia'].to_numpy(),
+        'fechas': cubo.fechas.values.astype('datetime64[ns]'),
+        'acumulado': cubo.acumulado
+    }
+    return arreglos, {'departamentos': df['Departamento'].tolist()}
+
+def datos_desde_snapshot(arreglos, meta):
+    """Reconstruye la tabla y el cubo; el cubo queda mapeado sin copiarse"""
+    df = pd.DataFrame({
+        'Departamento': meta['departamentos'],
+        'Latitud': arreglos['latitud'],
+        'Longitud': arreglos['longitud'],
+        'casos': arreglos['casos'],
+        'poblacion': arreglos['poblacion'],
+        'incidencia': arreglos['incidencia']
+    })
+    cubo = CuboCasos.desde_acumulado(meta['departamentos'], arreglos['fechas'], arreglos['acumulado'])
+    return df, cubo, meta['version']
+
+def cargar_datos():
+    """Datos desde el snapshot vigente; el primer proceso en arrancar lo construye y publica"""
+    if not DIRECTORIO_SNAPSHOTS:
+        return construir_datos()
+    
+    version = version_publicada(DIRECTORIO_SNAPSHOTS)
+    if version is None:
+        with bloqueo(DIRECTORIO_SNAPSHOTS):
+            version = version_publicada(DIRECTORIO_SNAPSHOTS)
+            if version is None:
+                df, cubo, version = construir_datos()
+                publicar_snapshot(DIRECTORIO_SNAPSHOTS, version, *datos_a_snapshot(df, cubo))
+    return datos_desde_snapshot(*abrir_snapshot(DIRECTORIO_SNAPSHOTS, version))
+
+# Datos publicados del proceso (ver DatosProceso); se cargan en inicializar_datos()
+datos_proceso = None
+# Datos fijados fuera de una petición, por ejemplo mientras se precalienta la caché
+_datos_fijados = contextvars.ContextVar('datos_fijados', default=None)
+
+def datos_actuales():
+    """Datos de la petición en curso: los publicados cuando los pidió por primera vez.
+
+    Aunque otro hilo publique una versión nueva a mitad de la petición, todas
+    sus lecturas siguen viendo la misma.
+    """
+    if has_request_context():
+        if 'datos_proceso' not in g:
+            g.datos_proceso = datos_proceso
+        return g.datos_proceso
+    return _datos_fijados.get() or datos_proceso
+
+def datos_en_rango(rango):
+    """Tabla con casos e incidencia restringidos a un rango de días ya normalizado"""
+    datos = datos_actuales()
+    if rango is None:
+        return datos.df
+    df = datos.df.copy()
+    df['casos'] = datos.cubo.casos_en_rango(rango)
+    df['incidencia'] = calcular_incidencia(df['casos'], df['poblacion'])
+    return df
+
+# =============================================================================
+# MÉTRICAS EPIDEMIOLÓGICAS
+# =============================================================================
+
+def metricas_epidemiologicas():
+    """Métricas de la versión vigente: se calculan la primera vez que se piden"""
+    datos = datos_actuales()
+    if datos.metricas is None:
+        with medir_fase('metricas'):
+            datos.metricas = MetricasEpidemiologicas(datos.cubo.acumulado, datos.df['poblacion'].to_numpy())
+    return datos.metricas
+
+def con_metrica(datos, metrica, rango):
+    """Copia de los datos con la columna de la métrica en el último día del rango"""
+    datos = datos.copy()
+    datos[metrica] = metricas_epidemiologicas().en_dia(metrica, None if rango is None else rango[1])
+    return datos
+
+# =============================================================================
+# RANKING DE DEPARTAMENTOS
+# =============================================================================
+
+# Métricas con índice ordenado para el top-N
+METRICAS_RANKING = ('casos', 'incidencia')
+# Departamentos del ranking si el usuario no elige otra cantidad
+N_TOP = 10
+
+def regiones_de(df):
+    """Región de cada fila de la tabla; los departamentos sin región quedan en 'Otra'"""
+    return df['Departamento'].map(REGIONES_DEPARTAMENTOS).fillna('Otra')
+
+def crear_indice_ranking(df):
+    """Índices ordenados por métrica, particionados por región"""
+    return IndiceRanking.desde_tabla(df, METRICAS_RANKING, regiones_de(df))
+
+def actualizar_indice_ranking(indice, df_anterior, df):
+    """El índice de la tabla anterior llevado a la nueva sin reconstruirlo; None si no se puede.
+
+    Sirve si la tabla nueva conserva las filas de la anterior en el mismo orden:
+    las filas con valores distintos se reubican y las nuevas se agregan.
+    """
+    n = len(df_anterior)
+    if df['Departamento'].tolist()[:n] != df_anterior['Departamento'].tolist():
+        return None
+    valores = {metrica: df[metrica].to_numpy(dtype=np.float64) for metrica in METRICAS_RANKING}
+    cambiadas = np.flatnonzero(np.any([valores[m][:n] != indice.valores[m] for m in METRICAS_RANKING], axis=0))
+    indice = indice.copia()
+    if len(cambiadas):
+        indice.actualizar(cambiadas, {metrica: v[cambiadas] for metrica, v in valores.items()})
+    if len(df) > n:
+        indice.agregar({metrica: v[n:] for metrica, v in valores.items()}, regiones_de(df.iloc[n:]).to_numpy())
+    return indice
+
+def normalizar_regiones(regiones):
+    """Regiones en orden fijo; None si se piden todas o ninguna"""
+    elegidas = set(regiones or ())
+    regiones = tuple(r for r in REGIONES if r in elegidas)
+    if not regiones or len(regiones) == len(REGIONES):
+        return None
+    return regiones
+
+def normalizar_ranking(n_top, regiones):
+    """Cantidad acotada y regiones en orden fijo; las regiones son None si se piden todas"""
+    n_top = min(max(int(n_top or N_TOP), 1), len(datos_actuales().df))
+    return n_top, normalizar_regiones(regiones)
+
+def filas_candidatas(regiones, seleccion):
+    """Posiciones de las filas de las regiones y la selección del mapa; None si son todas"""
+    datos = datos_actuales()
+    if seleccion is None:
+        return None if regiones is None else datos.indice_ranking.filas(regiones)
+    filas = np.flatnonzero(datos.df['Departamento'].isin(seleccion).to_numpy())
+    if regiones is not None:
+        filas = np.intersect1d(filas, datos.indice_ranking.filas(regiones))
+    return filas
+
+def filas_top(columna, datos, rango, n_top, regiones, ascendente=False, seleccion=None):
+    """Posiciones de las n_top filas con mayor valor (menor con ascendente).
+
+    Con un rango los valores cambian, las métricas epidemiológicas no tienen
+    índice y una selección del mapa no es una partición: en esos casos se
+    seleccionan sobre la columna. Los NaN quedan fuera.
+    """
+    if rango is None and seleccion is None and columna in METRICAS_RANKING:
+        return datos_actuales().indice_ranking.top(columna, n_top, regiones)
+    valores = datos[columna].to_numpy(dtype=np.float64)
+    valores = np.where(np.isnan(valores), -np.inf, -valores if ascendente else valores)
+    filas = top_de_valores(valores, n_top, filas_candidatas(regiones, seleccion))
+    return filas[np.isfinite(valores[filas])]
+
+# =============================================================================
+# KPIS POR REGIÓN
+# =============================================================================
+
+# Los KPIs salen de sumas acumuladas por región y día, no de recorrer la tabla;
+# con una selección del mapa, de las de cada departamento
+
+def crear_agregados_kpis(df, cubo):
+    """Casos por día, población y departamentos de cada región (filas del cubo = filas de la tabla)"""
+    return AgregadosKPI(regiones_de(df).to_numpy(), cubo.acumulado, df['poblacion'].to_numpy())
+
+def actualizar_agregados_kpis(agregados, anterior, df, cubo):
+    """Los agregados por región llevados al cubo nuevo sumando solo las diferencias; None si no se puede.
+
+    Sirve si los departamentos y su población no cambiaron y el cubo empieza el
+    mismo día: los días nuevos y las correcciones de días anteriores entran
+    como un lote de casos.
+    """
+    cubo_anterior = anterior.cubo
+    if (df['Departamento'].tolist() != anterior.df['Departamento'].tolist()
+            or not np.array_equal(df['poblacion'].to_numpy(), anterior.df['poblacion'].to_numpy())
+            or cubo.n_dias < cubo_anterior.n_dias or cubo.fechas[0] != cubo_anterior.fechas[0]):
+        return None
+    delta = np.diff(np.asarray(cubo.acumulado, dtype=np.int64), axis=1)
+    delta[:, :cubo_anterior.n_dias] -= np.diff(np.asarray(cubo_anterior.acumulado, dtype=np.int64), axis=1)
+    filas, dias = np.nonzero(delta)
+    agregados = agregados.copia()
+    agregados.agregar_casos(regiones_de(df).to_numpy()[filas], dias, delta[filas, dias], n_dias=cubo.n_dias)
+    return agregados
+
+def crear_agregados_departamentos(df, cubo):
+    """Casos por día y población de cada departamento, para las selecciones del mapa"""
+    return AgregadosKPI(df['Departamento'].to_numpy(), cubo.acumulado, df['poblacion'].to_numpy())
+
+def totales_kpis(rango=None, regiones=None, seleccion=None):
+    """Totales de las regiones, o de los departamentos seleccionados dentro de ellas"""
+    datos = datos_actuales()
+    if seleccion is None:
+        return datos.agregados_kpis.totales(rango, regiones)
+    if regiones is not None:
+        seleccion = [d for d in seleccion if REGIONES_DEPARTAMENTOS.get(d, 'Otra') in regiones]
+    return datos.agregados_departamentos.totales(rango, seleccion)
+
+def calcular_totales(df):
+    """Los mismos totales que los agregados, sumando una tabla completa"""
+    casos = int(df['casos'].sum())
+    poblacion = int(df['poblacion'].sum())
+    return {
+        'casos': casos,
+        'poblacion': poblacion,
+        'departamentos': len(df),
+        'incidencia': casos / poblacion * 100000 if poblacion else 0.0,
+    }
+
+# =============================================================================
+# GEOMETRÍA DE LOS DEPARTAMENTOS
+# =============================================================================
+
+# Límites departamentales para el mapa coroplético (shapefile o GeoJSON)
+RUTA_GEOMETRIA = os.environ.get('DASHBOARD_GEOMETRIA_DEPARTAMENTOS', 'datos/departamentos.geojson')
+NIVEL_GEOMETRIA = os.environ.get('DASHBOARD_NIVEL_GEOMETRIA', 'media')
+if NIVEL_GEOMETRIA not in NIVELES_SIMPLIFICACION:
+    NIVEL_GEOMETRIA = 'media'
+
+def cargar_geometria(departamentos):
+    """Geometría simplificada de los departamentos, o None si no hay archivo o geopandas"""
+    if not os.path.exists(RUTA_GEOMETRIA):
+        return None
+    try:
+        return GeometriaDepartamentos(RUTA_GEOMETRIA, departamentos)
+    except ImportError:
+        return None
+
+geometria_departamentos = None
+
+def url_geometria(nivel=None):
+    nivel = nivel or NIVEL_GEOMETRIA
+    return app.get_relative_path(f'/geometria/{geometria_departamentos.version}/departamentos-{nivel}.json')
+
+@server.route('/geometria/<version>/departamentos-<nivel>.json')
+def servir_geometria(version, nivel):
+    if geometria_departamentos is None or nivel not in geometria_departamentos.geojson:
+        abort(404)
+    if version != geometria_departamentos.version:
+        return redirect(url_geometria(nivel))
+    respuesta = Response(geometria_departamentos.geojson[nivel], mimetype='application/json')
+    # La versión va en la URL, así que el navegador puede conservarla indefinidamente
+    respuesta.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    # Débil: la compresión cambia los bytes pero no el contenido
+    respuesta.set_etag(f'{version}-{nivel}', weak=True)
+    return respuesta.make_conditional(request)
+
+# =============================================================================
+# MUNICIPIOS
+# =============================================================================
+
+# Tabla de municipios con centroides, casos y población (CSV o Parquet)
+RUTA_MUNICIPIOS = os.environ.get('DASHBOARD_MUNICIPIOS', 'datos/municipios.csv')
+# Máximo de marcadores que se envían en una respuesta del mapa municipal
+MAX_MARCADORES = int(os.environ.get('DASHBOARD_MAX_MARCADORES', 500))
+
+def cargar_rejilla_municipios():
+    """Rejilla de municipios por zoom, o None si no hay tabla de municipios"""
+    if not os.path.exists(RUTA_MUNICIPIOS):
+        return None
+    return RejillaMunicipios(cargar_municipios(RUTA_MUNICIPIOS), MAX_MARCADORES)
+
+# =============================================================================
+# TESELAS DEL MAPA BASE
+# =============================================================================
+
+almacen_teselas = AlmacenTeselas(RUTA_TESELAS, int(MAX_MB_TESELAS * 1024 * 1024), ORIGEN_TESELAS)
+
+# Las teselas de OpenStreetMap cambian poco: el navegador las conserva una semana
+SEGUNDOS_CACHE_TESELAS = 7 * 24 * 3600
+
+@server.route('/teselas/<int:z>/<int:x>/<int:y>.png')
+def servir_tesela(z, x, y):
+    if not almacen_teselas.valida(z, x, y):
+        abort(404)
+    try:
+        datos = almacen_teselas.obtener(z, x, y)
+    except OSError:
+        abort(502)
+    if datos is None:
+        abort(404)
+    respuesta = Response(datos, mimetype='image/png')
+    respuesta.headers['Cache-Control'] = f'public, max-age={SEGUNDOS_CACHE_TESELAS}'
+    respuesta.add_etag()
+    return respuesta.make_conditional(request)
+
+# =============================================================================
+# SELECCIÓN EN EL MAPA
+# =============================================================================
+
+# Un clic, un rectángulo o un lazo sobre el mapa filtran el ranking y los KPIs
+# a los departamentos marcados. Los índices se construyen una vez por versión
+# de los datos y quedan en None sin shapely, sin geometría o sin municipios.
+
+def crear_indice(constructor, *argumentos):
+    try:
+        return constructor(*argumentos)
+    except ImportError:
+        return None
+
+def crear_indices_espaciales(df, rejilla_municipios):
+    """Índices de centroides de departamentos y municipios, de polígonos de departamentos
+    y departamento del dashboard de cada municipio de la rejilla (None si no se reconoce)"""
+    indice_departamentos = crear_indice(IndicePuntos, df['Latitud'], df['Longitud'])
+    indice_municipios = indice_poligonos = departamento_municipios = None
+    if rejilla_municipios is not None:
+        indice_municipios = crear_indice(IndicePuntos, rejilla_municipios.df['Latitud'], rejilla_municipios.df['Longitud'])
+        mapa = crear_mapa_departamentos(df['Departamento'])
+        departamento_municipios = rejilla_municipios.df['Departamento'].map(
+            lambda nombre: mapa.get(normalizar_nombre(nombre))).to_numpy()
+    if geometria_departamentos is not None:
+        indice_poligonos = crear_indice(IndicePoligonos, geometria_departamentos.poligonos)
+    return indice_departamentos, indice_municipios, indice_poligonos, departamento_municipios
+
+def normalizar_seleccion(seleccion):
+    """Departamentos seleccionados en el orden de la tabla; None si no hay ninguno"""
+    elegidos = set(seleccion or ())
+    seleccion = tuple(d for d in datos_actuales().df['Departamento'] if d in elegidos)
+    return seleccion or None
+
+def departamentos_en_punto(lat, lon, municipal):
+    """Departamento cuyo polígono contiene el punto; sin polígonos, el del centroide más cercano"""
+    datos = datos_actuales()
+    if datos.indice_poligonos is not None:
+        posicion = datos.indice_poligonos.que_contiene(lat, lon)
+        if posicion is not None:
+            return [geometria_departamentos.nombres[posicion]]
+    if municipal and datos.indice_municipios is not None:
+        return [datos.departamento_municipios[datos.indice_municipios.mas_cercano(lat, lon)]]
+    if datos.indice_departamentos is not None:
+        return [datos.df['Departamento'].iloc[datos.indice_departamentos.mas_cercano(lat, lon)]]
+    return []
+
+def departamentos_en_zona(zona, municipal):
+    """Departamentos con su centroide (o el de alguno de sus municipios) dentro de la zona"""
+    datos = datos_actuales()
+    if municipal and datos.indice_municipios is not None:
+        return list(datos.departamento_municipios[datos.indice_municipios.dentro(zona)])
+    return datos.df['Departamento'].iloc[datos.indice_departamentos.dentro(zona)].tolist()
+
+def resolver_seleccion(click=None, seleccion=None, municipal=False, es_clic=True):
+    """Departamentos marcados con un clic, o con un rectángulo o lazo si es_clic es False"""
+    if es_clic:
+        punto = ((click or {}).get('points') or [{}])[0]
+        if punto.get('location'):
+            return normalizar_seleccion([punto['location']])
+        if 'lat' in punto and 'lon' in punto:
+            return normalizar_seleccion(departamentos_en_punto(punto['lat'], punto['lon'], municipal))
+        return None
+    
+    if not seleccion:
+        return None
+    if datos_actuales().indice_departamentos is not None:
+        zona = zona_de_seleccion(seleccion)
+        if zona is not None:
+            return normalizar_seleccion(departamentos_en_zona(zona, municipal))
+    # Sin índice quedan los puntos que marcó plotly, si traen el departamento
+    return normalizar_seleccion([p.get('location') or p.get('text') for p in seleccion.get('points') or ()])
 
 # =============================================================================
 # COMENTARIOS SOBRE LA DISTRIBUCIÓN DE CASOS
@@ -305,11 +838,32 @@ app.index_string = '''
 # COMPONENTES DEL DASHBOARD
 # =============================================================================
 
+# Opciones del selector de visualización
+OPCIONES_VISUALIZACION = [
+    {'label': 'Casos Totales', 'value': 'casos'},
+    {'label': 'Incidencia x 100k hab.', 'value': 'incidencia'},
+    {'label': 'Promedio Diario (7 días)', 'value': 'promedio_7d'},
+    {'label': 'Crecimiento Semanal (%)', 'value': 'crecimiento'},
+    {'label': 'Tiempo de Duplicación (días)', 'value': 'duplicacion'},
+    {'label': 'Casos 14 días x 100k hab.', 'value': 'tasa_14d'},
+    {'label': 'Rt Estimado', 'value': 'rt'}
+]
+
+def opciones_visualizacion():
+    """Opciones del selector; sin días suficientes en el cubo las métricas diarias no se ofrecen"""
+    n_dias = datos_actuales().cubo.n_dias
+    return [
+        opcion for opcion in OPCIONES_VISUALIZACION
+        if n_dias >= DIAS_MINIMOS_METRICAS.get(opcion['value'], 1)
+    ]
+
 # KPIs principales
-def crear_kpis():
-    total_casos = int(df_datos['casos'].sum())
-    total_poblacion = int(df_datos['poblacion'].sum())
-    incidencia_promedio = (total_casos / total_poblacion) * 100000
+def crear_kpis(totales=None):
+    if totales is None:
+        totales = datos_actuales().agregados_kpis.totales()
+    total_casos = totales['casos']
+    total_poblacion = totales['poblacion']
+    incidencia_promedio = totales['incidencia']
     
     return html.Div([
         html.Div([
@@ -320,7 +874,7 @@ def crear_kpis():
             
             html.Div([
                 html.Div(f"{total_poblacion:,}", className="kpi-number kpi-poblacion"),
-                html.Div("Población Total", style={'color': '#6c757d'})
+                html.Div(f"Población Total ({totales['departamentos']} departamentos)", style={'color': '#6c757d'})
             ], className="kpi-card"),
             
             html.Div([
@@ -330,6 +884,86 @@ def crear_kpis():
         ], className="kpi-container")
     ])
 
+# Selector del rango de fechas sobre los días del cubo de casos
+def describir_rango(rango):
+    cubo = datos_actuales().cubo
+    inicio, fin = rango if rango is not None else (0, cubo.n_dias - 1)
+    if inicio == fin:
+        return f"Corte al {cubo.fechas[fin]:%d/%m/%Y}"
+    return f"Del {cubo.fechas[inicio]:%d/%m/%Y} al {cubo.fechas[fin]:%d/%m/%Y}"
+
+def crear_selector_fechas():
+    cubo = datos_actuales().cubo
+    ultimo = cubo.n_dias - 1
+    
+    # Marcas en el primer día de cada mes, como máximo seis
+    inicios_mes = np.flatnonzero(cubo.fechas.day == 1)
+    paso = max(1, int(np.ceil(len(inicios_mes) / 6)))
+    marcas = {int(i): cubo.fechas[i].strftime('%b %Y') for i in inicios_mes[::paso]}
+    
+    return html.Div([
+        html.Label("Rango de Fechas:", className="dropdown-label"),
+        dcc.RangeSlider(
+            id='rango-fechas',
+            min=0,
+            max=ultimo,
+            step=1,
+            value=[0, ultimo],
+            marks=marcas,
+            allowCross=False
+        ),
+        html.Div(describir_rango(None), id='texto-rango', style={'fontSize': '0.85rem', 'color': '#6c757d'})
+    ], className="dropdown", style={} if ultimo > 0 else {'display': 'none'})
+
+# Selector de granularidad; el nivel municipal solo existe con tabla de municipios
+def crear_selector_granularidad():
+    disponible = datos_actuales().rejilla_municipios is not None and not MODO_CLIENTE
+    return html.Div([
+        html.Label("Nivel Geográfico:", className="dropdown-label"),
+        dcc.RadioItems(
+            id='granularidad',
+            options=[
+                {'label': ' Departamentos', 'value': 'departamentos'},
+                {'label': ' Municipios', 'value': 'municipios', 'disabled': not disponible}
+            ],
+            value='departamentos',
+            labelStyle={'display': 'block'}
+        )
+    ], className="dropdown", style={} if disponible else {'display': 'none'})
+
+# Cantidad de departamentos y regiones del ranking
+def cantidades_ranking():
+    total = len(datos_actuales().df)
+    return sorted({n for n in (5, 10, 15, 20) if n < total} | {total})
+
+def crear_selector_ranking():
+    total = len(datos_actuales().df)
+    cantidades = cantidades_ranking()
+    return html.Div([
+        html.Label("Departamentos en el Ranking:", className="dropdown-label"),
+        dcc.Dropdown(
+            id='n-top',
+            options=[{'label': 'Todos' if n == total else str(n), 'value': n} for n in cantidades],
+            value=min(N_TOP, total),
+            clearable=False
+        ),
+        html.Label("Región:", className="dropdown-label", style={'marginTop': '1rem'}),
+        dcc.Dropdown(
+            id='regiones',
+            options=[{'label': region, 'value': region} for region in REGIONES],
+            value=[],
+            multi=True,
+            placeholder="Todas las regiones"
+        )
+    ], className="dropdown")
+
+# Avance del cálculo de las figuras, visible solo mientras corre en segundo plano
+def crear_barra_progreso():
+    if not SEGUNDO_PLANO:
+        return []
+    return [html.Progress(id='progreso-figuras', value='0', max=str(PASOS_FIGURAS),
+                          style={'width': '100%', 'visibility': 'hidden'})]
+
 # Sección de información
 def crear_seccion_info():
     return html.Div([
@@ -377,166 +1011,382 @@ def crear_seccion_info():
         ])
     ], className="info-section")
 
+# Figuras precalculadas para el modo cliente
+def figuras_por_tipo(rango=None, n_top=N_TOP, regiones=None, seleccion=None):
+    figuras = {}
+    for opcion in opciones_visualizacion():
+        mapa_json, top_json = obtener_figuras_serializadas(opcion['value'], rango, n_top, regiones, seleccion)
+        figuras[opcion['value']] = {'mapa': cargar_json(mapa_json), 'top': cargar_json(top_json)}
+    return figuras
+
+def crear_almacen_figuras():
+    return dcc.Store(id='figuras-precalculadas', data=figuras_por_tipo())
+
+# Lo que el navegador necesita para encontrar un estado en la exportación estática
+def datos_exportacion():
+    datos = datos_actuales()
+    return {
+        'url': URL_ESTATICA.rstrip('/') + '/',
+        'version': datos.version,
+        'regiones': REGIONES,
+        'ultimo_dia': datos.cubo.n_dias - 1,
+        'total': len(datos.df),
+        'n_top': N_TOP
+    }
+
+def crear_almacenes_exportacion():
+    return [
+        dcc.Store(id='exportacion', data=datos_exportacion()),
+        # Entradas de los estados que no están exportados, para el servidor
+        dcc.Store(id='peticion-servidor')
+    ]
+
 # Layout principal
-app.layout = html.Div([
-    # Header
-    html.Div([
+def crear_layout():
+    componentes = [
+        # Header
         html.Div([
-            html.H1("Dashboard COVID-19 Colombia"),
-            html.P("Distribución e incidencia de casos por departamento - 2021")
-        ], className="header")
-    ]),
-    
-    # Contenedor principal
-    html.Div([
-        # KPIs
-        crear_kpis(),
-        
-        # Layout principal
+            html.Div([
+                html.H1("Dashboard COVID-19 Colombia"),
+                html.P("Distribución e incidencia de casos por departamento - 2021")
+            ], className="header")
+        ]),
+    
+        # Contenedor principal
         html.Div([
-            # Columna de filtros
+            # KPIs
+            html.Div(crear_kpis(), id='contenedor-kpis'),
+        
+            # Layout principal
             html.Div([
+                # Columna de filtros
                 html.Div([
-                    html.H5("Filtros"),
-                    
                     html.Div([
-                        html.Label("Tipo de Visualización:", className="dropdown-label"),
-                        dcc.Dropdown(
-                            id='tipo-visualizacion',
-                            options=[
-                                {'label': 'Casos Totales', 'value': 'casos'},
-                                {'label': 'Incidencia x 100k hab.', 'value': 'incidencia'}
-                            ],
-                            value='casos',
-                            clearable=False
-                        )
-                    ], className="dropdown"),
+                        html.H5("Filtros"),
                     
-                    html.Hr(),
+                        html.Div([
+                            html.Label("Tipo de Visualización:", className="dropdown-label"),
+                            dcc.Dropdown(
+                                id='tipo-visualizacion',
+                                options=opciones_visualizacion(),
+                                value='casos',
+                                clearable=False
+                            )
+                        ], className="dropdown"),
                     
-                    html.Div([
-                        html.H6("Información del Dashboard", style={'color': '#2c3e50', 'marginBottom': '1rem'}),
-                        html.P("Este dashboard muestra la distribución de casos de COVID-19 en Colombia durante 2021."),
-                        html.P("• Casos Totales: Número absoluto de casos", style={'marginBottom': '0.5rem', 'fontSize': '0.9rem'}),
-                        html.P("• Incidencia: Casos por 100,000 habitantes", style={'marginBottom': '0.5rem', 'fontSize': '0.9rem'})
-                    ], style={'fontSize': '0.9rem', 'color': '#6c757d'})
+                        crear_selector_fechas(),
+                    
+                        crear_selector_granularidad(),
                     
-                ], className="filter-section")
-            ], className="filters-column"),
+                        crear_selector_ranking(),
+                    
+                        html.Hr(),
+                    
+                        html.Div([
+                            html.H6("Información del Dashboard", style={'color': '#2c3e50', 'marginBottom': '1rem'}),
+                            html.P("Este dashboard muestra la distribución de casos de COVID-19 en Colombia durante 2021."),
+                            html.P("• Casos Totales: Número absoluto de casos", style={'marginBottom': '0.5rem', 'fontSize': '0.9rem'}),
+                            html.P("• Incidencia: Casos por 100,000 habitantes", style={'marginBottom': '0.5rem', 'fontSize': '0.9rem'})
+                        ], style={'fontSize': '0.9rem', 'color': '#6c757d'})
+                    
+                    ], className="filter-section")
+                ], className="filters-column"),
             
-            # Columna de contenido
-            html.Div([
-                # Mapa Coroplético
+                # Columna de contenido
                 html.Div([
+                    # Mapa Coroplético
                     html.Div([
-                        html.H5("Mapa Coroplético de Colombia - Distribución COVID-19"),
-                        dcc.Graph(id='mapa-coropletico')
-                    ], className="card")
-                ]),
+                        html.Div([
+                            html.H5("Mapa Coroplético de Colombia - Distribución COVID-19"),
+                            *crear_barra_progreso(),
+                            dcc.Graph(id='mapa-coropletico')
+                        ], className="card")
+                    ]),
                 
-                # Top 10 Departamentos
-                html.Div([
+                    # Ranking de departamentos
                     html.Div([
-                        html.H5("Top 10 Departamentos con Mayor Incidencia"),
-                        dcc.Graph(id='top-departamentos')
-                    ], className="card")
-                ])
-            ], className="content-column")
-        ], className="main-layout"),
+                        html.Div([
+                            html.H5("Ranking de Departamentos con Mayor Incidencia"),
+                            dcc.Graph(id='top-departamentos')
+                        ], className="card")
+                    ])
+                ], className="content-column")
+            ], className="main-layout"),
         
-        # Sección de información
-        crear_seccion_info()
+            # Sección de información
+            crear_seccion_info()
         
-    ], className="container")
-])
+        ], className="container")
+    ]
+    
+    # Departamentos marcados en el mapa
+    componentes.append(dcc.Store(id='seleccion-mapa'))
+    
+    if MODO_CLIENTE:
+        componentes.append(crear_almacen_figuras())
+    else:
+        # Qué figuras muestra el navegador, para enviarle solo las diferencias
+        componentes.append(dcc.Store(id='estado-figuras'))
+        # Marca de tiempo del último movimiento del mapa en el nivel municipal
+        componentes.append(dcc.Store(id='vista-municipal'))
+        if ESTATICO:
+            componentes.extend(crear_almacenes_exportacion())
+    
+    return html.Div(componentes)
+
+# Layout ya construido para la versión vigente de los datos
+_layouts = {}
+
+def servir_layout():
+    """Layout de la versión vigente: se construye en la primera carga y luego se reutiliza"""
+    if not datos_listos.is_set():
+        # Solo pasa en la validación que hace Dash en la primera petición del worker;
+        # las cargas reales de la página esperan los datos en esperar_datos_peticion
+        return html.Div("Cargando datos...")
+    version = datos_actuales().version
+    layout = _layouts.get(version)
+    if layout is None:
+        with registro_arranque.medir('layout'):
+            layout = crear_layout()
+        _layouts.clear()
+        _layouts[version] = layout
+    return layout
 
 # =============================================================================
 # CALLBACKS
 # =============================================================================
 
-@app.callback(
-    [Output('mapa-coropletico', 'figure'),
-     Output('top-departamentos', 'figure')],
-    [Input('tipo-visualizacion', 'value')]
-)
-def actualizar_dashboard(tipo_visualizacion):
-    
-    # Configuración según tipo de visualización
+def configuracion_visualizacion(tipo_visualizacion):
+    """Columna, títulos y colores según el tipo de visualización"""
     if tipo_visualizacion == 'casos':
-        columna = 'casos'
-        titulo_mapa = 'Casos Totales de COVID-19 por Departamento'
-        color_scale = 'Blues'
-        titulo_top = 'Top 10 Departamentos - Casos Totales'
-        color_bar = '#1f77b4'
-        size_factor = 0.0005  # Factor para ajustar el tamaño de los puntos
+        return dict(
+            columna='casos',
+            titulo_mapa='Casos Totales de COVID-19 por Departamento',
+            color_scale='Blues',
+            titulo_top='Top {n} Departamentos - Casos Totales',
+            color_bar='#1f77b4',
+            size_factor=0.0005,  # Factor para ajustar el tamaño de los puntos
+            titulo_barra='Casos Totales',
+            etiqueta='Casos',
+            formato=':,'
+        )
+    if tipo_visualizacion in CONFIGURACION_METRICAS:
+        return dict(CONFIGURACION_METRICAS[tipo_visualizacion], columna=tipo_visualizacion)
+    return dict(
+        columna='incidencia',
+        titulo_mapa='Incidencia de COVID-19 (casos por 100,000 hab.)',
+        color_scale='Reds',
+        titulo_top='Top {n} Departamentos - Incidencia x 100k hab.',
+        color_bar='#d62728',
+        size_factor=0.05,  # Factor diferente para incidencia
+        titulo_barra='Incidencia x 100k',
+        etiqueta='Incidencia',
+        formato=':.1f',
+        sufijo=' x100k'
+    )
+
+# Métricas epidemiológicas: valor en el último día del rango seleccionado
+CONFIGURACION_METRICAS = {
+    'promedio_7d': dict(
+        titulo_mapa='Promedio de Casos Diarios (últimos 7 días)',
+        color_scale='Purples',
+        titulo_top='Top {n} Departamentos - Promedio Diario 7 días',
+        color_bar='#6a51a3',
+        size_factor=0.02,
+        titulo_barra='Casos por día',
+        etiqueta='Promedio 7 días',
+        formato=':.1f',
+        sufijo=''
+    ),
+    'crecimiento': dict(
+        titulo_mapa='Crecimiento Semanal de Casos (%)',
+        color_scale='Oranges',
+        titulo_top='Top {n} Departamentos - Crecimiento Semanal',
+        color_bar='#e6550d',
+        size_factor=0.1,
+        titulo_barra='Crecimiento %',
+        etiqueta='Crecimiento',
+        formato=':.1f',
+        sufijo='%'
+    ),
+    'duplicacion': dict(
+        titulo_mapa='Tiempo de Duplicación de Casos (días)',
+        color_scale='Greens_r',
+        titulo_top='Top {n} Departamentos - Menor Tiempo de Duplicación',
+        color_bar='#31a354',
+        size_factor=0.2,
+        titulo_barra='Días',
+        etiqueta='Duplicación',
+        formato=':.1f',
+        sufijo=' días',
+        # Duplicar en menos días es peor: el ranking va de menor a mayor
+        ascendente=True
+    ),
+    'tasa_14d': dict(
+        titulo_mapa='Casos de los Últimos 14 Días por 100,000 hab.',
+        color_scale='Reds',
+        titulo_top='Top {n} Departamentos - Casos 14 días x 100k hab.',
+        color_bar='#d62728',
+        size_factor=0.05,
+        titulo_barra='Casos 14d x 100k',
+        etiqueta='Casos 14 días',
+        formato=':.1f',
+        sufijo=' x100k'
+    ),
+    'rt': dict(
+        titulo_mapa='Número Reproductivo Estimado (Rt)',
+        color_scale='RdBu_r',
+        titulo_top='Top {n} Departamentos - Rt Estimado',
+        color_bar='#3182bd',
+        size_factor=10,
+        titulo_barra='Rt',
+        etiqueta='Rt',
+        formato=':.2f',
+        sufijo=''
+    ),
+}
+
+def configurar_layout_mapa(fig_mapa, titulo_mapa):
+    if ESTILO_MAPA == 'local' and not ESTATICO:
+        # Fondo vacío con las teselas de la app como capa raster bajo los trazos
+        estilo = dict(style='white-bg', layers=[dict(
+            below='traces',
+            sourcetype='raster',
+            source=[app.get_relative_path('/teselas/{z}/{x}/{y}.png')],
+            sourceattribution=ATRIBUCION_OSM
+        )])
     else:
-        columna = 'incidencia'
-        titulo_mapa = 'Incidencia de COVID-19 (casos por 100,000 hab.)'
-        color_scale = 'Reds'
-        titulo_top = 'Top 10 Departamentos - Incidencia x 100k hab.'
-        color_bar = '#d62728'
-        size_factor = 0.05  # Factor diferente para incidencia
+        estilo = dict(style=ESTILO_MAPA)
+    fig_mapa.update_layout(
+        mapbox=dict(
+            center=dict(lat=4.6, lon=-74.0),
+            zoom=4.2,
+            **estilo
+        ),
+        height=500,
+        margin={"r":0,"t":40,"l":0,"b":0},
+        title=titulo_mapa,
+        # Conserva el zoom y la posición del usuario al cambiar de figura
+        uirevision='mapa'
+    )
+
+def avisar_sin_datos(fig, titulo):
+    """Título y un aviso centrado en una figura que no tiene valores que mostrar"""
+    fig.update_layout(
+        title=titulo,
+        annotations=[dict(
+            text='Sin datos para el rango seleccionado',
+            showarrow=False,
+            xref='paper', yref='paper', x=0.5, y=0.5,
+            font=dict(size=16, color='#6c757d')
+        )]
+    )
+
+def construir_figuras(tipo_visualizacion, df_datos, n_top=N_TOP, filas_top=None, regiones=None, seleccion=None):
+    """Construye la figura del mapa y la del top N para un tipo de visualización
+
+    filas_top son las posiciones del ranking ya calculadas (ver filas_top());
+    sin ellas se seleccionan sobre la columna de df_datos.
+    """
+    
+    cronometro = Cronometro()
+    
+    # Configuración según tipo de visualización
+    config = configuracion_visualizacion(tipo_visualizacion)
+    columna = config['columna']
+    color_scale = config['color_scale']
+    size_factor = config['size_factor']
+    if filas_top is None:
+        valores = df_datos[columna].to_numpy(dtype=np.float64)
+        filas_top = top_de_valores(-valores if config.get('ascendente') else valores, n_top)
+    df_top = df_datos.iloc[filas_top]
+    cronometro.fase('seleccion')
     
     # 1. MAPA COROPLÉTICO CON FORMAS DE DEPARTAMENTOS
     # Crear figura base
     fig_mapa = go.Figure()
     
-    # Agregar el mapa de fondo
-    fig_mapa.add_trace(go.Scattermapbox(
-        lat=df_datos['Latitud'],
-        lon=df_datos['Longitud'],
-        mode='markers',
-        marker=dict(
-            size=df_datos[columna] * size_factor,
-            color=df_datos[columna],
+    barra_color = dict(title=dict(text=config['titulo_barra'], side='right'))
+    
+    if geometria_departamentos is not None:
+        # Polígonos de los departamentos; el navegador descarga el GeoJSON una sola vez
+        fig_mapa.add_trace(go.Choroplethmapbox(
+            geojson=url_geometria(),
+            locations=df_datos['Departamento'],
+            z=df_datos[columna],
             colorscale=color_scale,
-            showscale=True,
-            colorbar=dict(
-                title=dict(
-                    text='Casos Totales' if tipo_visualizacion == 'casos' else 'Incidencia x 100k',
-                    side='right'
-                )
+            colorbar=barra_color,
+            marker_opacity=0.7,
+            marker_line_width=0.5,
+            marker_line_color='white',
+            customdata=df_datos['poblacion'],
+            hovertemplate=(
+                "<b>%{location}</b><br>" +
+                f"{config['etiqueta']}: %{{z{config['formato']}}}<br>" +
+                "Población: %{customdata}<br>" +
+                "<extra></extra>"
             ),
-            opacity=0.8
-        ),
-        text=df_datos['Departamento'],
-        hovertemplate=(
-            "<b>%{text}</b><br>" +
-            ("Casos: %{marker.color:,}<br>" if tipo_visualizacion == 'casos' else "Incidencia: %{marker.color:.1f}<br>") +
-            "Población: " + df_datos['poblacion'].astype(str) + "<br>" +
-            "<extra></extra>"
-        ),
-        name=''
-    ))
+            name=''
+        ))
+    else:
+        # Sin límites disponibles se dibuja una burbuja en el centroide de cada departamento
+        fig_mapa.add_trace(go.Scattermapbox(
+            lat=redondear(df_datos['Latitud']),
+            lon=redondear(df_datos['Longitud']),
+            mode='markers',
+            marker=dict(
+                size=redondear(np.clip(np.nan_to_num(df_datos[columna] * size_factor), 0, None), 1),
+                color=df_datos[columna],
+                colorscale=color_scale,
+                showscale=True,
+                colorbar=barra_color,
+                opacity=0.8
+            ),
+            text=df_datos['Departamento'],
+            customdata=df_datos['poblacion'],
+            hovertemplate=(
+                "<b>%{text}</b><br>" +
+                f"{config['etiqueta']}: %{{marker.color{config['formato']}}}<br>" +
+                "Población: %{customdata}<br>" +
+                "<extra></extra>"
+            ),
+            name=''
+        ))
     
     # Configurar el layout del mapa
-    fig_mapa.update_layout(
-        mapbox_style="open-street-map",
-        mapbox=dict(
-            center=dict(lat=4.6, lon=-74.0),
-            zoom=4.2
-        ),
-        height=500,
-        margin={"r":0,"t":40,"l":0,"b":0},
-        title=titulo_mapa
-    )
+    configurar_layout_mapa(fig_mapa, config['titulo_mapa'])
+    if not df_datos[columna].notna().any():
+        avisar_sin_datos(fig_mapa, config['titulo_mapa'])
     
-    # 2. TOP 10 DEPARTAMENTOS
-    df_top10 = df_datos.nlargest(10, columna)
+    # 2. TOP N DEPARTAMENTOS
+    if len(df_top) == 0:
+        # Sin un solo valor (por ejemplo, una métrica semanal en los primeros días) no hay barras
+        fig_top = go.Figure()
+        fig_top.update_layout(height=400, xaxis={'visible': False}, yaxis={'visible': False})
+        avisar_sin_datos(fig_top, config['titulo_top'].replace('Top {n} ', ''))
+        cronometro.fase('figuras')
+        return fig_mapa, fig_top
     
+    titulo_top = config['titulo_top'].format(n=len(df_top))
+    if regiones:
+        titulo_top += f" ({', '.join(regiones)})"
+    if seleccion:
+        titulo_top += f" - {len(seleccion)} seleccionado{'s' if len(seleccion) > 1 else ''} en el mapa"
     fig_top = px.bar(
-        df_top10,
+        df_top,
         x=columna,
         y='Departamento',
         orientation='h',
         title=titulo_top,
         color=columna,
         color_continuous_scale=color_scale,
-        height=400
+        # Cada barra conserva su alto cuando se piden más de 10
+        height=max(400, 30 * len(df_top) + 100)
     )
     
     fig_top.update_layout(
-        yaxis={'categoryorder': 'total ascending'},
+        # El primero del ranking queda arriba
+        yaxis={'categoryorder': 'total descending' if config.get('ascendente') else 'total ascending'},
         showlegend=False,
         coloraxis_showscale=False
     )
@@ -546,19 +1396,830 @@ def actualizar_dashboard(tipo_visualizacion):
         fig_top.update_xaxes(tickformat=',')
         # Actualizar hover data para casos
         fig_top.update_traces(
-            hovertemplate='<b>%{y}</b><br>Casos: %{x:,}<br>Incidencia: ' + 
-                         df_top10['incidencia'].astype(str) + ' x100k<extra></extra>'
+            customdata=df_top['incidencia'],
+            hovertemplate='<b>%{y}</b><br>Casos: %{x:,}<br>Incidencia: %{customdata} x100k<extra></extra>'
         )
     else:
-        fig_top.update_xaxes(ticksuffix=' x100k')
-        # Actualizar hover data para incidencia
+        fig_top.update_xaxes(ticksuffix=config['sufijo'])
+        # Actualizar hover data para incidencia y las métricas
         fig_top.update_traces(
-            hovertemplate='<b>%{y}</b><br>Incidencia: %{x:.1f} x100k<br>Casos: ' + 
-                         df_top10['casos'].astype(str) + '<extra></extra>'
+            customdata=df_top['casos'],
+            hovertemplate=(f"<b>%{{y}}</b><br>{config['etiqueta']}: %{{x{config['formato']}}}{config['sufijo']}"
+                           "<br>Casos: %{customdata}<extra></extra>")
         )
     
+    cronometro.fase('figuras')
     return fig_mapa, fig_top
 
+def mapa_municipal(granularidad, tipo_visualizacion, rango_fechas):
+    """Si se muestra el mapa municipal; sin él se usa el de departamentos.
+    
+    La tabla de municipios solo tiene totales, así que el nivel municipal no
+    admite rangos parciales ni métricas diarias.
+    """
+    datos = datos_actuales()
+    return (granularidad == 'municipios' and datos.rejilla_municipios is not None
+            and tipo_visualizacion in METRICAS_RANKING and datos.cubo.normalizar_rango(rango_fechas) is None)
+
+def construir_mapa_municipios(tipo_visualizacion, relayout=None):
+    """Mapa de municipios agrupados en celdas según el zoom y la vista actual del usuario"""
+    cronometro = Cronometro()
+    config = configuracion_visualizacion(tipo_visualizacion)
+    zoom, limites = limites_vista(relayout)
+    celdas = datos_actuales().rejilla_municipios.consultar(zoom, limites)
+    cronometro.fase('seleccion')
+    
+    casos = celdas['casos']
+    poblacion = celdas['poblacion']
+    if tipo_visualizacion == 'casos':
+        valores = casos
+    else:
+        valores = np.where(poblacion > 0, casos / np.maximum(poblacion, 1) * 100000, 0).round(1)
+    
+    # Área del marcador proporcional al valor, entre 6 y 30 px de diámetro
+    maximo = valores.max() if len(valores) else 0
+    tamanos = 6 + 24 * np.sqrt(valores / maximo) if maximo > 0 else np.full(len(valores), 6.0)
+    
+    fig_mapa = go.Figure(go.Scattermapbox(
+        lat=redondear(celdas['lat']),
+        lon=redondear(celdas['lon']),
+        mode='markers',
+        marker=dict(
+            size=redondear(tamanos, 1),
+            color=valores,
+            colorscale=config['color_scale'],
+            showscale=True,
+            colorbar=dict(title=dict(text=config['titulo_barra'], side='right')),
+            opacity=0.8
+        ),
+        text=celdas['nombre'],
+        customdata=np.stack([casos, poblacion], axis=1),
+        hovertemplate=(
+            "<b>%{text}</b><br>" +
+            ("Casos: %{marker.color:,}<br>" if tipo_visualizacion == 'casos' else "Incidencia: %{marker.color:.1f}<br>") +
+            ("Población: %{customdata[1]:,}<br>" if tipo_visualizacion == 'casos' else "Casos: %{customdata[0]:,}<br>") +
+            "<extra></extra>"
+        ),
+        name=''
+    ))
+    
+    configurar_layout_mapa(fig_mapa, config['titulo_mapa'].replace('Departamento', 'Municipio'))
+    cronometro.fase('figuras')
+    return fig_mapa
+
+# =============================================================================
+# CACHÉ DE FIGURAS
+# =============================================================================
+
+class CacheFiguras:
+    """Caché LRU acotada de figuras ya serializadas a JSON.
+    
+    Las claves incluyen la versión del dataset, de modo que al recargar
+    los datos las entradas anteriores dejan de coincidir y se descartan.
+    """
+    
+    def __init__(self, max_entradas=64):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+    
+    def obtener(self, clave):
+        with self._lock:
+            valor = self._entradas.get(clave)
+            if valor is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+    
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+    
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+    
+    def __len__(self):
+        return len(self._entradas)
+
+cache_figuras = CacheFiguras(int(os.environ.get('DASHBOARD_CACHE_FIGURAS', 64)))
+
+def clave_figuras(tipo_visualizacion, rango_fechas=None, n_top=N_TOP, regiones=None, seleccion=None):
+    """(tipo, rango, n_top, regiones, selección, versión); la versión va siempre al final"""
+    datos = datos_actuales()
+    return (tipo_visualizacion, datos.cubo.normalizar_rango(rango_fechas),
+            *normalizar_ranking(n_top, regiones), normalizar_seleccion(seleccion), datos.version)
+
+# Función de progreso del trabajo en segundo plano que se está ejecutando, si lo hay
+avance_figuras = contextvars.ContextVar('avance_figuras', default=None)
+PASOS_FIGURAS = 3
+
+def informar_avance(paso):
+    informar = avance_figuras.get()
+    if informar is not None:
+        informar([str(paso), str(PASOS_FIGURAS)])
+
+def obtener_figuras_serializadas(tipo_visualizacion, rango_fechas=None, n_top=N_TOP, regiones=None, seleccion=None):
+    """Devuelve las figuras serializadas a JSON, construyéndolas solo si no están en caché"""
+    clave = clave_figuras(tipo_visualizacion, rango_fechas, n_top, regiones, seleccion)
+    _, rango, n_top, regiones, seleccion, _ = clave
+    figuras = cache_figuras.obtener(clave)
+    registrar_cache(figuras is not None)
+    if figuras is None:
+        with medir_fase('seleccion'):
+            datos = datos_en_rango(rango)
+            config = configuracion_visualizacion(tipo_visualizacion)
+            columna = config['columna']
+            if columna in METRICAS_EPIDEMIOLOGICAS:
+                datos = con_metrica(datos, columna, rango)
+            filas = filas_top(columna, datos, rango, n_top, regiones, config.get('ascendente', False), seleccion)
+        informar_avance(1)
+        fig_mapa, fig_top = construir_figuras(tipo_visualizacion, datos, n_top, filas, regiones, seleccion)
+        informar_avance(2)
+        with medir_fase('serializacion'):
+            figuras = (
+                pio.to_json(fig_mapa, validate=False),
+                pio.to_json(fig_top, validate=False)
+            )
+        informar_avance(3)
+        cache_figuras.guardar(clave, figuras)
+    return figuras
+
+# =============================================================================
+# ACTUALIZACIONES PARCIALES
+# =============================================================================
+
+# Marca de una propiedad que existe en la figura anterior y no en la nueva
+BORRAR = object()
+
+def diferencias_figura(anterior, nueva, ruta=()):
+    """Operaciones (ruta, valor) que convierten la figura anterior en la nueva.
+    
+    Se recorren los diccionarios y las listas de trazas; cualquier otro valor
+    distinto (arreglos de datos, textos) se reemplaza completo.
+    """
+    if isinstance(anterior, dict) and isinstance(nueva, dict):
+        operaciones = [(ruta + (clave,), BORRAR) for clave in anterior if clave not in nueva]
+        for clave, valor in nueva.items():
+            if clave in anterior:
+                operaciones.extend(diferencias_figura(anterior[clave], valor, ruta + (clave,)))
+            else:
+                operaciones.append((ruta + (clave,), valor))
+        return operaciones
+    
+    es_lista_de_trazas = (
+        isinstance(anterior, list) and isinstance(nueva, list) and len(anterior) == len(nueva) and
+        all(isinstance(e, dict) for e in anterior) and all(isinstance(e, dict) for e in nueva)
+    )
+    if es_lista_de_trazas:
+        operaciones = []
+        for i, (traza_anterior, traza_nueva) in enumerate(zip(anterior, nueva)):
+            operaciones.extend(diferencias_figura(traza_anterior, traza_nueva, ruta + (i,)))
+        return operaciones
+    
+    return [] if anterior == nueva else [(ruta, nueva)]
+
+def crear_patch(operaciones):
+    patch = dash.Patch()
+    for ruta, valor in operaciones:
+        destino = patch
+        for paso in ruta[:-1]:
+            destino = destino[paso]
+        if valor is BORRAR:
+            del destino[ruta[-1]]
+        else:
+            destino[ruta[-1]] = valor
+    return patch
+
+def figuras_o_diferencias(clave_anterior, clave_nueva):
+    """Para cada figura, la figura completa o las operaciones desde la que ya tiene el navegador.
+    
+    Solo hay diferencias si las figuras anteriores siguen en caché; si no,
+    se envían completas.
+    """
+    nuevas = obtener_figuras_serializadas(*clave_nueva[:-1])
+    if clave_anterior is None or clave_anterior[-1] != clave_nueva[-1]:
+        return [('completa', cargar_json(texto)) for texto in nuevas]
+    
+    clave_diferencias = ('diferencias', clave_anterior, clave_nueva)
+    diferencias = cache_figuras.obtener(clave_diferencias)
+    if diferencias is None:
+        anteriores = cache_figuras.obtener(clave_anterior)
+        if anteriores is None:
+            return [('completa', cargar_json(texto)) for texto in nuevas]
+        diferencias = [
+            diferencias_figura(cargar_json(anterior), cargar_json(nueva))
+            for anterior, nueva in zip(anteriores, nuevas)
+        ]
+        cache_figuras.guardar(clave_diferencias, diferencias)
+    return [('diferencias', operaciones) for operaciones in diferencias]
+
+def como_salida(figura):
+    tipo, contenido = figura
+    return crear_patch(contenido) if tipo == 'diferencias' else contenido
+
+def precalentar_cache():
+    """Construye las figuras de todos los valores del selector para el rango completo"""
+    for opcion in opciones_visualizacion():
+        obtener_figuras_serializadas(opcion['value'])
+
+def precalentar_datos(datos):
+    """Precalienta la caché con unos datos fijos, aunque mientras tanto se publiquen otros"""
+    token = _datos_fijados.set(datos)
+    try:
+        precalentar_cache()
+    finally:
+        _datos_fijados.reset(token)
+
+# =============================================================================
+# EXPORTACIÓN ESTÁTICA
+# =============================================================================
+
+# Con el rango completo, el nivel departamental y sin selección en el mapa, el
+# resultado del callback principal solo depende del tipo, la cantidad del
+# ranking y las regiones: unos miles de estados que exportar.py genera una vez
+# por versión de los datos. El navegador arma el mismo nombre de archivo (ver
+# el callback del navegador en modo estático) y pide al servidor lo que no
+# encuentra.
+
+def nombre_estado_exportado(tipo_visualizacion, n_top, regiones):
+    """Archivo del estado; las regiones van como máscara de bits sobre REGIONES"""
+    mascara = sum(1 << REGIONES.index(region) for region in regiones or ())
+    return f'{tipo_visualizacion}-n{n_top}-r{mascara}.json'
+
+def estados_exportables():
+    """(tipo, n_top, regiones) de cada estado del rango completo a nivel departamental"""
+    combinaciones = [None] + [
+        tuple(r for i, r in enumerate(REGIONES) if mascara & (1 << i))
+        for mascara in range(1, (1 << len(REGIONES)) - 1)
+    ]
+    return [
+        (opcion['value'], n_top, regiones)
+        for opcion in opciones_visualizacion()
+        for n_top in cantidades_ranking()
+        for regiones in combinaciones
+    ]
+
+def renderizar_estado(tipo_visualizacion, n_top, regiones):
+    """JSON con las figuras, el estado de las figuras y los KPIs de un estado exportable"""
+    clave = clave_figuras(tipo_visualizacion, None, n_top, regiones)
+    mapa, top = obtener_figuras_serializadas(*clave[:-1])
+    _, _, n_top, regiones, _, _ = clave
+    kpis, texto = actualizar_kpis(None, regiones)
+    resto = pio.json.to_json_plotly({
+        'estado': {'clave': list(clave), 'granularidad': 'departamentos'},
+        'kpis': kpis,
+        'texto': texto
+    })
+    # Las figuras ya están serializadas: se insertan sin volver a convertirlas
+    return '{"mapa":' + mapa + ',"top":' + top + ',' + resto[1:]
+
+# =============================================================================
+# DATOS DEL PROCESO
+# =============================================================================
+
+class DatosProceso:
+    """Tabla, cubo, versión y todo lo que se deriva de ellos, para una versión de los datos.
+
+    Se construye completo antes de publicarse y se publica con una sola
+    asignación; después solo cambian las métricas, que se calculan la primera
+    vez que se piden. Así una petición nunca mezcla la tabla de una versión con
+    el cubo o los índices de otra.
+    """
+
+    def __init__(self, df, cubo, version, rejilla_municipios=None, anterior=None):
+        self.df = df
+        self.cubo = cubo
+        self.version = version
+        self.rejilla_municipios = rejilla_municipios
+        # Con los datos de la versión anterior el ranking y los KPIs por región se
+        # actualizan con lo que cambió; los de cada departamento usan el cubo tal cual
+        indice = agregados = None
+        if anterior is not None:
+            indice = actualizar_indice_ranking(anterior.indice_ranking, anterior.df, df)
+            agregados = actualizar_agregados_kpis(anterior.agregados_kpis, anterior, df, cubo)
+        self.indice_ranking = indice if indice is not None else crear_indice_ranking(df)
+        self.agregados_kpis = agregados if agregados is not None else crear_agregados_kpis(df, cubo)
+        self.agregados_departamentos = crear_agregados_departamentos(df, cubo)
+        (self.indice_departamentos, self.indice_municipios, self.indice_poligonos,
+         self.departamento_municipios) = crear_indices_espaciales(df, rejilla_municipios)
+        self.metricas = None
+
+def aplicar_datos(df, cubo, version, precalentar_en_hilo=False):
+    """Publica los datos de una versión, invalida la caché de figuras y la precalienta.
+
+    Con `precalentar_en_hilo` el precalentado corre aparte y la petición que
+    encontró la versión nueva no lo espera.
+    """
+    global datos_proceso
+    with registro_arranque.medir('municipios'):
+        rejilla_municipios = cargar_rejilla_municipios()
+    with registro_arranque.medir('indices'):
+        datos = DatosProceso(df, cubo, version, rejilla_municipios, anterior=datos_proceso)
+    datos_proceso = datos
+    if gestor_segundo_plano is not None:
+        gestor_segundo_plano.reiniciar()
+    cache_figuras.limpiar()
+    if precalentar_en_hilo:
+        threading.Thread(target=precalentar_datos, args=(datos,), name='precalentado', daemon=True).start()
+        return
+    with registro_arranque.medir('precalentado'):
+        precalentar_datos(datos)
+
+def recargar_datos():
+    """Reconstruye los datos desde las fuentes y, con snapshots, los publica para los demás workers"""
+    df, cubo, version = construir_datos()
+    if DIRECTORIO_SNAPSHOTS:
+        with bloqueo(DIRECTORIO_SNAPSHOTS):
+            publicar_snapshot(DIRECTORIO_SNAPSHOTS, version, *datos_a_snapshot(df, cubo))
+            limpiar_snapshots(DIRECTORIO_SNAPSHOTS)
+        df, cubo, version = datos_desde_snapshot(*abrir_snapshot(DIRECTORIO_SNAPSHOTS, version))
+    aplicar_datos(df, cubo, version)
+
+_lock_snapshot = threading.Lock()
+_ultima_revision = time.monotonic()
+
+@server.before_request
+def revisar_snapshot():
+    """Cambia a la versión publicada más reciente entre peticiones, sin reiniciar el worker"""
+    global _ultima_revision
+    if not DIRECTORIO_SNAPSHOTS or not datos_listos.is_set():
+        return
+    if time.monotonic() - _ultima_revision < INTERVALO_REVISION:
+        return
+    # Si otra petición ya está revisando, esta sigue con los datos publicados
+    if not _lock_snapshot.acquire(blocking=False):
+        return
+    try:
+        _ultima_revision = time.monotonic()
+        version = version_publicada(DIRECTORIO_SNAPSHOTS)
+        if version is not None and version != datos_proceso.version:
+            datos = datos_desde_snapshot(*abrir_snapshot(DIRECTORIO_SNAPSHOTS, version))
+            aplicar_datos(*datos, precalentar_en_hilo=True)
+    finally:
+        _lock_snapshot.release()
+
+def clave_desde_estado(estado):
+    """Clave de las figuras que muestra el navegador, o None si no se conoce"""
+    if not estado or len(estado.get('clave') or ()) != 6:
+        return None
+    tipo, rango, n_top, regiones, seleccion, version = estado['clave']
+    return (tipo, tuple(rango) if rango else None, n_top, tuple(regiones) if regiones else None,
+            tuple(seleccion) if seleccion else None, version)
+
+def actualizar_dashboard(tipo_visualizacion, rango_fechas=None, n_top=N_TOP, regiones=None,
+                         granularidad='departamentos', vista=None, seleccion=None, estado=None,
+                         relayout=None, disparador=None):
+    # 'vista' solo avisa de que el usuario movió el mapa municipal; la vista es 'relayout'
+    disparador = disparador or dash.callback_context.triggered_id
+    municipal = mapa_municipal(granularidad, tipo_visualizacion, rango_fechas)
+    
+    # Mover el mapa solo cambia la vista en el nivel municipal, y ahí no afecta al ranking
+    if disparador == 'vista-municipal':
+        if not municipal:
+            return dash.no_update, dash.no_update, dash.no_update
+        return construir_mapa_municipios(tipo_visualizacion, relayout), dash.no_update, dash.no_update
+    
+    # Con el estado del navegador se envían solo las propiedades que cambian
+    clave = clave_figuras(tipo_visualizacion, rango_fechas, n_top, regiones, seleccion)
+    mapa, top = figuras_o_diferencias(clave_desde_estado(estado), clave)
+    if estado is None or estado.get('granularidad') != 'departamentos':
+        mapa = ('completa', cargar_json(obtener_figuras_serializadas(*clave[:-1])[0]))
+    
+    if disparador == 'seleccion-mapa':
+        # El mapa no depende de la selección; reenviarlo borraría el lazo del usuario
+        salida_mapa = dash.no_update
+    elif municipal:
+        salida_mapa = construir_mapa_municipios(tipo_visualizacion, relayout)
+    else:
+        salida_mapa = como_salida(mapa)
+    nuevo_estado = {'clave': list(clave), 'granularidad': 'municipios' if municipal else 'departamentos'}
+    return salida_mapa, como_salida(top), nuevo_estado
+
+def actualizar_dashboard_segundo_plano(informar, *entradas):
+    """actualizar_dashboard dentro de un proceso del pool, informando el avance"""
+    token = avance_figuras.set(informar)
+    try:
+        return actualizar_dashboard(*entradas)
+    finally:
+        avance_figuras.reset(token)
+
+def actualizar_kpis(rango_fechas, regiones=None, seleccion=None):
+    rango = datos_actuales().cubo.normalizar_rango(rango_fechas)
+    totales = totales_kpis(rango, normalizar_regiones(regiones), normalizar_seleccion(seleccion))
+    return crear_kpis(totales), describir_rango(rango)
+
+def actualizar_desde_peticion(peticion, estado=None):
+    """Estado que no está en la exportación estática: figuras y KPIs calculados en el servidor"""
+    if not peticion:
+        raise dash.exceptions.PreventUpdate
+    entradas = peticion['entradas']
+    disparador = peticion.get('disparador')
+    mapa, top, nuevo_estado = actualizar_dashboard(*entradas, estado=estado, relayout=peticion.get('relayout'),
+                                                   disparador=disparador)
+    if disparador == 'vista-municipal':
+        return mapa, top, nuevo_estado, dash.no_update, dash.no_update
+    return (mapa, top, nuevo_estado, *actualizar_kpis(entradas[1], entradas[3], entradas[6]))
+
+def actualizar_desde_peticion_segundo_plano(informar, peticion, estado=None):
+    token = avance_figuras.set(informar)
+    try:
+        return actualizar_desde_peticion(peticion, estado)
+    finally:
+        avance_figuras.reset(token)
+
+# Pool de procesos y almacén en disco de los callbacks en segundo plano; la
+# versión de los datos forma parte de la clave de cada resultado
+gestor_segundo_plano = GestorSegundoPlano(
+    DIRECTORIO_SEGUNDO_PLANO,
+    procesos=PROCESOS_SEGUNDO_PLANO,
+    cache_by=[lambda: datos_actuales().version]
+) if SEGUNDO_PLANO else None
+
+@app.callback(
+    Output('seleccion-mapa', 'data'),
+    [Input('mapa-coropletico', 'clickData'),
+     Input('mapa-coropletico', 'selectedData')],
+    [State('granularidad', 'value'),
+     State('tipo-visualizacion', 'value'),
+     State('rango-fechas', 'value')],
+    prevent_initial_call=True
+)
+@instrumentar
+def actualizar_seleccion(click, seleccion, granularidad, tipo_visualizacion, rango_fechas):
+    # Ambas entradas son del mapa: la propiedad disparada distingue el clic del lazo
+    es_clic = dash.callback_context.triggered[0]['prop_id'].endswith('.clickData')
+    municipal = mapa_municipal(granularidad, tipo_visualizacion, rango_fechas)
+    seleccionados = resolver_seleccion(click, seleccion, municipal, es_clic)
+    return list(seleccionados) if seleccionados else None
+
+salidas_kpis = [
+    Output('contenedor-kpis', 'children'),
+    Output('texto-rango', 'children')
+]
+if not ESTATICO:
+    # En modo estático los KPIs llegan con las figuras de cada estado
+    app.callback(
+        salidas_kpis,
+        [Input('rango-fechas', 'value'),
+         Input('regiones', 'value'),
+         Input('seleccion-mapa', 'data')],
+        prevent_initial_call=True
+    )(instrumentar(actualizar_kpis))
+
+if MODO_CLIENTE:
+    # El servidor solo interviene al cambiar el rango de fechas o el ranking
+    @app.callback(
+        Output('figuras-precalculadas', 'data'),
+        [Input('rango-fechas', 'value'),
+         Input('n-top', 'value'),
+         Input('regiones', 'value'),
+         Input('seleccion-mapa', 'data')],
+        prevent_initial_call=True
+    )
+    @instrumentar
+    def actualizar_almacen_figuras(rango_fechas, n_top, regiones, seleccion):
+        return figuras_por_tipo(rango_fechas, n_top, regiones, seleccion)
+    
+    # El navegador elige entre las figuras ya enviadas en 'figuras-precalculadas'
+    app.clientside_callback(
+        """
+        function(tipo, figuras) {
+            if (!figuras || !figuras[tipo]) {
+                return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+            }
+            return [figuras[tipo].mapa, figuras[tipo].top];
+        }
+        """,
+        [Output('mapa-coropletico', 'figure'),
+         Output('top-departamentos', 'figure')],
+        [Input('tipo-visualizacion', 'value'),
+         Input('figuras-precalculadas', 'data')]
+    )
+else:
+    salidas_dashboard = [
+        Output('mapa-coropletico', 'figure'),
+        Output('top-departamentos', 'figure'),
+        Output('estado-figuras', 'data')
+    ]
+    entradas_dashboard = [
+        Input('tipo-visualizacion', 'value'),
+        Input('rango-fechas', 'value'),
+        Input('n-top', 'value'),
+        Input('regiones', 'value'),
+        Input('granularidad', 'value'),
+        Input('vista-municipal', 'data'),
+        Input('seleccion-mapa', 'data')
+    ]
+    estados_dashboard = [
+        State('estado-figuras', 'data'),
+        State('mapa-coropletico', 'relayoutData')
+    ]
+    if os.path.exists(RUTA_MUNICIPIOS):
+        # Mover el mapa solo llega al servidor en el nivel municipal; en el de
+        # departamentos la vista no cambia las figuras
+        app.clientside_callback(
+            """
+            function(relayout, granularidad) {
+                if (granularidad !== 'municipios' || !relayout) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                return Date.now();
+            }
+            """,
+            Output('vista-municipal', 'data'),
+            [Input('mapa-coropletico', 'relayoutData')],
+            [State('granularidad', 'value')],
+            prevent_initial_call=True
+        )
+        
+        # Ni los rangos parciales ni las métricas diarias existen por municipio
+        app.clientside_callback(
+            """
+            function(tipo, rango, ultimo, opciones) {
+                var parcial = rango && (rango[0] > 0 || rango[1] < ultimo);
+                var totales = tipo === 'casos' || tipo === 'incidencia';
+                return opciones.map(function(opcion) {
+                    if (opcion.value !== 'municipios') {
+                        return opcion;
+                    }
+                    return Object.assign({}, opcion, {disabled: parcial || !totales});
+                });
+            }
+            """,
+            Output('granularidad', 'options'),
+            [Input('tipo-visualizacion', 'value'),
+             Input('rango-fechas', 'value')],
+            [State('rango-fechas', 'max'),
+             State('granularidad', 'options')]
+        )
+    
+    # Al cambiar una entrada con un trabajo en curso, Dash termina el anterior
+    opciones_segundo_plano = dict(
+        background=True,
+        manager=gestor_segundo_plano,
+        interval=INTERVALO_SEGUNDO_PLANO,
+        progress=[Output('progreso-figuras', 'value'), Output('progreso-figuras', 'max')],
+        running=[(Output('progreso-figuras', 'style'),
+                  {'width': '100%', 'visibility': 'visible'},
+                  {'width': '100%', 'visibility': 'hidden'})]
+    )
+    if ESTATICO:
+        # El navegador busca el estado en la exportación; si no es exportable o
+        # no está publicado, deja sus entradas en 'peticion-servidor'
+        app.clientside_callback(
+            """
+            async function(tipo, rango, nTop, regiones, granularidad, vista, seleccion, exportacion, relayout) {
+                var dc = window.dash_clientside;
+                var disparador = dc.callback_context.triggered_id || null;
+                var entradas = [tipo, rango, nTop, regiones, granularidad, vista, seleccion];
+                var alServidor = [dc.no_update, dc.no_update, dc.no_update, dc.no_update, dc.no_update,
+                                  {entradas: entradas, disparador: disparador, relayout: relayout}];
+                
+                // La vista solo cambia en el nivel municipal, que nunca está exportado
+                if (disparador === 'vista-municipal') {
+                    return alServidor;
+                }
+                var rangoCompleto = !rango || (rango[0] <= 0 && rango[1] >= exportacion.ultimo_dia);
+                var conSeleccion = seleccion && seleccion.length > 0;
+                if (granularidad === 'municipios' || !rangoCompleto || conSeleccion) {
+                    return alServidor;
+                }
+                
+                // Mismo nombre que nombre_estado_exportado() con los valores normalizados
+                var mascara = 0;
+                exportacion.regiones.forEach(function(region, i) {
+                    if ((regiones || []).indexOf(region) >= 0) {
+                        mascara |= 1 << i;
+                    }
+                });
+                if (mascara === (1 << exportacion.regiones.length) - 1) {
+                    mascara = 0;
+                }
+                var n = Math.min(Math.max(parseInt(nTop || exportacion.n_top, 10), 1), exportacion.total);
+                var url = exportacion.url + exportacion.version + '/' + tipo + '-n' + n + '-r' + mascara + '.json';
+                try {
+                    var respuesta = await fetch(url);
+                    if (!respuesta.ok) {
+                        return alServidor;
+                    }
+                    var estado = await respuesta.json();
+                    return [estado.mapa, estado.top, estado.estado, estado.kpis, estado.texto, dc.no_update];
+                } catch (error) {
+                    return alServidor;
+                }
+            }
+            """,
+            salidas_dashboard + salidas_kpis + [Output('peticion-servidor', 'data')],
+            entradas_dashboard,
+            [State('exportacion', 'data'), State('mapa-coropletico', 'relayoutData')]
+        )
+        salidas_servidor = [
+            Output(salida.component_id, salida.component_property, allow_duplicate=True)
+            for salida in salidas_dashboard + salidas_kpis
+        ]
+        if SEGUNDO_PLANO:
+            app.callback(
+                salidas_servidor, [Input('peticion-servidor', 'data')], [State('estado-figuras', 'data')],
+                prevent_initial_call=True, **opciones_segundo_plano
+            )(instrumentar_trabajo(actualizar_desde_peticion_segundo_plano))
+        else:
+            app.callback(
+                salidas_servidor, [Input('peticion-servidor', 'data')], [State('estado-figuras', 'data')],
+                prevent_initial_call=True
+            )(instrumentar(actualizar_desde_peticion))
+    elif SEGUNDO_PLANO:
+        app.callback(
+            salidas_dashboard, entradas_dashboard, estados_dashboard,
+            **opciones_segundo_plano
+        )(instrumentar_trabajo(actualizar_dashboard_segundo_plano))
+    else:
+        app.callback(
+            salidas_dashboard, entradas_dashboard, estados_dashboard
+        )(instrumentar(actualizar_dashboard))
+
+# =============================================================================
+# ARRANQUE
+# =============================================================================
+
+# Se activa cuando los datos están cargados (o su carga falló)
+datos_listos = threading.Event()
+error_carga = None
+
+# Peticiones que no pueden responderse sin datos
+RUTAS_CON_DATOS = ('_dash-layout', '_dash-update-component')
+
+def inicializar_datos():
+    """Carga los datos, la geometría y los municipios, y precalienta la caché de figuras"""
+    global geometria_departamentos
+    try:
+        with registro_arranque.medir('datos'):
+            df, cubo, version = cargar_datos()
+        with registro_arranque.medir('geometria'):
+            geometria_departamentos = cargar_geometria(df['Departamento'].tolist())
+        aplicar_datos(df, cubo, version)
+    finally:
+        datos_listos.set()
+        registro_arranque.marcar('listo')
+
+def cargar_en_segundo_plano():
+    global error_carga
+    try:
+        inicializar_datos()
+    except Exception as error:
+        error_carga = error
+        traceback.print_exc(file=sys.stderr)
+
+def esperar_datos(timeout=None):
+    """Espera a que termine la carga inicial; False si se agotó el tiempo"""
+    return datos_listos.wait(timeout)
+
+@server.before_request
+def esperar_datos_peticion():
+    if datos_listos.is_set() and error_carga is None:
+        return
+    if not request.path.endswith(RUTAS_CON_DATOS) and '/geometria/' not in request.path:
+        return
+    if not esperar_datos(ESPERA_DATOS):
+        respuesta = Response("Cargando datos, intente de nuevo\n", status=503, mimetype='text/plain')
+        respuesta.headers['Retry-After'] = '2'
+        return respuesta
+    if error_carga is not None:
+        return Response(f"Error al cargar los datos: {error_carga}\n", status=503, mimetype='text/plain')
+
+if ARRANQUE_DIFERIDO:
+    # Sin --preload (ver gunicorn.conf.py) cada worker carga sus datos en este hilo
+    threading.Thread(target=cargar_en_segundo_plano, name='carga-datos', daemon=True).start()
+    # Dash construiría el layout al asignarlo para validar los IDs de los
+    # callbacks, y todavía no hay datos con qué construirlo
+    app.config.suppress_callback_exceptions = True
+else:
+    inicializar_datos()
+
+# El layout se construye en la primera carga de la página y se guarda por versión
+app.layout = servir_layout
+
+# =============================================================================
+# MÉTRICAS
+# =============================================================================
+
+# Histogramas por callback y fase en /metrics; con DASHBOARD_PERFIL_MUESTREO > 0
+# se perfila esa fracción de callbacks y se guardan los más lentos que el umbral
+# (los callbacks en segundo plano se miden en el pool; ver instrumentar_trabajo)
+instalar_metricas(
+    server,
+    directorio_perfiles=os.environ.get('DASHBOARD_PERFILES', 'perfiles'),
+    umbral_perfil=float(os.environ.get('DASHBOARD_PERFIL_UMBRAL', 0.5)),
+    muestreo_perfil=float(os.environ.get('DASHBOARD_PERFIL_MUESTREO', 0))
+)
+
+# Duración de cada fase del arranque del worker en /arranque
+instalar_arranque(server, registro_arranque)
+registro_arranque.marcar('importado')
+
+def reporte_memoria():
+    """Bytes de cada estructura de datos del worker y su memoria residente"""
+    datos = datos_actuales()
+    vistos = set()
+    estructuras = {
+        'departamentos': memoria(datos.df, vistos),
+        'cubo_casos': memoria(datos.cubo, vistos),
+        'agregados_kpis': memoria([datos.agregados_kpis, datos.agregados_departamentos], vistos),
+        'metricas_epidemiologicas': memoria(datos.metricas, vistos),
+        'municipios': memoria(datos.rejilla_municipios, vistos),
+        'indice_ranking': memoria(datos.indice_ranking, vistos),
+    }
+    return {
+        'pid': os.getpid(),
+        'version': datos.version,
+        'estructuras': estructuras,
+        'total_estructuras': sum(estructuras.values()),
+        **memoria_residente(),
+    }
+
+# Huella en memoria de los datos del worker en /memoria
+@server.route('/memoria')
+def servir_memoria():
+    return Response(json.dumps(reporte_memoria()), mimetype='application/json')
+
+# =============================================================================
+# CACHÉ HTTP
+# =============================================================================
+
+# El layout y las dependencias solo cambian con los datos, el código o la
+# configuración. Llevan un ETag débil con la versión de los datos y un GET que
+# ya lo tiene recibe 304 antes de ejecutar nada. Los callbacks son POST y el
+# renderer de Dash nunca los revalida, así que no llevan ETag; la geometría y
+# las teselas revalidan en sus propias rutas.
+RUTAS_CACHE_HTTP = ('_dash-layout', '_dash-dependencies')
+
+_huella_aplicacion = None
+
+def huella_aplicacion():
+    """Huella del código de la app y de las variables DASHBOARD_*, la misma en todos los workers"""
+    global _huella_aplicacion
+    if _huella_aplicacion is None:
+        huella = hashlib.sha1(dash.__version__.encode('utf-8'))
+        directorio = os.path.dirname(os.path.abspath(__file__))
+        for nombre in sorted(os.listdir(directorio)):
+            if nombre.endswith('.py'):
+                with open(os.path.join(directorio, nombre), 'rb') as archivo:
+                    huella.update(archivo.read())
+        for variable in sorted(os.environ):
+            if variable.startswith('DASHBOARD_'):
+                huella.update(f'{variable}={os.environ[variable]}'.encode('utf-8'))
+        _huella_aplicacion = huella.hexdigest()
+    return _huella_aplicacion
+
+def etiqueta_http():
+    """ETag de la petición actual, o None si su respuesta no se puede revalidar"""
+    # Las consultas de los callbacks en segundo plano llevan el trabajo en la URL
+    # y su respuesta cambia con el progreso
+    if (not CACHE_HTTP or request.args
+            or request.method not in ('GET', 'HEAD')
+            or not request.path.endswith(RUTAS_CACHE_HTTP)):
+        return None
+    datos = datos_actuales()
+    if datos is None:
+        return None
+    huella = hashlib.sha1(huella_aplicacion().encode('utf-8'))
+    huella.update(request.path.encode('utf-8'))
+    if geometria_departamentos is not None:
+        huella.update(geometria_departamentos.version.encode('utf-8'))
+    return f'{datos.version}-{huella.hexdigest()[:16]}'
+
+def encabezados_cache(respuesta, etiqueta):
+    respuesta.set_etag(etiqueta, weak=True)
+    respuesta.headers['Cache-Control'] = (
+        f'public, max-age={SEGUNDOS_CACHE_HTTP}' if SEGUNDOS_CACHE_HTTP > 0 else 'no-cache'
+    )
+    return respuesta
+
+# Se registra después de esperar los datos y revisar el snapshot, así la versión ya es la vigente
+@server.before_request
+def responder_no_modificado():
+    etiqueta = etiqueta_http()
+    if etiqueta is None:
+        return
+    g.etiqueta_http = etiqueta
+    if request.if_none_match.contains_weak(etiqueta):
+        return encabezados_cache(Response(status=304), etiqueta)
+
+@server.after_request
+def agregar_etiqueta(respuesta):
+    etiqueta = g.pop('etiqueta_http', None)
+    # Sin ETag en los errores ni en los 204 de los callbacks que no actualizan nada
+    if etiqueta is not None and respuesta.status_code == 200:
+        encabezados_cache(respuesta, etiqueta)
+    return respuesta
+
 # =============================================================================
 # EJECUCIÓN
 # =============================================================================
@@ -0,0 +1,115 @@
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from flask import Response
+
+# =============================================================================
+# IMPORTACIONES DIFERIDAS
+# =============================================================================
+
+class ModuloDiferido:
+    """Módulo que se importa la primera vez que se usa uno de sus atributos.
+
+    Permite declarar pandas o numpy al inicio de un archivo sin pagar su
+    importación hasta que una función los necesita de verdad.
+    """
+
+    def __init__(self, nombre):
+        self._nombre = nombre
+
+    def __getattr__(self, atributo):
+        valor = getattr(importlib.import_module(self._nombre), atributo)
+        # Los accesos siguientes encuentran el atributo sin pasar por aquí
+        setattr(self, atributo, valor)
+        return valor
+
+    def __repr__(self):
+        return f"<módulo diferido {self._nombre}>"
+
+# =============================================================================
+# TIEMPOS DE ARRANQUE
+# =============================================================================
+
+class RegistroArranque:
+    """Duración de cada fase del arranque de un worker y momento de cada hito.
+
+    Los tiempos se cuentan desde `inicio`. Solo se guarda la primera vez de
+    cada fase: las recargas de datos posteriores no son parte del arranque.
+    Cuando se alcanzan todos los hitos finales se imprime el reporte una vez.
+    """
+
+    def __init__(self, inicio=None, hitos_finales=()):
+        self.inicio = time.perf_counter() if inicio is None else inicio
+        self.hitos_finales = tuple(hitos_finales)
+        self.fases = {}
+        self.hitos = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, fase, desde, hasta=None):
+        hasta = time.perf_counter() if hasta is None else hasta
+        with self._lock:
+            self.fases.setdefault(fase, {
+                'desde': round(desde - self.inicio, 4),
+                'segundos': round(hasta - desde, 4),
+            })
+
+    @contextmanager
+    def medir(self, fase):
+        desde = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(fase, desde)
+
+    def marcar(self, hito):
+        with self._lock:
+            if hito in self.hitos:
+                return
+            self.hitos[hito] = round(time.perf_counter() - self.inicio, 4)
+            completo = self.hitos_finales and all(h in self.hitos for h in self.hitos_finales)
+        if completo and hito in self.hitos_finales:
+            self.imprimir()
+
+    def reporte(self):
+        with self._lock:
+            return {'pid': os.getpid(), 'fases': dict(self.fases), 'hitos': dict(self.hitos)}
+
+    def imprimir(self, archivo=None):
+        reporte = self.reporte()
+        fases = ', '.join(f"{fase} {datos['segundos']:.3f} s" for fase, datos in reporte['fases'].items())
+        hitos = ', '.join(f"{hito} a los {segundos:.3f} s" for hito, segundos in reporte['hitos'].items())
+        print(f"Arranque (pid {reporte['pid']}): {fases}; {hitos}", file=archivo or sys.stderr, flush=True)
+
+# =============================================================================
+# POOLS DE PROCESOS
+# =============================================================================
+
+def pool_procesos(procesos, initializer=None, initargs=(), heredar=True):
+    """ProcessPoolExecutor cuyos procesos se crean con fork si la plataforma lo permite.
+
+    Con `heredar` los procesos usan lo que el padre ya tiene en memoria (la app
+    con sus datos, el estado global del módulo) y sin fork no hay alternativa:
+    se lanza RuntimeError. Sin `heredar` todo lo que necesitan llega por
+    `initializer` e `initargs`, y sirve cualquier método de inicio.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        contexto = multiprocessing.get_context('fork')
+    elif heredar:
+        raise RuntimeError("Los procesos del pool necesitan heredar la memoria del padre con fork, "
+                           "y esta plataforma no lo admite")
+    else:
+        contexto = None
+    return ProcessPoolExecutor(procesos, mp_context=contexto, initializer=initializer, initargs=initargs)
+
+def instalar(server, registro, ruta='/arranque'):
+    """Expone el reporte de arranque del worker como JSON"""
+    @server.route(ruta)
+    def reporte_arranque():
+        return Response(json.dumps(registro.reporte(), ensure_ascii=False), mimetype='application/json')
@@ -0,0 +1,407 @@
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+# Brotli es opcional: sin él la prueba de carga pide solo gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import app
+from compacto import memoria
+from departamentos import NOMBRES_DEPARTAMENTOS
+from ingesta import compactar_diarios
+
+# =============================================================================
+# DATOS SINTÉTICOS
+# =============================================================================
+
+# Tamaños de tabla para los micro-benchmarks
+TAMANOS = {
+    'departamentos': 33,
+    'municipios': 1100,
+    'casos': 2000000,
+}
+
+# Por encima de este tamaño no se miden las figuras: el mapa nunca envía millones de puntos
+MAX_FILAS_FIGURAS = 100000
+
+def generar_tabla(filas, semilla=0):
+    """Tabla con las columnas de df_datos y centroides dentro de Colombia"""
+    rng = np.random.default_rng(semilla)
+    casos = rng.integers(0, 70000, filas)
+    poblacion = rng.integers(1000, 8000000, filas)
+    return pd.DataFrame({
+        'Departamento': [f"Región {i}" for i in range(filas)],
+        'Latitud': rng.uniform(-4.2, 12.5, filas),
+        'Longitud': rng.uniform(-79.0, -67.0, filas),
+        'casos': casos,
+        'poblacion': poblacion,
+        'incidencia': app.calcular_incidencia(pd.Series(casos), pd.Series(poblacion)),
+        **{metrica: rng.uniform(0, 100, filas).round(1) for metrica in app.METRICAS_EPIDEMIOLOGICAS}
+    })
+
+def generar_diarios(filas, semilla=0):
+    """Casos diarios (Departamento, fecha, casos) con los nombres reales de los departamentos"""
+    rng = np.random.default_rng(semilla)
+    departamentos = np.array(NOMBRES_DEPARTAMENTOS, dtype=object)
+    fechas = pd.date_range('2020-03-06', periods=700, freq='D')
+    return pd.DataFrame({
+        'Departamento': departamentos[rng.integers(0, len(departamentos), filas)],
+        'fecha': fechas[rng.integers(0, len(fechas), filas)],
+        'casos': rng.integers(0, 50, filas)
+    })
+
+# =============================================================================
+# MICRO-BENCHMARKS
+# =============================================================================
+
+def medir(funcion, repeticiones=20, presupuesto=2.0):
+    """Ejecuta la función hasta completar las repeticiones o agotar el presupuesto en segundos"""
+    tiempos = []
+    inicio = time.perf_counter()
+    while len(tiempos) < repeticiones:
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+        if time.perf_counter() - inicio > presupuesto and len(tiempos) >= 3:
+            break
+    tiempos.sort()
+    return {
+        'repeticiones': len(tiempos),
+        'min_ms': round(tiempos[0], 3),
+        'mediana_ms': round(statistics.median(tiempos), 3),
+        'p95_ms': round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 3),
+    }
+
+def micro_benchmarks(tamanos, repeticiones, presupuesto):
+    resultados = []
+    datos_app = app.datos_actuales()
+
+    def registrar(nombre, tamano, funcion, **extra):
+        resultado = dict(nombre=nombre, tamano=tamano, **medir(funcion, repeticiones, presupuesto), **extra)
+        resultados.append(resultado)
+        print(f"  {nombre:<32} {tamano:<14} mediana {resultado['mediana_ms']:>10.3f} ms"
+              f"  p95 {resultado['p95_ms']:>10.3f} ms")
+
+    for tamano, filas in tamanos.items():
+        df = datos_app.df if tamano == 'departamentos' else generar_tabla(filas)
+        diarios = None if tamano == 'departamentos' else generar_diarios(filas)
+
+        registrar('cargar_datos_actualizados', tamano, lambda: app.cargar_datos_actualizados(diarios))
+        registrar('crear_kpis', tamano, lambda: app.crear_kpis(app.calcular_totales(df)))
+
+        if diarios is not None:
+            # Huella en memoria de los casos diarios con los tipos por omisión y compactos
+            registrar('compactar_diarios', tamano, lambda: compactar_diarios(diarios),
+                      bytes=memoria(diarios), bytes_compactos=memoria(compactar_diarios(diarios)))
+            registrar('CuboCasos.desde_datos', tamano,
+                      lambda: app.CuboCasos.desde_datos(datos_app.df, diarios))
+            cubo = app.CuboCasos.desde_datos(datos_app.df, diarios)
+            registrar('CuboCasos.casos_en_rango', tamano,
+                      lambda: cubo.casos_en_rango((10, cubo.n_dias - 10)))
+            registrar('MetricasEpidemiologicas', tamano,
+                      lambda: app.MetricasEpidemiologicas(cubo.acumulado, datos_app.df['poblacion'].to_numpy()))
+            agregados = app.crear_agregados_kpis(datos_app.df, cubo)
+            registrar('AgregadosKPI.totales', tamano,
+                      lambda: agregados.totales((10, cubo.n_dias - 10), ('Andina', 'Caribe')))
+
+        if filas > MAX_FILAS_FIGURAS:
+            continue
+        # La tabla de la app no trae las métricas diarias: se agregan como en el callback
+        # y solo las que el cubo de casos puede calcular
+        opciones = app.opciones_visualizacion() if tamano == 'departamentos' else app.OPCIONES_VISUALIZACION
+        for opcion in opciones:
+            tipo = opcion['value']
+            datos = df
+            if tamano == 'departamentos' and tipo in app.METRICAS_EPIDEMIOLOGICAS:
+                datos = app.con_metrica(df, tipo, None)
+            registrar(f'construir_figuras[{tipo}]', tamano, lambda: app.construir_figuras(tipo, datos))
+            fig_mapa, fig_top = app.construir_figuras(tipo, datos)
+            bytes_json = len(pio.to_json(fig_mapa, validate=False)) + len(pio.to_json(fig_top, validate=False))
+            registrar(f'serializar_figuras[{tipo}]', tamano,
+                      lambda: (pio.to_json(fig_mapa, validate=False), pio.to_json(fig_top, validate=False)),
+                      bytes=bytes_json)
+
+    return resultados
+
+# =============================================================================
+# PRUEBA DE CARGA
+# =============================================================================
+
+# Valores posibles de cada entrada de los callbacks; las demás van en None
+VALORES_ENTRADAS = {
+    'tipo-visualizacion': [opcion['value'] for opcion in app.OPCIONES_VISUALIZACION],
+    'granularidad': ['departamentos'],
+    'n-top': [5, 10, 20],
+    'regiones': [None, ['Andina'], ['Caribe', 'Pacífica']],
+    'seleccion-mapa': [None, None, ['Antioquia', 'Chocó', 'Valle del Cauca']],
+}
+
+def valores_rango():
+    ultimo = app.datos_actuales().cubo.n_dias - 1
+    inicio = random.randint(0, ultimo)
+    return [inicio, random.randint(inicio, ultimo)]
+
+def cuerpo_peticion(dependencia):
+    """Cuerpo de _dash-update-component para una dependencia de /_dash-dependencies"""
+    salidas = [
+        {'id': salida.split('.')[0], 'property': salida.split('.')[1]}
+        for salida in dependencia['output'].strip('.').split('...')
+    ]
+    entradas = []
+    for entrada in dependencia['inputs']:
+        if entrada['id'] == 'rango-fechas':
+            valor = valores_rango()
+        else:
+            valor = random.choice(VALORES_ENTRADAS.get(entrada['id'], [None]))
+        entradas.append(dict(entrada, value=valor))
+    return json.dumps({
+        'output': dependencia['output'],
+        'outputs': salidas if len(salidas) > 1 else salidas[0],
+        'inputs': entradas,
+        'changedPropIds': [f"{entradas[0]['id']}.{entradas[0]['property']}"],
+        # Sin estado previo el servidor responde con las figuras completas
+        'state': [dict(estado, value=None) for estado in dependencia.get('state', [])]
+    }).encode('utf-8')
+
+def iniciar_servidor_local(puerto):
+    """Sirve app.server con el servidor WSGI de werkzeug en un hilo aparte"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class ManejadorSilencioso(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    servidor = make_server('127.0.0.1', puerto, app.server, threaded=True, request_handler=ManejadorSilencioso)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f'http://127.0.0.1:{puerto}'
+
+# Segundos que se espera el resultado de un callback en segundo plano
+ESPERA_SEGUNDO_PLANO = 60
+
+def decodificar(cuerpo, codificacion):
+    """JSON de una respuesta, comprimida o no"""
+    if codificacion == 'gzip':
+        cuerpo = gzip.decompress(cuerpo)
+    elif codificacion == 'br':
+        cuerpo = brotli.decompress(cuerpo)
+    return json.loads(cuerpo)
+
+def prueba_carga(url, peticiones, concurrencia, comprimir):
+    with urllib.request.urlopen(f'{url}/_dash-dependencies') as respuesta:
+        dependencias = [d for d in json.load(respuesta) if not d.get('clientside_function')]
+    principal = next(d for d in dependencias if 'mapa-coropletico.figure' in d['output'])
+    # En segundo plano la primera respuesta solo trae el trabajo; el resultado se consulta cada `interval` ms
+    segundo_plano = principal.get('long')
+    cabeceras = {'Content-Type': 'application/json'}
+    if comprimir:
+        cabeceras['Accept-Encoding'] = 'br, gzip' if brotli is not None else 'gzip'
+
+    def publicar(ruta, cuerpo):
+        peticion = urllib.request.Request(f'{url}{ruta}', data=cuerpo, headers=cabeceras)
+        try:
+            with urllib.request.urlopen(peticion) as respuesta:
+                return respuesta.status, respuesta.read(), respuesta.headers.get('Content-Encoding')
+        except urllib.error.HTTPError as error:
+            # Un error del servidor se cuenta con su código en vez de cortar la prueba
+            return error.code, error.read(), None
+
+    def enviar(_):
+        cuerpo = cuerpo_peticion(principal)
+        t0 = time.perf_counter()
+        estado, respuesta, codificacion = publicar('/_dash-update-component', cuerpo)
+        if segundo_plano and estado == 200:
+            trabajo = decodificar(respuesta, codificacion)
+            consulta = f"/_dash-update-component?cacheKey={trabajo['cacheKey']}&job={trabajo['job']}"
+            limite = t0 + ESPERA_SEGUNDO_PLANO
+            while True:
+                if time.perf_counter() > limite:
+                    estado = 'sin resultado'
+                    break
+                time.sleep(segundo_plano['interval'] / 1000)
+                estado, respuesta, codificacion = publicar(consulta, cuerpo)
+                if estado != 200 or 'response' in decodificar(respuesta, codificacion):
+                    break
+        return (time.perf_counter() - t0) * 1000, len(respuesta), estado
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        resultados = list(ejecutor.map(enviar, range(peticiones)))
+    duracion = time.perf_counter() - inicio
+
+    # 204 es la respuesta de un callback que no actualiza nada (PreventUpdate)
+    errores = {}
+    for _, _, estado in resultados:
+        if estado not in (200, 204):
+            errores[str(estado)] = errores.get(str(estado), 0) + 1
+
+    latencias = sorted(r[0] for r in resultados)
+    percentil = lambda p: round(latencias[min(len(latencias) - 1, int(len(latencias) * p))], 3)
+    return {
+        'peticiones': peticiones,
+        'concurrencia': concurrencia,
+        'comprimido': comprimir,
+        'segundo_plano': bool(segundo_plano),
+        'errores': errores,
+        'por_segundo': round(peticiones / duracion, 1),
+        'p50_ms': percentil(0.50),
+        'p95_ms': percentil(0.95),
+        'p99_ms': percentil(0.99),
+        'bytes_promedio': round(statistics.mean(r[1] for r in resultados), 1),
+    }
+
+# =============================================================================
+# ARRANQUE
+# =============================================================================
+
+# Importa app en un proceso nuevo, espera los datos y devuelve su reporte de arranque
+CODIGO_ARRANQUE = (
+    "import json, app; app.esperar_datos(); "
+    "print(json.dumps(app.registro_arranque.reporte()))"
+)
+
+# Diferencia mínima en segundos para considerar más lenta una fase del arranque
+MIN_REGRESION_ARRANQUE = 0.05
+
+def medir_arranque(repeticiones, diferido):
+    """Mediana de los hitos y fases del arranque en procesos nuevos"""
+    entorno = dict(os.environ, DASHBOARD_ARRANQUE_DIFERIDO='1' if diferido else '0')
+    reportes = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, '-c', CODIGO_ARRANQUE], env=entorno, check=True,
+                                capture_output=True, text=True).stdout
+        reportes.append(json.loads(salida.strip().splitlines()[-1]))
+
+    resultado = {'diferido': diferido, 'repeticiones': repeticiones}
+    for hito in reportes[0]['hitos']:
+        resultado[f'{hito}_s'] = round(statistics.median(r['hitos'][hito] for r in reportes), 4)
+    for fase in reportes[0]['fases']:
+        resultado[f'{fase}_s'] = round(statistics.median(r['fases'][fase]['segundos'] for r in reportes), 4)
+    return resultado
+
+# =============================================================================
+# COMPARACIÓN
+# =============================================================================
+
+def comparar(anterior, actual, tolerancia=0.10):
+    """Imprime los cambios de mediana frente a una corrida anterior y devuelve las regresiones"""
+    previos = {(r['nombre'], r['tamano']): r for r in anterior.get('micro', [])}
+    regresiones = []
+    for r in actual.get('micro', []):
+        previo = previos.get((r['nombre'], r['tamano']))
+        if previo is None or previo['mediana_ms'] == 0:
+            continue
+        cambio = r['mediana_ms'] / previo['mediana_ms'] - 1
+        marca = ' <- regresión' if cambio > tolerancia else ''
+        print(f"  {r['nombre']:<32} {r['tamano']:<14} {cambio:+7.1%}{marca}")
+        if cambio > tolerancia:
+            regresiones.append(r)
+
+    if anterior.get('carga') and actual.get('carga'):
+        for clave in ('por_segundo', 'p50_ms', 'p95_ms', 'p99_ms', 'bytes_promedio'):
+            previo, nuevo = anterior['carga'][clave], actual['carga'][clave]
+            if previo:
+                print(f"  carga.{clave:<26} {previo:>12} -> {nuevo:<12} ({nuevo / previo - 1:+.1%})")
+
+    # Un arranque más lento que la tolerancia también cuenta como regresión,
+    # salvo en fases tan cortas que la diferencia es ruido
+    if anterior.get('arranque') and actual.get('arranque'):
+        for clave, nuevo in actual['arranque'].items():
+            previo = anterior['arranque'].get(clave)
+            if not clave.endswith('_s') or not previo:
+                continue
+            cambio = nuevo / previo - 1
+            regresion = cambio > tolerancia and nuevo - previo > MIN_REGRESION_ARRANQUE
+            marca = ' <- regresión' if regresion else ''
+            print(f"  arranque.{clave:<23} {previo:>12} -> {nuevo:<12} ({cambio:+.1%}){marca}")
+            if regresion:
+                regresiones.append({'nombre': f'arranque.{clave}', 'mediana_ms': nuevo * 1000})
+    return regresiones
+
+# =============================================================================
+# EJECUCIÓN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks y prueba de carga del dashboard")
+    parser.add_argument('--solo', choices=['micro', 'carga', 'arranque'], help="Ejecutar solo una de las partes")
+    parser.add_argument('--tamanos', default=','.join(TAMANOS), help="Tamaños sintéticos separados por coma")
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--presupuesto', type=float, default=2.0, help="Segundos máximos por micro-benchmark")
+    parser.add_argument('--url', help="URL de un servidor ya en marcha (por defecto se levanta uno local)")
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--peticiones', type=int, default=500)
+    parser.add_argument('--concurrencia', type=int, default=8)
+    parser.add_argument('--sin-compresion', action='store_true')
+    parser.add_argument('--salida', default='resultados_benchmark.json')
+    parser.add_argument('--comparar', help="JSON de una corrida anterior")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--arranques', type=int, default=3, help="Procesos nuevos para medir el arranque")
+    parser.add_argument('--arranque-diferido', action='store_true', help="Medir con DASHBOARD_ARRANQUE_DIFERIDO")
+    args = parser.parse_args()
+    random.seed(args.semilla)
+    app.esperar_datos()
+
+    resultado = {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'version_datos': app.datos_actuales().version,
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+    }
+
+    if args.solo in (None, 'micro'):
+        print("Micro-benchmarks")
+        tamanos = {nombre: TAMANOS[nombre] for nombre in args.tamanos.split(',')}
+        resultado['micro'] = micro_benchmarks(tamanos, args.repeticiones, args.presupuesto)
+
+    if args.solo in (None, 'carga'):
+        servidor = None
+        url = args.url
+        if url is None:
+            servidor, url = iniciar_servidor_local(args.puerto)
+        try:
+            resultado['carga'] = prueba_carga(url.rstrip('/'), args.peticiones, args.concurrencia,
+                                              not args.sin_compresion)
+        finally:
+            if servidor is not None:
+                servidor.shutdown()
+        print("Prueba de carga")
+        for clave, valor in resultado['carga'].items():
+            print(f"  {clave:<16} {valor}")
+
+    if args.solo in (None, 'arranque'):
+        resultado['arranque'] = medir_arranque(args.arranques, args.arranque_diferido)
+        print("Arranque")
+        for clave, valor in resultado['arranque'].items():
+            print(f"  {clave:<16} {valor}")
+
+    with open(args.salida, 'w', encoding='utf-8') as archivo:
+        json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            anterior = json.load(archivo)
+        print(f"Comparación con {args.comparar}")
+        if comparar(anterior, resultado):
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
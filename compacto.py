@@ -0,0 +1,134 @@
+import mmap
+import os
+
+from arranque import ModuloDiferido
+
+np = ModuloDiferido('numpy')
+pd = ModuloDiferido('pandas')
+
+# =============================================================================
+# REPRESENTACIÓN COMPACTA DE LAS TABLAS EN MEMORIA
+# =============================================================================
+
+# Con millones de filas los tipos por omisión de pandas pesan varias veces lo
+# necesario: cada nombre repetido es un objeto de Python y cada número ocupa
+# 8 bytes. Aquí los nombres se guardan como categorías (un código por fila y
+# cada nombre una sola vez) y los números en el tipo más pequeño que admite su
+# rango, comprobado al cargar.
+
+TIPOS_ENTEROS = ('int8', 'int16', 'int32', 'int64')
+
+# Hasta este valor los enteros guardados como float32 son exactos
+MAX_ENTERO_FLOAT32 = 2 ** 24
+
+def reducir_enteros(valores, minimo='int8'):
+    """El arreglo en el tipo entero más pequeño (desde `minimo`) que contiene su rango"""
+    valores = np.asarray(valores)
+    if valores.size == 0:
+        return valores.astype(minimo)
+    menor, mayor = valores.min(), valores.max()
+    for tipo in TIPOS_ENTEROS[TIPOS_ENTEROS.index(minimo):]:
+        limites = np.iinfo(tipo)
+        if limites.min <= menor and mayor <= limites.max:
+            return valores.astype(tipo, copy=False)
+    return valores
+
+def reducir_flotantes(valores, enteros=False):
+    """float32 si no se pierde nada que importe; si no, el arreglo como está.
+
+    Con `enteros` los valores son conteos guardados como float: solo se reducen
+    si siguen siendo exactos en float32.
+    """
+    valores = np.asarray(valores)
+    if valores.dtype == np.float32:
+        return valores
+    valores = valores.astype(np.float64, copy=False)
+    if enteros and valores.size and np.nanmax(np.abs(valores)) > MAX_ENTERO_FLOAT32:
+        return valores
+    return valores.astype(np.float32)
+
+def compactar_tabla(df, categoricas=(), flotantes=()):
+    """Copia de la tabla con nombres categóricos y enteros reducidos.
+
+    Las columnas de `flotantes` pasan a float32; las demás columnas de punto
+    flotante se dejan igual porque terminan en las figuras.
+    """
+    columnas = {}
+    for columna in df.columns:
+        serie = df[columna]
+        if columna in categoricas:
+            columnas[columna] = serie.astype('category')
+        elif columna in flotantes:
+            columnas[columna] = pd.Series(reducir_flotantes(serie.to_numpy()), index=df.index)
+        elif pd.api.types.is_integer_dtype(serie.dtype):
+            columnas[columna] = pd.Series(reducir_enteros(serie.to_numpy()), index=df.index)
+        else:
+            columnas[columna] = serie
+    return pd.DataFrame(columnas, index=df.index)
+
+def validar_tabla(df, origen, columnas, no_negativas=(), rangos=None):
+    """Comprueba columnas, valores faltantes, negativos y rangos; ValueError si algo falla"""
+    faltantes = [c for c in columnas if c not in df.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en {origen}: {', '.join(faltantes)}")
+    nulas = [c for c in columnas if df[c].isna().any()]
+    if nulas:
+        raise ValueError(f"Valores faltantes en {origen}: {', '.join(nulas)}")
+    negativas = [c for c in no_negativas if (df[c] < 0).any()]
+    if negativas:
+        raise ValueError(f"Valores negativos en {origen}: {', '.join(negativas)}")
+    for columna, (menor, mayor) in (rangos or {}).items():
+        fuera = ~df[columna].between(menor, mayor)
+        if fuera.any():
+            raise ValueError(f"{int(fuera.sum())} valores de {columna} fuera de [{menor}, {mayor}] en {origen}")
+
+# =============================================================================
+# MEMORIA
+# =============================================================================
+
+def memoria(objeto, _vistos=None):
+    """Bytes de tablas, series, índices y arreglos, recorriendo dicts, listas y atributos de objetos.
+
+    Cada arreglo se cuenta una vez aunque lo compartan varias estructuras, y
+    los mapeados desde disco no se cuentan: no son memoria propia del proceso.
+    """
+    vistos = set() if _vistos is None else _vistos
+    if objeto is None or isinstance(objeto, (str, bytes, int, float, type)):
+        return 0
+    base = objeto
+    if isinstance(objeto, np.ndarray):
+        while isinstance(base, np.ndarray) and base.base is not None:
+            base = base.base
+    if id(base) in vistos:
+        return 0
+    vistos.add(id(base))
+
+    if isinstance(objeto, np.ndarray):
+        return 0 if isinstance(base, (np.memmap, mmap.mmap)) else int(objeto.nbytes)
+    if isinstance(objeto, pd.DataFrame):
+        return int(objeto.memory_usage(index=True, deep=True).sum())
+    if isinstance(objeto, (pd.Series, pd.Index)):
+        return int(objeto.memory_usage(deep=True))
+    if isinstance(objeto, dict):
+        return sum(memoria(valor, vistos) for valor in objeto.values())
+    if isinstance(objeto, (list, tuple)):
+        return sum(memoria(valor, vistos) for valor in objeto)
+    if hasattr(objeto, '__dict__'):
+        return memoria(vars(objeto), vistos)
+    return 0
+
+def memoria_residente():
+    """Memoria residente actual y máxima del proceso, en bytes (None si el sistema no la da)"""
+    try:
+        # `resource` solo existe en sistemas tipo Unix
+        import resource
+    except ImportError:
+        maxima = None
+    else:
+        maxima = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    try:
+        with open('/proc/self/statm') as archivo:
+            actual = int(archivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        actual = None
+    return {'residente': actual, 'residente_maxima': maxima}
@@ -0,0 +1,63 @@
+# =============================================================================
+# DEPARTAMENTOS
+# =============================================================================
+
+# Tabla base de los departamentos y sus regiones. Está aparte de app.py para que
+# la ingesta y los scripts la usen sin importar la app.
+
+# Datos actualizados basados en la información proporcionada
+DATOS_DEPARTAMENTOS = [
+    # Departamento, Lat, Lon, Casos, Población (aproximada)
+    ['Bogotá D.C.', 4.6097, -74.0817, 65908, 8000000],
+    ['Antioquia', 6.2442, -75.5736, 39941, 6400000],
+    ['Valle del Cauca', 3.8009, -76.6413, 27108, 4500000],
+    ['Atlántico', 10.9639, -74.7964, 17058, 2500000],
+    ['Córdoba', 8.0493, -75.5740, 15566, 1700000],
+    ['Santander', 6.6437, -73.6536, 15000, 2200000],
+    ['Cundinamarca', 4.7979, -74.1925, 14000, 2800000],
+    ['Bolívar', 8.6704, -74.0300, 12000, 2100000],
+    ['Nariño', 1.2136, -77.2811, 11000, 1600000],
+    ['Boyacá', 5.5350, -73.3678, 10000, 1200000],
+    ['Magdalena', 10.4113, -74.4057, 9500, 1400000],
+    ['Cesar', 9.3373, -73.6536, 9000, 1200000],
+    ['Tolima', 4.0925, -75.1545, 8500, 1300000],
+    ['Caldas', 5.2982, -75.2479, 8000, 1000000],
+    ['Huila', 2.5359, -75.5277, 7500, 1100000],
+    ['Sucre', 8.8140, -74.7233, 7000, 850000],
+    ['La Guajira', 11.3548, -72.5205, 6500, 880000],
+    ['Cauca', 2.4417, -76.6066, 6000, 1300000],
+    ['Risaralda', 4.8080, -75.7002, 5500, 940000],
+    ['Norte de Santander', 7.9076, -72.5045, 5000, 1600000],
+    ['Quindío', 4.5310, -75.6801, 4500, 540000],
+    ['Meta', 3.2719, -73.0877, 4000, 1000000],
+    ['Chocó', 5.6919, -76.6582, 3500, 500000],
+    ['Casanare', 5.7589, -71.5724, 3000, 420000],
+    ['Arauca', 6.5474, -70.9977, 2500, 300000],
+    ['Putumayo', 0.8850, -76.5086, 2000, 350000],
+    ['Caquetá', 1.6146, -75.6062, 1500, 400000],
+    ['San Andrés', 12.5567, -81.7185, 3000, 75000],
+    # Departamentos amazónicos con aproximadamente 5 casos
+    ['Amazonas', -1.4429, -71.5724, 5, 76000],
+    ['Guainía', 2.5854, -68.5247, 5, 48000],
+    ['Guaviare', 2.0439, -72.3311, 5, 82000],
+    ['Vaupés', 0.3853, -70.5771, 5, 44000],
+    ['Vichada', 4.4234, -69.2878, 5, 110000]
+]
+
+# Región natural de cada departamento, usada como filtro del ranking
+REGIONES_DEPARTAMENTOS = {
+    'Atlántico': 'Caribe', 'Bolívar': 'Caribe', 'Cesar': 'Caribe', 'Córdoba': 'Caribe',
+    'La Guajira': 'Caribe', 'Magdalena': 'Caribe', 'Sucre': 'Caribe',
+    'Bogotá D.C.': 'Andina', 'Antioquia': 'Andina', 'Boyacá': 'Andina', 'Caldas': 'Andina',
+    'Cundinamarca': 'Andina', 'Huila': 'Andina', 'Norte de Santander': 'Andina', 'Quindío': 'Andina',
+    'Risaralda': 'Andina', 'Santander': 'Andina', 'Tolima': 'Andina',
+    'Chocó': 'Pacífica', 'Valle del Cauca': 'Pacífica', 'Cauca': 'Pacífica', 'Nariño': 'Pacífica',
+    'Arauca': 'Orinoquía', 'Casanare': 'Orinoquía', 'Meta': 'Orinoquía', 'Vichada': 'Orinoquía',
+    'Amazonas': 'Amazonía', 'Caquetá': 'Amazonía', 'Guainía': 'Amazonía', 'Guaviare': 'Amazonía',
+    'Putumayo': 'Amazonía', 'Vaupés': 'Amazonía',
+    'San Andrés': 'Insular'
+}
+REGIONES = ['Andina', 'Caribe', 'Pacífica', 'Orinoquía', 'Amazonía', 'Insular']
+
+# Nombres en el orden de la tabla
+NOMBRES_DEPARTAMENTOS = [fila[0] for fila in DATOS_DEPARTAMENTOS]
@@ -0,0 +1,93 @@
+from arranque import ModuloDiferido
+
+np = ModuloDiferido('numpy')
+
+# =============================================================================
+# MÉTRICAS EPIDEMIOLÓGICAS POR DEPARTAMENTO Y DÍA
+# =============================================================================
+
+# Días de la ventana del promedio móvil y del crecimiento semanal
+VENTANA_SEMANA = 7
+# Días de la tasa por habitante
+VENTANA_TASA = 14
+# Días entre un caso y los que contagia, para la estimación de Rt
+INTERVALO_SERIAL = 5
+
+METRICAS_EPIDEMIOLOGICAS = ('promedio_7d', 'crecimiento', 'duplicacion', 'tasa_14d', 'rt')
+# Días que necesita la serie para que cada métrica tenga al menos un valor con
+# las ventanas completas: el crecimiento compara dos semanas y Rt una semana
+# con la de un intervalo serial antes
+DIAS_MINIMOS_METRICAS = {
+    'promedio_7d': VENTANA_SEMANA,
+    'crecimiento': 2 * VENTANA_SEMANA,
+    'duplicacion': 2 * VENTANA_SEMANA,
+    'tasa_14d': VENTANA_TASA,
+    'rt': VENTANA_SEMANA + INTERVALO_SERIAL,
+}
+# Decimales con que se redondea cada métrica
+DECIMALES_METRICAS = {'promedio_7d': 1, 'crecimiento': 1, 'duplicacion': 1, 'tasa_14d': 1, 'rt': 2}
+
+def sumas_moviles(acumulado, ventana):
+    """Casos de los últimos `ventana` días hasta cada día, a partir de la suma prefija.
+
+    `acumulado` tiene una columna inicial de ceros; al principio de la serie
+    las ventanas quedan incompletas.
+    """
+    n_dias = acumulado.shape[1] - 1
+    inicios = np.maximum(np.arange(1, n_dias + 1) - ventana, 0)
+    return acumulado[:, 1:] - acumulado[:, inicios]
+
+def desplazar(matriz, dias):
+    """La matriz `dias` días más tarde; los primeros días quedan en cero"""
+    desplazada = np.zeros_like(matriz)
+    if dias < matriz.shape[1]:
+        desplazada[:, dias:] = matriz[:, :matriz.shape[1] - dias]
+    return desplazada
+
+def cociente(numerador, denominador):
+    """numerador / denominador, con NaN donde el denominador no es positivo"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominador > 0, numerador / denominador, np.nan)
+
+class MetricasEpidemiologicas:
+    """Promedio móvil, crecimiento, tiempo de duplicación, tasa y Rt de cada departamento y día.
+
+    Todo se calcula de una vez como operaciones sobre la matriz departamento x
+    día que sale de la suma prefija de casos, sin recorrer departamentos.
+    Los valores sin sentido (semana anterior sin casos, sin crecimiento para
+    duplicar) quedan en NaN. Las matrices se guardan en float32, de sobra para
+    uno o dos decimales, y se devuelven en float64 ya redondeadas.
+    """
+
+    def __init__(self, acumulado, poblacion):
+        acumulado = np.asarray(acumulado, dtype=np.float64)
+        poblacion = np.asarray(poblacion, dtype=np.float64)
+        semana = sumas_moviles(acumulado, VENTANA_SEMANA)
+        semana_anterior = desplazar(semana, VENTANA_SEMANA)
+
+        # Cambio de los casos de la semana respecto a la anterior, en porcentaje
+        razon_semanal = cociente(semana, semana_anterior)
+        # Tasa de crecimiento diaria equivalente y días para duplicar los casos semanales
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tasa_diaria = np.log(razon_semanal) / VENTANA_SEMANA
+            duplicacion = np.where(tasa_diaria > 0, np.log(2) / tasa_diaria, np.nan)
+
+        valores = {
+            'promedio_7d': semana / VENTANA_SEMANA,
+            'crecimiento': (razon_semanal - 1) * 100,
+            'duplicacion': duplicacion,
+            'tasa_14d': cociente(sumas_moviles(acumulado, VENTANA_TASA) * 100000, poblacion[:, None]),
+            # Estimación simple: casos de la semana sobre los de la semana un intervalo serial antes
+            'rt': cociente(semana, desplazar(semana, INTERVALO_SERIAL)),
+        }
+        self.valores = {metrica: matriz.astype(np.float32) for metrica, matriz in valores.items()}
+
+    @property
+    def n_dias(self):
+        return self.valores['promedio_7d'].shape[1]
+
+    def en_dia(self, metrica, dia=None):
+        """Valor de la métrica de cada departamento en un día (el último con None)"""
+        valores = self.valores[metrica][:, self.n_dias - 1 if dia is None else dia]
+        # Sin volver a redondear en float64 las figuras mostrarían 33.70000076
+        return valores.astype(np.float64).round(DECIMALES_METRICAS[metrica])
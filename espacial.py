@@ -0,0 +1,68 @@
+from arranque import ModuloDiferido
+
+np = ModuloDiferido('numpy')
+
+# =============================================================================
+# ÍNDICES ESPACIALES PARA LAS SELECCIONES DEL MAPA
+# =============================================================================
+
+# R-trees de shapely (STRtree) sobre centroides y polígonos: un clic, un
+# rectángulo o un lazo se resuelven recorriendo solo las ramas del árbol que
+# tocan la zona, no todas las filas. shapely es opcional, como en geometria.py:
+# sin él los constructores lanzan ImportError.
+
+class IndicePuntos:
+    """Centroides (latitud, longitud) con consultas de vecino más cercano y de contención"""
+
+    def __init__(self, lat, lon):
+        import shapely
+
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self._arbol = shapely.STRtree(shapely.points(self.lon, self.lat))
+
+    def __len__(self):
+        return len(self.lat)
+
+    def mas_cercano(self, lat, lon):
+        """Posición del centroide más cercano al punto"""
+        import shapely
+
+        return int(self._arbol.query_nearest(shapely.Point(lon, lat))[0])
+
+    def dentro(self, zona):
+        """Posiciones, en orden, de los centroides dentro de una zona (geometría de shapely)"""
+        return np.sort(self._arbol.query(zona, predicate='contains'))
+
+class IndicePoligonos:
+    """Polígonos con la consulta de cuál contiene un punto"""
+
+    def __init__(self, poligonos):
+        import shapely
+
+        self._arbol = shapely.STRtree(list(poligonos))
+
+    def __len__(self):
+        return len(self._arbol)
+
+    def que_contiene(self, lat, lon):
+        """Posición del polígono que contiene el punto, o None si cae fuera de todos"""
+        import shapely
+
+        posiciones = self._arbol.query(shapely.Point(lon, lat), predicate='within')
+        return int(posiciones[0]) if len(posiciones) else None
+
+def zona_de_seleccion(seleccion):
+    """Polígono del lazo o del rectángulo de un selectedData de mapbox; None si no trae ninguno"""
+    import shapely
+
+    seleccion = seleccion or {}
+    lazo = (seleccion.get('lassoPoints') or {}).get('mapbox')
+    if lazo and len(lazo) >= 3:
+        # Un lazo que se cruza consigo mismo no es un polígono válido
+        return shapely.make_valid(shapely.Polygon(lazo))
+    rango = (seleccion.get('range') or {}).get('mapbox')
+    if rango:
+        (lon_1, lat_1), (lon_2, lat_2) = rango
+        return shapely.box(min(lon_1, lon_2), min(lat_1, lat_2), max(lon_1, lon_2), max(lat_1, lat_2))
+    return None
@@ -0,0 +1,167 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+from dash.fingerprint import check_fingerprint
+
+from arranque import pool_procesos
+
+# =============================================================================
+# EXPORTACIÓN ESTÁTICA DEL DASHBOARD
+# =============================================================================
+
+# Genera un directorio que cualquier servidor de archivos o CDN puede publicar
+# en la misma ruta que la app (DASHBOARD_ESTATICO debe apuntar a su estatico/):
+#
+#   index.html                                     página de la app
+#   _dash-layout.json, _dash-dependencies.json     layout y callbacks de la app
+#   componentes/<paquete>/...                      JavaScript de Dash y sus componentes
+#   geometria/<version>/departamentos-<nivel>.json límites de los departamentos
+#   estatico/<version>/<estado>.json               figuras y KPIs de cada estado exportable
+#   manifiesto.json                                versión, estados y huellas
+#
+# El layout y las dependencias llevan extensión .json para que el servidor los
+# entregue como application/json; la página reescribe las rutas que pide el
+# renderer de Dash. Las peticiones a _dash-update-component deben seguir
+# llegando a la app: solo las usan los estados que no se exportaron (rango
+# parcial, nivel municipal, selección en el mapa).
+
+RUTA_ESTATICA = '/estatico/'
+
+ARCHIVOS_API = ('_dash-layout', '_dash-dependencies')
+
+# Va antes de los scripts de Dash: el renderer pide el layout con fetch al arrancar
+REESCRITURA_API = """<script>
+(function () {
+    var rutas = %s;
+    var original = window.fetch;
+    window.fetch = function (recurso, opciones) {
+        if (typeof recurso === 'string' && rutas.hasOwnProperty(recurso)) {
+            recurso = rutas[recurso];
+        }
+        return original.call(this, recurso, opciones);
+    };
+})();
+</script>
+"""
+
+# Directorio de la exportación en cada proceso del pool; lo fija el inicializador
+_destino = None
+
+def _iniciar_exportacion(destino):
+    global _destino
+    _destino = destino
+
+def _exportar_estado(estado):
+    import app
+
+    texto = app.renderizar_estado(*estado).encode('utf-8')
+    nombre = app.nombre_estado_exportado(*estado)
+    ruta = os.path.join(_destino, 'estatico', app.datos_actuales().version, nombre)
+    with open(ruta, 'wb') as archivo:
+        archivo.write(texto)
+    return nombre, len(texto), hashlib.sha1(texto).hexdigest()[:16]
+
+def exportar_estados(destino, procesos):
+    """Renderiza todos los estados exportables en paralelo; devuelve {archivo: (bytes, huella)}"""
+    import app
+
+    os.makedirs(os.path.join(destino, 'estatico', app.datos_actuales().version), exist_ok=True)
+    estados = app.estados_exportables()
+    # Los procesos heredan la app con los datos ya cargados
+    with pool_procesos(procesos, initializer=_iniciar_exportacion, initargs=(destino,)) as pool:
+        resultados = pool.map(_exportar_estado, estados, chunksize=max(1, len(estados) // (procesos * 4)))
+        return {nombre: (tamano, huella) for nombre, tamano, huella in resultados}
+
+def guardar(destino, ruta, contenido):
+    ruta = os.path.join(destino, *ruta.strip('/').split('/'))
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, 'wb') as archivo:
+        archivo.write(contenido)
+
+def exportar_pagina(destino):
+    """Página, layout, dependencias, JavaScript y geometría, tal como los sirve la app"""
+    import app
+
+    cliente = app.server.test_client()
+    prefijo = app.app.config.requests_pathname_prefix
+
+    def obtener(ruta):
+        respuesta = cliente.get(ruta)
+        if respuesta.status_code != 200:
+            raise SystemExit(f"{ruta} respondió {respuesta.status_code}")
+        return respuesta.get_data()
+
+    # Los scripts van sin huella de versión a componentes/: los componentes piden
+    # sus partes asíncronas junto al script y solo agregan la huella bajo
+    # _dash-component-suites, así que en componentes/ las encuentran por su nombre
+    def sin_huella(coincidencia):
+        paquete, ruta = coincidencia.group(1), check_fingerprint(coincidencia.group(2))[0]
+        return f'{prefijo}componentes/{paquete}/{ruta}'
+
+    indice = obtener(prefijo).decode('utf-8')
+    indice = re.sub(re.escape(prefijo) + r'_dash-component-suites/([^/"]+)/([^"?]+)', sin_huella, indice)
+    rutas = {prefijo + nombre: f'{prefijo}{nombre}.json' for nombre in ARCHIVOS_API}
+    configuracion = indice.index('<script id="_dash-config"')
+    indice = indice[:configuracion] + REESCRITURA_API % json.dumps(rutas) + indice[configuracion:]
+    guardar(destino, 'index.html', indice.encode('utf-8'))
+    for nombre in ARCHIVOS_API:
+        guardar(destino, f'{nombre}.json', obtener(prefijo + nombre))
+
+    # Todo lo que la app registró para servir, incluidas las partes que se cargan bajo demanda
+    for paquete, rutas in app.app.registered_paths.items():
+        for ruta in rutas:
+            if ruta.endswith('.map'):
+                continue
+            respuesta = cliente.get(f'{prefijo}_dash-component-suites/{paquete}/{ruta}')
+            if respuesta.status_code == 200:
+                guardar(destino, f'componentes/{paquete}/{ruta}', respuesta.get_data())
+
+    if os.path.isdir(app.app.config.assets_folder):
+        shutil.copytree(app.app.config.assets_folder, os.path.join(destino, 'assets'), dirs_exist_ok=True)
+
+    geometria = app.geometria_departamentos
+    if geometria is not None:
+        for nivel in geometria.geojson:
+            guardar(destino, f'geometria/{geometria.version}/departamentos-{nivel}.json',
+                    obtener(app.url_geometria(nivel)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta los estados del dashboard como archivos estáticos")
+    parser.add_argument('destino', help="Directorio de la exportación")
+    parser.add_argument('--url', default=RUTA_ESTATICA,
+                        help="URL pública del directorio estatico/ de la exportación")
+    parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    # El layout y los callbacks exportados deben ser los del modo estático
+    os.environ['DASHBOARD_ESTATICO'] = args.url
+    import app
+
+    app.esperar_datos()
+    if app.error_carga is not None:
+        raise SystemExit(f"Error al cargar los datos: {app.error_carga}")
+    version = app.datos_actuales().version
+
+    inicio = time.perf_counter()
+    estados = exportar_estados(args.destino, args.procesos)
+    exportar_pagina(args.destino)
+
+    manifiesto = {
+        'version': version,
+        'url': args.url,
+        'generado': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'estados': {nombre: {'bytes': tamano, 'sha1': huella} for nombre, (tamano, huella) in sorted(estados.items())},
+    }
+    guardar(args.destino, 'manifiesto.json', json.dumps(manifiesto, indent=2, ensure_ascii=False).encode('utf-8'))
+
+    total = sum(tamano for tamano, _ in estados.values())
+    print(f"{len(estados)} estados ({total / 1e6:.1f} MB) de la versión {version} "
+          f"exportados en {args.destino} en {time.perf_counter() - inicio:.1f} s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import hashlib
+import json
+
+from ingesta import crear_mapa_departamentos, normalizar_nombre
+
+# =============================================================================
+# GEOMETRÍA DE LOS DEPARTAMENTOS
+# =============================================================================
+
+# Niveles de simplificación: tolerancia en grados y decimales de las coordenadas.
+# Con 3 decimales el error de cuantización es de unos 100 m, menor que la tolerancia.
+NIVELES_SIMPLIFICACION = {
+    'baja': (0.02, 2),
+    'media': (0.005, 3),
+    'alta': (0.001, 4),
+}
+
+# Columnas con el nombre del departamento en los shapefiles más comunes (DANE MGN, GADM)
+COLUMNAS_NOMBRE = ('DPTO_CNMBR', 'NOMBRE_DPT', 'DPTO_NOMBRE', 'NAME_1', 'name')
+
+def cargar_departamentos(ruta, departamentos, columna_nombre=None):
+    """Lee los límites departamentales y los une a los nombres del dashboard"""
+    import geopandas as gpd
+
+    gdf = gpd.read_file(ruta)
+    if gdf.crs is not None:
+        gdf = gdf.to_crs(epsg=4326)
+
+    if columna_nombre is None:
+        columna_nombre = next(c for c in COLUMNAS_NOMBRE if c in gdf.columns)
+
+    mapa = crear_mapa_departamentos(departamentos)
+    gdf['Departamento'] = gdf[columna_nombre].map(lambda nombre: mapa.get(normalizar_nombre(nombre)))
+    gdf = gdf.dropna(subset=['Departamento'])
+
+    # Un departamento puede venir en varias filas (islas, distritos)
+    return gdf[['Departamento', 'geometry']].dissolve(by='Departamento', as_index=False)
+
+def simplificar(geometrias, tolerancia):
+    """Simplifica conservando la topología.
+
+    Con GEOS >= 3.12 y una cobertura válida se simplifica la cobertura completa,
+    así los límites compartidos entre departamentos quedan iguales y no aparecen
+    huecos. Si no, se simplifica cada polígono por separado.
+    """
+    import shapely
+
+    if hasattr(shapely, 'coverage_simplify') and shapely.coverage_is_valid(geometrias.values):
+        return list(shapely.coverage_simplify(geometrias.values, tolerancia))
+    return list(geometrias.simplify(tolerancia, preserve_topology=True))
+
+def _cuantizar(coordenadas, decimales):
+    """Redondea las coordenadas y quita los vértices repetidos que deja el redondeo"""
+    if isinstance(coordenadas[0][0], float):
+        anillo = []
+        for x, y in coordenadas:
+            punto = [round(x, decimales), round(y, decimales)]
+            if not anillo or punto != anillo[-1]:
+                anillo.append(punto)
+        return anillo
+    return [_cuantizar(parte, decimales) for parte in coordenadas]
+
+def serializar_geojson(gdf, tolerancia, decimales):
+    """GeoJSON compacto con el nombre del departamento como id de cada feature"""
+    from shapely.geometry import mapping
+
+    features = []
+    for nombre, geometria in zip(gdf['Departamento'], simplificar(gdf.geometry, tolerancia)):
+        if geometria is None or geometria.is_empty:
+            continue
+        mapeo = mapping(geometria)
+        features.append({
+            'type': 'Feature',
+            'id': nombre,
+            'geometry': {'type': mapeo['type'], 'coordinates': _cuantizar(mapeo['coordinates'], decimales)}
+        })
+    return json.dumps({'type': 'FeatureCollection', 'features': features},
+                      separators=(',', ':'), ensure_ascii=False)
+
+class GeometriaDepartamentos:
+    """Límites departamentales cargados una vez y serializados por nivel de simplificación"""
+
+    def __init__(self, ruta, departamentos, columna_nombre=None):
+        gdf = cargar_departamentos(ruta, departamentos, columna_nombre)
+        self.departamentos = set(gdf['Departamento'])
+        # Polígonos sin simplificar, para ubicar puntos del mapa en su departamento
+        self.nombres = gdf['Departamento'].tolist()
+        self.poligonos = list(gdf.geometry)
+        self.geojson = {
+            nivel: serializar_geojson(gdf, tolerancia, decimales)
+            for nivel, (tolerancia, decimales) in NIVELES_SIMPLIFICACION.items()
+        }
+        contenido = ''.join(self.geojson[nivel] for nivel in sorted(self.geojson))
+        self.version = hashlib.sha1(contenido.encode('utf-8')).hexdigest()[:12]
+
+    def tamanos(self):
+        """Bytes del GeoJSON de cada nivel"""
+        return {nivel: len(texto.encode('utf-8')) for nivel, texto in self.geojson.items()}
@@ -0,0 +1,23 @@
+import os
+import sys
+
+# =============================================================================
+# CONFIGURACIÓN DE GUNICORN
+# =============================================================================
+
+# gunicorn lee este archivo al arrancar desde la raíz del proyecto (Procfile).
+
+# Mismos valores que leer_bandera() en app.py; importar la app aquí la cargaría en el maestro
+ARRANQUE_DIFERIDO = os.environ.get('DASHBOARD_ARRANQUE_DIFERIDO', '').strip().lower() in ('1', 'true', 'si', 'sí', 'yes')
+
+# Precargar la app comparte los datos entre workers, pero el maestro los carga
+# antes de crear el primero. Con arranque diferido cada worker importa la app y
+# atiende peticiones mientras carga los datos en su propio hilo.
+preload_app = not ARRANQUE_DIFERIDO
+
+def pre_fork(server, worker):
+    # Si igual se pasó --preload con arranque diferido, el hilo de carga del
+    # maestro no sobrevive al fork: los workers esperan a que termine
+    app = sys.modules.get('app')
+    if app is not None:
+        app.esperar_datos()
@@ -0,0 +1,158 @@
+import argparse
+import os
+import time
+import unicodedata
+
+from arranque import ModuloDiferido
+from compacto import compactar_tabla, validar_tabla
+from departamentos import NOMBRES_DEPARTAMENTOS
+
+pd = ModuloDiferido('pandas')
+
+# =============================================================================
+# INGESTA DEL ARCHIVO NACIONAL DE CASOS
+# =============================================================================
+
+# Columnas del archivo de casos positivos del INS (datos.gov.co)
+COLUMNA_DEPARTAMENTO = 'Nombre departamento'
+COLUMNA_FECHA = 'Fecha de diagnóstico'
+
+# Nombres del archivo crudo que no coinciden directamente con los del dashboard.
+# Los distritos especiales se suman a su departamento.
+ALIAS_DEPARTAMENTOS = {
+    'BOGOTA': 'Bogotá D.C.',
+    'BOGOTA DC': 'Bogotá D.C.',
+    'BOGOTA D C': 'Bogotá D.C.',
+    'VALLE': 'Valle del Cauca',
+    'BARRANQUILLA': 'Atlántico',
+    'CARTAGENA': 'Bolívar',
+    'SANTA MARTA': 'Magdalena',
+    'STA MARTA D E': 'Magdalena',
+    'GUAJIRA': 'La Guajira',
+    'NORTE SANTANDER': 'Norte de Santander',
+    'SAN ANDRES': 'San Andrés',
+    'SAN ANDRES Y PROVIDENCIA': 'San Andrés',
+    'ARCHIPIELAGO DE SAN ANDRES PROVIDENCIA Y SANTA CATALINA': 'San Andrés',
+}
+
+def normalizar_nombre(nombre):
+    """Convierte un nombre a mayúsculas sin tildes ni signos de puntuación"""
+    sin_tildes = unicodedata.normalize('NFKD', str(nombre)).encode('ascii', 'ignore').decode('ascii')
+    limpio = ''.join(c if c.isalnum() else ' ' for c in sin_tildes.upper())
+    return ' '.join(limpio.split())
+
+def crear_mapa_departamentos(departamentos):
+    """Mapa de nombre normalizado -> nombre del dashboard"""
+    mapa = {normalizar_nombre(d): d for d in departamentos}
+    for alias, destino in ALIAS_DEPARTAMENTOS.items():
+        if destino in departamentos:
+            mapa[alias] = destino
+    return mapa
+
+def ingerir_csv(ruta_csv, departamentos, tamano_bloque=500000,
+                columna_departamento=COLUMNA_DEPARTAMENTO, columna_fecha=COLUMNA_FECHA,
+                formato_fecha='mixed', encoding='utf-8'):
+    """Lee el CSV crudo por bloques y agrega los casos por departamento y día.
+
+    Solo se mantiene en memoria el bloque actual y el acumulado
+    (departamentos x días), sin importar el tamaño del archivo.
+    Devuelve el DataFrame agregado y el número de filas descartadas.
+    """
+    mapa = crear_mapa_departamentos(departamentos)
+    traducciones = {}
+    acumulado = None
+    descartadas = 0
+
+    lector = pd.read_csv(
+        ruta_csv,
+        usecols=[columna_departamento, columna_fecha],
+        dtype={columna_departamento: 'category', columna_fecha: 'category'},
+        chunksize=tamano_bloque,
+        encoding=encoding
+    )
+
+    for bloque in lector:
+        # Los nombres y las fechas se repiten millones de veces: se traducen
+        # una sola vez por categoría y luego se mapean sobre el bloque
+        nombres = bloque[columna_departamento]
+        for categoria in nombres.cat.categories:
+            if categoria not in traducciones:
+                traducciones[categoria] = mapa.get(normalizar_nombre(categoria))
+        departamento = nombres.map(traducciones)
+
+        fechas_texto = bloque[columna_fecha]
+        categorias_fecha = fechas_texto.cat.categories
+        fechas_unicas = pd.to_datetime(pd.Series(categorias_fecha), format=formato_fecha,
+                                       dayfirst=True, errors='coerce').dt.normalize()
+        fecha = fechas_texto.map(dict(zip(categorias_fecha, fechas_unicas)))
+
+        validos = departamento.notna() & fecha.notna()
+        descartadas += int((~validos).sum())
+
+        conteo = (
+            pd.DataFrame({'Departamento': departamento[validos].astype(str), 'fecha': fecha[validos]})
+            .groupby(['Departamento', 'fecha'], observed=True)
+            .size()
+        )
+        acumulado = conteo if acumulado is None else acumulado.add(conteo, fill_value=0)
+
+    if acumulado is None:
+        diarios = pd.DataFrame(columns=['Departamento', 'fecha', 'casos'])
+    else:
+        diarios = acumulado.astype('int64').rename('casos').reset_index()
+    return compactar_diarios(diarios), descartadas
+
+COLUMNAS_DIARIOS = ['Departamento', 'fecha', 'casos']
+
+def compactar_diarios(diarios, origen='los casos diarios'):
+    """Casos diarios validados, con los departamentos como categorías y los casos en el entero más pequeño"""
+    validar_tabla(diarios, origen, COLUMNAS_DIARIOS, no_negativas=['casos'])
+    return compactar_tabla(diarios[COLUMNAS_DIARIOS], categoricas=['Departamento'])
+
+def guardar_cache(diarios, ruta_cache):
+    """Guarda los casos diarios agregados en formato Parquet"""
+    directorio = os.path.dirname(ruta_cache)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    ruta_temporal = ruta_cache + '.tmp'
+    # Con los tipos compactos el Parquet guarda los departamentos como diccionario
+    # y al leerlo pandas los recupera como categorías, sin pasar por strings
+    compactar_diarios(diarios).to_parquet(ruta_temporal, index=False)
+    # Reemplazo atómico para que un worker nunca lea un archivo a medio escribir
+    os.replace(ruta_temporal, ruta_cache)
+
+def cargar_cache(ruta_cache):
+    """Carga y valida los casos diarios (Departamento, fecha, casos) desde la caché Parquet"""
+    return compactar_diarios(pd.read_parquet(ruta_cache), ruta_cache)
+
+# =============================================================================
+# EJECUCIÓN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Agrega el archivo nacional de casos a una caché Parquet")
+    parser.add_argument('csv', help="Ruta al CSV de casos positivos")
+    parser.add_argument('--salida', default=os.environ.get('DASHBOARD_DATOS_CACHE', 'cache/casos_diarios.parquet'))
+    parser.add_argument('--bloque', type=int, default=500000, help="Filas por bloque de lectura")
+    parser.add_argument('--columna-departamento', default=COLUMNA_DEPARTAMENTO)
+    parser.add_argument('--columna-fecha', default=COLUMNA_FECHA)
+    parser.add_argument('--formato-fecha', default='mixed')
+    parser.add_argument('--encoding', default='utf-8')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    diarios, descartadas = ingerir_csv(
+        args.csv, NOMBRES_DEPARTAMENTOS,
+        tamano_bloque=args.bloque,
+        columna_departamento=args.columna_departamento,
+        columna_fecha=args.columna_fecha,
+        formato_fecha=args.formato_fecha,
+        encoding=args.encoding
+    )
+    guardar_cache(diarios, args.salida)
+
+    print(f"{int(diarios['casos'].sum()):,} casos agregados en {len(diarios):,} filas "
+          f"({descartadas:,} descartadas) -> {args.salida} en {time.perf_counter() - inicio:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import copy
+
+from arranque import ModuloDiferido
+
+np = ModuloDiferido('numpy')
+
+# =============================================================================
+# AGREGADOS DE LOS KPIS POR PARTICIÓN
+# =============================================================================
+
+class AgregadosKPI:
+    """Sumas de casos por día, población y departamentos de cada partición.
+
+    Los casos se guardan como suma prefija por partición (con una columna
+    inicial de ceros), así los KPIs de cualquier rango de fechas y conjunto de
+    particiones salen de unas pocas restas, sin recorrer los departamentos ni
+    los días. Los lotes de casos nuevos se suman como deltas.
+
+    Si cada fila es su propia partición (un agregado por departamento) el
+    acumulado recibido se usa tal cual, sin copiarlo, hasta que llegue un
+    lote de casos.
+    """
+
+    def __init__(self, particiones, acumulado, poblacion):
+        particiones = np.asarray(particiones, dtype=object).tolist()
+        self._compartido = len(set(particiones)) == len(particiones)
+        self.nombres = particiones if self._compartido else sorted(set(particiones))
+        self._posicion = {nombre: i for i, nombre in enumerate(self.nombres)}
+        codigos = np.array([self._posicion[p] for p in particiones], dtype=np.int64)
+
+        if self._compartido:
+            self.acumulado = acumulado
+        else:
+            self.acumulado = np.zeros((len(self.nombres), acumulado.shape[1]), dtype=np.int64)
+            np.add.at(self.acumulado, codigos, np.asarray(acumulado))
+        self.poblacion = np.bincount(codigos, weights=np.asarray(poblacion, dtype=np.float64),
+                                     minlength=len(self.nombres))
+        self.departamentos = np.bincount(codigos, minlength=len(self.nombres))
+
+    @property
+    def n_dias(self):
+        return self.acumulado.shape[1] - 1
+
+    def _filas(self, particiones):
+        if particiones is None:
+            return slice(None)
+        return [self._posicion[p] for p in particiones if p in self._posicion]
+
+    def totales(self, rango=None, particiones=None):
+        """Casos, población, departamentos e incidencia ponderada de las particiones en un rango"""
+        inicio, fin = rango if rango is not None else (0, self.n_dias - 1)
+        filas = self._filas(particiones)
+        casos = int((self.acumulado[filas, fin + 1] - self.acumulado[filas, inicio]).sum())
+        poblacion = int(self.poblacion[filas].sum())
+        return {
+            'casos': casos,
+            'poblacion': poblacion,
+            'departamentos': int(self.departamentos[filas].sum()),
+            'incidencia': casos / poblacion * 100000 if poblacion else 0.0,
+        }
+
+    def copia(self):
+        """Copia que comparte los arreglos; el primer lote de casos que reciba copia su acumulado"""
+        copia = copy.copy(self)
+        copia._compartido = True
+        return copia
+
+    def agregar_casos(self, particiones, dias, casos, n_dias=None):
+        """Suma un lote de casos (partición, índice de día, casos) sin recorrer los datos previos.
+
+        Los días posteriores al último conocido amplían el acumulado; con
+        `n_dias` llega al menos a esa cantidad de días aunque el lote no traiga
+        casos en los últimos.
+        """
+        codigos = np.array([self._posicion[p] for p in particiones], dtype=np.int64)
+        dias = np.asarray(dias, dtype=np.int64)
+        if self._compartido:
+            # El acumulado es el del cubo (quizás mapeado desde un snapshot) o el del
+            # agregado del que se copió: se copia antes de modificarlo
+            self.acumulado = np.array(self.acumulado, dtype=np.int64)
+            self._compartido = False
+        nuevos_dias = max(int(dias.max()) + 1 if len(dias) else 0, n_dias or 0) - self.n_dias
+        if nuevos_dias > 0:
+            extension = np.repeat(self.acumulado[:, -1:], nuevos_dias, axis=1)
+            self.acumulado = np.concatenate([self.acumulado, extension], axis=1)
+
+        delta = np.zeros((len(self.nombres), self.n_dias), dtype=np.int64)
+        np.add.at(delta, (codigos, dias), np.asarray(casos, dtype=np.int64))
+        # Un caso del día d suma en todas las columnas del acumulado desde d + 1
+        self.acumulado[:, 1:] += np.cumsum(delta, axis=1)
@@ -0,0 +1,199 @@
+import contextvars
+import functools
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+
+# Prometheus y el perfilador por muestreo son opcionales
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# =============================================================================
+# INSTRUMENTACIÓN DE CALLBACKS
+# =============================================================================
+
+# Fases de un callback: selección de datos, construcción de figuras y serialización
+FASES = ('seleccion', 'figuras', 'serializacion')
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BUCKETS_BYTES = (1000, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000, 5000000)
+
+if prometheus_client is not None:
+    DURACION_CALLBACK = prometheus_client.Histogram(
+        'dashboard_callback_segundos', "Duración total de cada callback",
+        ['callback'], buckets=BUCKETS_SEGUNDOS
+    )
+    DURACION_FASE = prometheus_client.Histogram(
+        'dashboard_callback_fase_segundos', "Duración de cada fase de un callback",
+        ['callback', 'fase'], buckets=BUCKETS_SEGUNDOS
+    )
+    TAMANO_RESPUESTA = prometheus_client.Histogram(
+        'dashboard_callback_respuesta_bytes', "Bytes de la respuesta sin comprimir",
+        ['callback'], buckets=BUCKETS_BYTES
+    )
+    CACHE_FIGURAS = prometheus_client.Counter(
+        'dashboard_cache_figuras_total', "Consultas a la caché de figuras", ['resultado']
+    )
+
+# Fases del trabajo en curso en un proceso del pool, donde no hay petición
+_fases_trabajo = contextvars.ContextVar('fases_trabajo', default=None)
+
+def registrar_fase(fase, segundos):
+    """Suma tiempo a una fase de la petición o del trabajo en curso (fuera de ambos no hace nada)"""
+    # El trabajo va primero: un proceso del pool creado con fork durante una
+    # petición conserva el contexto de esa petición
+    fases = _fases_trabajo.get()
+    if fases is None:
+        if not has_request_context():
+            return
+        fases = g.setdefault('fases_callback', {})
+    fases[fase] = fases.get(fase, 0.0) + segundos
+
+@contextmanager
+def medir_fase(fase):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_fase(fase, time.perf_counter() - inicio)
+
+class Cronometro:
+    """Mide fases consecutivas sin anidar bloques: cada marca cierra la fase anterior"""
+
+    def __init__(self):
+        self._inicio = time.perf_counter()
+
+    def fase(self, nombre):
+        ahora = time.perf_counter()
+        registrar_fase(nombre, ahora - self._inicio)
+        self._inicio = ahora
+
+def registrar_cache(acierto):
+    if prometheus_client is not None:
+        CACHE_FIGURAS.labels('acierto' if acierto else 'fallo').inc()
+
+def instrumentar(funcion):
+    """Marca la petición con el nombre del callback y el momento en que devolvió su resultado.
+
+    Lo que pasa entre ese momento y el after_request es la serialización de Dash.
+    """
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if has_request_context():
+            g.callback_actual = funcion.__name__
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            if has_request_context():
+                g.fin_callback = time.perf_counter()
+    return envoltura
+
+def instrumentar_trabajo(funcion):
+    """Como instrumentar, para un callback en segundo plano que corre en un proceso del pool.
+
+    Sin petición no hay serialización que medir: se registran la duración del
+    trabajo y sus fases. Las métricas de los procesos del pool solo llegan a
+    /metrics con PROMETHEUS_MULTIPROC_DIR.
+    """
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        token = _fases_trabajo.set({})
+        perfilador = iniciar_perfil()
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            segundos = time.perf_counter() - inicio
+            observar(funcion.__name__, segundos, _fases_trabajo.get())
+            terminar_perfil(perfilador, funcion.__name__, segundos)
+            _fases_trabajo.reset(token)
+    return envoltura
+
+# =============================================================================
+# ENDPOINT /metrics Y PERFILES DE PETICIONES LENTAS
+# =============================================================================
+
+# Perfilado por muestreo; lo fija instalar() y los procesos del pool lo heredan
+_perfilado = {'muestreo': 0.0, 'umbral': 0.5, 'directorio': None}
+
+def observar(callback, segundos, fases):
+    if prometheus_client is not None:
+        DURACION_CALLBACK.labels(callback).observe(segundos)
+        for fase, duracion in fases.items():
+            DURACION_FASE.labels(callback, fase).observe(duracion)
+
+def iniciar_perfil():
+    """Perfilador en marcha para esta fracción de los callbacks, o None"""
+    if Profiler is None or not _perfilado['directorio'] or random.random() >= _perfilado['muestreo']:
+        return None
+    perfilador = Profiler(interval=0.001)
+    perfilador.start()
+    return perfilador
+
+def terminar_perfil(perfilador, callback, segundos):
+    """Detiene el perfilador y guarda el perfil si el callback superó el umbral"""
+    if perfilador is None:
+        return
+    perfilador.stop()
+    if segundos >= _perfilado['umbral']:
+        os.makedirs(_perfilado['directorio'], exist_ok=True)
+        nombre = f"{time.strftime('%Y%m%d-%H%M%S')}-{callback}-{int(segundos * 1000)}ms.html"
+        with open(os.path.join(_perfilado['directorio'], nombre), 'w', encoding='utf-8') as archivo:
+            archivo.write(perfilador.output_html())
+
+def instalar(server, ruta='/metrics', directorio_perfiles=None, umbral_perfil=0.5, muestreo_perfil=0.0):
+    """Registra los hooks de medición y la ruta de métricas en el servidor Flask.
+
+    Con muestreo_perfil > 0 (y pyinstrument instalado) se perfila esa fracción
+    de los callbacks y se guardan en directorio_perfiles los que superen
+    umbral_perfil segundos.
+    """
+    _perfilado.update(muestreo=muestreo_perfil, umbral=umbral_perfil, directorio=directorio_perfiles)
+
+    @server.before_request
+    def iniciar_medicion():
+        if not request.path.endswith('_dash-update-component'):
+            return
+        g.inicio_peticion = time.perf_counter()
+        g.perfilador = iniciar_perfil()
+
+    @server.after_request
+    def terminar_medicion(respuesta):
+        inicio = g.get('inicio_peticion')
+        if inicio is None:
+            return respuesta
+        ahora = time.perf_counter()
+        callback = g.get('callback_actual', 'desconocido')
+
+        fin_callback = g.get('fin_callback')
+        if fin_callback is not None:
+            registrar_fase('serializacion', ahora - fin_callback)
+
+        observar(callback, ahora - inicio, g.get('fases_callback', {}))
+        if prometheus_client is not None and not respuesta.direct_passthrough:
+            TAMANO_RESPUESTA.labels(callback).observe(len(respuesta.get_data()))
+        terminar_perfil(g.get('perfilador'), callback, ahora - inicio)
+        return respuesta
+
+    @server.route(ruta)
+    def metricas():
+        if prometheus_client is None:
+            return Response("prometheus_client no está instalado\n", status=503, mimetype='text/plain')
+        # Con gunicorn y PROMETHEUS_MULTIPROC_DIR se agregan las métricas de todos los workers
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registro = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registro)
+        else:
+            registro = prometheus_client.REGISTRY
+        return Response(prometheus_client.generate_latest(registro), mimetype=prometheus_client.CONTENT_TYPE_LATEST)
@@ -0,0 +1,146 @@
+import threading
+
+from arranque import ModuloDiferido
+from compacto import compactar_tabla, reducir_flotantes, validar_tabla
+
+np = ModuloDiferido('numpy')
+pd = ModuloDiferido('pandas')
+
+# =============================================================================
+# MUNICIPIOS AGRUPADOS EN UNA REJILLA SEGÚN EL ZOOM
+# =============================================================================
+
+COLUMNAS_MUNICIPIOS = ['Municipio', 'Departamento', 'Latitud', 'Longitud', 'casos', 'poblacion']
+
+# Celdas de la rejilla por cada tesela de 256 px: 8 equivale a celdas de unos 32 px
+CELDAS_POR_TESELA = 8
+# A partir de este zoom cada municipio se muestra por separado
+ZOOM_SIN_AGRUPAR = 11
+
+def cargar_municipios(ruta):
+    """Tabla de municipios (CSV o Parquet) con sus centroides, casos y población.
+
+    Se valida al cargarla y queda compacta: departamentos como categorías,
+    centroides en float32 y conteos en el entero más pequeño que los contiene.
+    """
+    if ruta.endswith('.parquet'):
+        df = pd.read_parquet(ruta)
+    else:
+        df = pd.read_csv(ruta, dtype={'Departamento': 'category'})
+    faltantes = [c for c in COLUMNAS_MUNICIPIOS if c not in df.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en {ruta}: {', '.join(faltantes)}")
+    df = df[COLUMNAS_MUNICIPIOS].dropna(subset=['Latitud', 'Longitud']).reset_index(drop=True)
+    validar_tabla(df, ruta, COLUMNAS_MUNICIPIOS, no_negativas=['casos', 'poblacion'],
+                  rangos={'Latitud': (-90, 90), 'Longitud': (-180, 180)})
+    return compactar_tabla(df, categoricas=['Departamento'], flotantes=['Latitud', 'Longitud'])
+
+def limites_vista(relayout, centro=(4.6, -74.0), zoom=4.2, ancho_px=800, alto_px=500):
+    """Zoom y rectángulo visible (lat_min, lat_max, lon_min, lon_max) a partir de relayoutData"""
+    relayout = relayout or {}
+    zoom = relayout.get('mapbox.zoom', zoom)
+
+    derivado = relayout.get('mapbox._derived') or {}
+    esquinas = derivado.get('coordinates')
+    if esquinas:
+        lons = [p[0] for p in esquinas]
+        lats = [p[1] for p in esquinas]
+        return zoom, (min(lats), max(lats), min(lons), max(lons))
+
+    # Sin esquinas se estima la vista desde el centro y el zoom
+    centro_vista = relayout.get('mapbox.center') or {'lat': centro[0], 'lon': centro[1]}
+    grados_por_px = 360.0 / (256 * 2 ** zoom)
+    medio_ancho = ancho_px * grados_por_px / 2
+    medio_alto = alto_px * grados_por_px / 2
+    return zoom, (centro_vista['lat'] - medio_alto, centro_vista['lat'] + medio_alto,
+                  centro_vista['lon'] - medio_ancho, centro_vista['lon'] + medio_ancho)
+
+class RejillaMunicipios:
+    """Agrupa los municipios en celdas cuadradas cuyo tamaño depende del zoom.
+
+    Las celdas de cada nivel de zoom se calculan una vez y se guardan; una
+    consulta solo filtra las celdas del nivel dentro de la vista, y si son
+    más que el máximo permitido baja a niveles más gruesos.
+
+    Las columnas se guardan en float32 mientras los conteos sean exactos;
+    las celdas de una consulta, que son pocas, salen en float64.
+    """
+
+    def __init__(self, df, max_marcadores=500):
+        self.df = df
+        self.max_marcadores = max_marcadores
+        self._lat = reducir_flotantes(df['Latitud'].to_numpy())
+        self._lon = reducir_flotantes(df['Longitud'].to_numpy())
+        self._casos = reducir_flotantes(df['casos'].to_numpy(), enteros=True)
+        self._poblacion = reducir_flotantes(df['poblacion'].to_numpy(), enteros=True)
+        self._niveles = {}
+        self._lock = threading.Lock()
+
+    def nivel(self, zoom):
+        """Celdas de un nivel de zoom entero: centroides ponderados, casos, población y municipios"""
+        zoom = int(min(max(zoom, 0), ZOOM_SIN_AGRUPAR))
+        with self._lock:
+            celdas = self._niveles.get(zoom)
+        if celdas is not None:
+            return celdas
+
+        if zoom >= ZOOM_SIN_AGRUPAR:
+            celdas = {
+                'lat': self._lat,
+                'lon': self._lon,
+                'casos': self._casos,
+                'poblacion': self._poblacion,
+                'municipios': np.ones(len(self._lat), dtype=np.int64),
+                'nombre': self.df['Municipio'].astype(str).to_numpy(),
+            }
+        else:
+            tamano = 360.0 / (2 ** zoom * CELDAS_POR_TESELA)
+            fila = np.floor(self._lat / tamano).astype(np.int64)
+            columna = np.floor(self._lon / tamano).astype(np.int64)
+            _, grupo = np.unique(np.stack([fila, columna], axis=1), axis=0, return_inverse=True)
+            grupo = grupo.ravel()
+
+            municipios = np.bincount(grupo)
+            _, primero = np.unique(grupo, return_index=True)
+            nombres = self.df['Municipio'].astype(str).to_numpy()[primero]
+            # Centroide ponderado por casos para que el marcador caiga donde están los casos
+            peso = self._casos + 1
+            suma_peso = np.bincount(grupo, weights=peso)
+            celdas = {
+                'lat': np.bincount(grupo, weights=self._lat * peso) / suma_peso,
+                'lon': np.bincount(grupo, weights=self._lon * peso) / suma_peso,
+                'casos': np.bincount(grupo, weights=self._casos),
+                'poblacion': np.bincount(grupo, weights=self._poblacion),
+                'municipios': municipios,
+                'nombre': np.array([nombre if n == 1 else f"{n} municipios"
+                                    for nombre, n in zip(nombres, municipios)], dtype=object),
+            }
+
+        with self._lock:
+            self._niveles[zoom] = celdas
+        return celdas
+
+    def consultar(self, zoom, limites):
+        """Celdas visibles para un zoom y una vista, nunca más de max_marcadores"""
+        lat_min, lat_max, lon_min, lon_max = limites
+        nivel = int(min(max(zoom, 0), ZOOM_SIN_AGRUPAR))
+        while True:
+            celdas = self.nivel(nivel)
+            visibles = ((celdas['lat'] >= lat_min) & (celdas['lat'] <= lat_max) &
+                        (celdas['lon'] >= lon_min) & (celdas['lon'] <= lon_max))
+            if visibles.sum() <= self.max_marcadores or nivel == 0:
+                break
+            nivel -= 1
+
+        resultado = {clave: valores[visibles].astype(np.float64) if valores.dtype == np.float32 else valores[visibles]
+                     for clave, valores in celdas.items()}
+        if len(resultado['casos']) > self.max_marcadores:
+            # Solo ocurre en el nivel 0: se conservan las celdas con más casos
+            orden = np.argsort(resultado['casos'])[::-1][:self.max_marcadores]
+            resultado = {clave: valores[orden] for clave, valores in resultado.items()}
+        resultado['nivel'] = nivel
+        return resultado
+
+    def limpiar(self):
+        with self._lock:
+            self._niveles.clear()
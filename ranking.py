@@ -0,0 +1,135 @@
+from arranque import ModuloDiferido
+
+np = ModuloDiferido('numpy')
+
+# =============================================================================
+# RANKING TOP-N CON ÍNDICES ORDENADOS
+# =============================================================================
+
+def top_de_valores(valores, n, filas=None):
+    """Posiciones de los n mayores valores, de mayor a menor, sin ordenar todo el arreglo.
+
+    Con `filas` solo se consideran esas posiciones. Los empates se resuelven
+    por posición, igual que en los índices ordenados.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    filas = np.arange(len(valores)) if filas is None else np.asarray(filas, dtype=np.int64)
+    if n <= 0 or len(filas) == 0:
+        return filas[:0]
+    candidatos = valores[filas]
+    if n < len(filas):
+        # El umbral es el n-ésimo valor; se conservan todos los empatados con él
+        # para que el desempate por posición sea el mismo que en un orden completo
+        umbral = np.partition(candidatos, len(candidatos) - n)[len(candidatos) - n]
+        seleccion = candidatos >= umbral
+        filas, candidatos = filas[seleccion], candidatos[seleccion]
+    orden = np.lexsort((filas, -candidatos))[:n]
+    return filas[orden]
+
+class IndiceRanking:
+    """Filas ordenadas de mayor a menor por cada métrica y cada partición.
+
+    Un top-N sobre una o varias particiones sale de los primeros N de cada
+    índice, sin ordenar la tabla. Agregar filas o cambiar sus valores las
+    inserta en su lugar con búsqueda binaria en vez de reconstruir los índices.
+    """
+
+    def __init__(self, valores, particiones):
+        self.valores = {metrica: np.asarray(v, dtype=np.float64) for metrica, v in valores.items()}
+        self.particiones = np.asarray(particiones, dtype=object)
+        self._indices = {}
+        for metrica, valores_metrica in self.valores.items():
+            for particion in self.nombres_particiones():
+                filas = np.flatnonzero(self.particiones == particion)
+                orden = np.lexsort((filas, -valores_metrica[filas]))
+                self._indices[(metrica, particion)] = filas[orden]
+
+    @classmethod
+    def desde_tabla(cls, df, metricas, particion):
+        """Índice sobre columnas de un DataFrame; `particion` es una Serie o arreglo de etiquetas"""
+        return cls({metrica: df[metrica].to_numpy() for metrica in metricas}, particion)
+
+    def __len__(self):
+        return len(self.particiones)
+
+    def nombres_particiones(self):
+        return sorted(set(self.particiones.tolist()))
+
+    def filas(self, particiones=None):
+        """Posiciones de las filas de las particiones indicadas (todas con None)"""
+        if particiones is None:
+            return np.arange(len(self))
+        return np.flatnonzero(np.isin(self.particiones, list(particiones)))
+
+    def top(self, metrica, n, particiones=None, valores=None):
+        """Posiciones de las n filas con mayor valor de la métrica dentro de las particiones.
+
+        Con `valores` (por ejemplo, los casos de un rango de fechas) los índices
+        guardados no sirven y se hace una selección parcial sobre las filas.
+        """
+        if valores is not None:
+            return top_de_valores(valores, n, None if particiones is None else self.filas(particiones))
+
+        nombres = self.nombres_particiones() if particiones is None else list(particiones)
+        primeros = [self._indices[(metrica, p)][:n] for p in nombres if (metrica, p) in self._indices]
+        if not primeros:
+            return np.array([], dtype=np.int64)
+        if len(primeros) == 1:
+            return primeros[0]
+        # Mezcla de los primeros n de cada partición: como mucho n por partición
+        return top_de_valores(self.valores[metrica], n, np.concatenate(primeros))
+
+    def copia(self):
+        """Copia independiente: agregar o actualizar filas en ella no cambia este índice"""
+        copia = IndiceRanking.__new__(IndiceRanking)
+        copia.valores = dict(self.valores)
+        copia.particiones = self.particiones
+        copia._indices = dict(self._indices)
+        return copia
+
+    def _insertar(self, metrica, particion, filas):
+        """Inserta filas (que no están en el índice) en su lugar, con el mismo desempate por posición.
+
+        Cada posición del índice se compara como (grupo de su valor, fila): el
+        grupo es el inicio de los empatados con su valor y una fila nueva sin
+        empatados va antes del grupo siguiente, así basta una búsqueda binaria.
+        """
+        valores = -self.valores[metrica]
+        filas = filas[np.lexsort((filas, valores[filas]))]
+        indice = self._indices.get((metrica, particion), np.array([], dtype=np.int64))
+        ordenados = valores[indice]
+        total = len(self)
+        inicio_grupo = np.searchsorted(ordenados, ordenados, side='left')
+        claves = 2 * (inicio_grupo * total + indice)
+        izquierda = np.searchsorted(ordenados, valores[filas], side='left')
+        derecha = np.searchsorted(ordenados, valores[filas], side='right')
+        claves_nuevas = np.where(izquierda < derecha, 2 * (izquierda * total + filas), 2 * izquierda * total - 1)
+        posiciones = np.searchsorted(claves, claves_nuevas)
+        self._indices[(metrica, particion)] = np.insert(indice, posiciones, filas)
+
+    def agregar(self, valores, particiones):
+        """Agrega filas al final de la tabla y las inserta en los índices ordenados"""
+        particiones = np.asarray(particiones, dtype=object)
+        inicio = len(self)
+        nuevas = np.arange(inicio, inicio + len(particiones))
+        self.particiones = np.concatenate([self.particiones, particiones])
+        for metrica in self.valores:
+            self.valores[metrica] = np.concatenate([self.valores[metrica], np.asarray(valores[metrica], dtype=np.float64)])
+            for particion in set(particiones.tolist()):
+                self._insertar(metrica, particion, nuevas[particiones == particion])
+
+    def actualizar(self, filas, valores):
+        """Cambia los valores de filas existentes y las mueve a su nuevo lugar en los índices"""
+        filas = np.asarray(filas, dtype=np.int64)
+        marcadas = np.zeros(len(self), dtype=bool)
+        marcadas[filas] = True
+        particiones = self.particiones[filas]
+        for metrica in self.valores:
+            # Arreglo nuevo: las copias del índice pueden compartir el anterior
+            nuevos = self.valores[metrica].copy()
+            nuevos[filas] = np.asarray(valores[metrica], dtype=np.float64)
+            self.valores[metrica] = nuevos
+            for particion in set(particiones.tolist()):
+                indice = self._indices[(metrica, particion)]
+                self._indices[(metrica, particion)] = indice[~marcadas[indice]]
+                self._insertar(metrica, particion, filas[particiones == particion])
@@ -0,0 +1,295 @@
+import argparse
+import hashlib
+import html
+import json
+import os
+import time
+import zipfile
+
+import plotly
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from arranque import pool_procesos
+
+# =============================================================================
+# REPORTES ESTÁTICOS POR LOTES
+# =============================================================================
+
+# Imágenes (PNG, SVG, PDF) del mapa y del top-N de la vista nacional y una
+# página por departamento, construidas con las mismas funciones que el
+# dashboard. Se renderizan en un pool de procesos, cada uno con su propio
+# renderizador (kaleido) ya arrancado, y una figura cuyo contenido no cambió
+# desde la corrida anterior no se vuelve a renderizar.
+#
+#   index.html                                   vista nacional y enlaces a los departamentos
+#   nacional/<tipo>-mapa.<formato>               mapa de cada visualización
+#   nacional/<tipo>-top.<formato>                top-N de cada visualización
+#   departamentos/<departamento>.html            página del departamento
+#   departamentos/<departamento>-mapa.<formato>  mapa centrado en el departamento
+#   departamentos/<departamento>-serie.<formato> casos diarios y promedio de 7 días
+#   manifiesto.json                              versión y huella de cada imagen
+#
+# Al terminar, el directorio se empaqueta en <destino>.zip.
+
+FORMATOS = ('png', 'svg', 'pdf')
+ANCHO, ALTO = 1000, 600
+# Zoom del mapa en la página de un departamento
+ZOOM_DEPARTAMENTO = 6
+
+# GeoJSON de los departamentos en cada proceso del pool; lo fija el inicializador
+_geometria = None
+
+def iniciar_renderizador(geojson):
+    """Inicializador del pool: guarda la geometría y arranca kaleido con una figura vacía"""
+    global _geometria
+    _geometria = json.loads(geojson) if geojson else None
+    pio.to_image(go.Figure(), format='png', width=10, height=10)
+
+def renderizar(trabajo):
+    ruta, texto, formato, escala = trabajo
+    figura = json.loads(texto)
+    # El dashboard referencia el GeoJSON por URL; el renderizador no tiene servidor de donde bajarlo
+    for traza in figura['data']:
+        if isinstance(traza.get('geojson'), str) and _geometria is not None:
+            traza['geojson'] = _geometria
+    imagen = pio.to_image(figura, format=formato, width=ANCHO, height=ALTO, scale=escala, validate=False)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, 'wb') as archivo:
+        archivo.write(imagen)
+    return len(imagen)
+
+def preparar_mapa(texto, mapa_base, teselas=None, centro=None):
+    """Figura del mapa sin las teselas de la app (el renderizador no las alcanza), opcionalmente centrada"""
+    figura = json.loads(texto)
+    mapbox = figura['layout'].setdefault('mapbox', {})
+    mapbox['style'] = mapa_base
+    mapbox.pop('layers', None)
+    if teselas:
+        mapbox['style'] = 'white-bg'
+        mapbox['layers'] = [{'below': 'traces', 'sourcetype': 'raster', 'source': [teselas],
+                             'sourceattribution': '© OpenStreetMap contributors'}]
+    if centro is not None:
+        mapbox['center'] = {'lat': centro[0], 'lon': centro[1]}
+        mapbox['zoom'] = ZOOM_DEPARTAMENTO
+    figura['layout'].pop('uirevision', None)
+    return figura
+
+def construir_serie(posicion, departamento):
+    """Casos diarios y promedio móvil de 7 días de un departamento"""
+    import numpy as np
+    import app
+
+    cubo = app.datos_actuales().cubo
+    diarios = np.diff(np.asarray(cubo.acumulado[posicion], dtype=np.int64))
+    promedio = app.metricas_epidemiologicas().valores['promedio_7d'][posicion].astype(np.float64).round(1)
+    fechas = cubo.fechas
+    figura = go.Figure([
+        go.Bar(x=fechas, y=diarios, name='Casos diarios', marker_color='#9ecae1'),
+        go.Scatter(x=fechas, y=promedio, name='Promedio 7 días', mode='lines', line=dict(color='#08519c', width=2)),
+    ])
+    figura.update_layout(
+        title=f"Casos diarios en {departamento}",
+        template='plotly_white',
+        bargap=0,
+        legend=dict(orientation='h', y=1.02, yanchor='bottom', x=1, xanchor='right'),
+        margin={'r': 20, 't': 60, 'l': 60, 'b': 40}
+    )
+    return json.loads(pio.to_json(figura, validate=False))
+
+def figuras_reporte(tipos, n_top, tipo_departamentos, mapa_base, teselas):
+    """{ruta sin extensión: figura} de la vista nacional y de cada departamento"""
+    import app
+
+    figuras = {}
+    for tipo in tipos:
+        mapa, top = app.obtener_figuras_serializadas(tipo, None, n_top)
+        figuras[f'nacional/{tipo}-mapa'] = preparar_mapa(mapa, mapa_base, teselas)
+        figuras[f'nacional/{tipo}-top'] = json.loads(top)
+
+    for posicion, fila in enumerate(app.datos_actuales().df.itertuples(index=False)):
+        departamento = fila.Departamento
+        nombre = nombre_archivo(departamento)
+        mapa, _ = app.obtener_figuras_serializadas(tipo_departamentos, None, n_top, None, (departamento,))
+        figuras[f'departamentos/{nombre}-mapa'] = preparar_mapa(mapa, mapa_base, teselas,
+                                                               (fila.Latitud, fila.Longitud))
+        figuras[f'departamentos/{nombre}-serie'] = construir_serie(posicion, departamento)
+    return figuras
+
+def nombre_archivo(departamento):
+    from ingesta import normalizar_nombre
+
+    return normalizar_nombre(departamento).lower().replace(' ', '-')
+
+def huella(texto, formato, escala):
+    """Huella de todo lo que determina la imagen: la figura, el formato, el tamaño y las versiones"""
+    contenido = f'{formato}|{ANCHO}x{ALTO}@{escala}|{plotly.__version__}|'.encode('utf-8') + texto.encode('utf-8')
+    return hashlib.sha1(contenido).hexdigest()
+
+def cargar_manifiesto(destino):
+    try:
+        with open(os.path.join(destino, 'manifiesto.json'), encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+# =============================================================================
+# PÁGINAS
+# =============================================================================
+
+PLANTILLA = """<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><title>{titulo}</title>
+<style>body{{font-family:sans-serif;margin:2em;color:#333}}img{{max-width:100%;border:1px solid #eee}}
+ul.departamentos{{columns:3}}.formatos a{{margin-right:1em}}</style></head>
+<body>
+{cuerpo}
+</body>
+</html>
+"""
+
+def figura_html(nombre, formatos, titulo):
+    """Imagen de la figura (SVG o PNG) con enlaces a todos sus formatos; nombre relativo a la página"""
+    partes = [f'<h3>{html.escape(titulo)}</h3>']
+    visible = next((formato for formato in ('svg', 'png') if formato in formatos), None)
+    if visible is not None:
+        partes.append(f'<img src="{nombre}.{visible}" alt="{html.escape(titulo)}">')
+    enlaces = ' '.join(f'<a href="{nombre}.{formato}">{formato.upper()}</a>' for formato in formatos)
+    partes.append(f'<p class="formatos">{enlaces}</p>')
+    return '\n'.join(partes)
+
+def escribir_paginas(destino, tipos, tipo_departamentos, formatos):
+    import app
+
+    datos = app.datos_actuales()
+    etiquetas = {opcion['value']: opcion['label'] for opcion in app.OPCIONES_VISUALIZACION}
+    generado = time.strftime('%Y-%m-%d %H:%M')
+    fechas = datos.cubo.fechas
+
+    cuerpo = [f'<h1>{html.escape(app.app.title)}</h1>',
+              f'<p>Datos del {fechas[0]:%Y-%m-%d} al {fechas[-1]:%Y-%m-%d} (versión {datos.version}), '
+              f'generado el {generado}</p>', '<h2>Vista nacional</h2>']
+    for tipo in tipos:
+        cuerpo.append(figura_html(f'nacional/{tipo}-mapa', formatos, etiquetas.get(tipo, tipo)))
+        cuerpo.append(figura_html(f'nacional/{tipo}-top', formatos, f"Top departamentos: {etiquetas.get(tipo, tipo)}"))
+    cuerpo.append('<h2>Departamentos</h2><ul class="departamentos">')
+    for departamento in datos.df['Departamento']:
+        cuerpo.append(f'<li><a href="departamentos/{nombre_archivo(departamento)}.html">'
+                      f'{html.escape(departamento)}</a></li>')
+    cuerpo.append('</ul>')
+    with open(os.path.join(destino, 'index.html'), 'w', encoding='utf-8') as archivo:
+        archivo.write(PLANTILLA.format(titulo=html.escape(app.app.title), cuerpo='\n'.join(cuerpo)))
+
+    for fila in datos.df.itertuples(index=False):
+        nombre = nombre_archivo(fila.Departamento)
+        cuerpo = [
+            '<p><a href="../index.html">Vista nacional</a></p>',
+            f'<h1>{html.escape(fila.Departamento)}</h1>',
+            f'<p>{int(fila.casos):,} casos, {int(fila.poblacion):,} habitantes, '
+            f'{fila.incidencia:,.1f} casos por 100.000 habitantes</p>',
+            figura_html(f'{nombre}-mapa', formatos, etiquetas.get(tipo_departamentos, tipo_departamentos)),
+            figura_html(f'{nombre}-serie', formatos, 'Casos diarios'),
+        ]
+        with open(os.path.join(destino, 'departamentos', f'{nombre}.html'), 'w', encoding='utf-8') as archivo:
+            archivo.write(PLANTILLA.format(titulo=html.escape(fila.Departamento), cuerpo='\n'.join(cuerpo)))
+
+def empaquetar(destino):
+    """Comprime el directorio del reporte en <destino>.zip"""
+    ruta_zip = os.path.normpath(destino) + '.zip'
+    temporal = ruta_zip + '.tmp'
+    with zipfile.ZipFile(temporal, 'w', zipfile.ZIP_DEFLATED) as paquete:
+        for raiz, _, nombres in os.walk(destino):
+            for nombre in sorted(nombres):
+                ruta = os.path.join(raiz, nombre)
+                paquete.write(ruta, os.path.relpath(ruta, destino))
+    os.replace(temporal, ruta_zip)
+    return ruta_zip
+
+# =============================================================================
+# EJECUCIÓN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el reporte estático del dashboard")
+    parser.add_argument('destino', help="Directorio del reporte; se reutiliza entre corridas")
+    parser.add_argument('--formatos', default=','.join(FORMATOS), help="Formatos separados por coma (png,svg,pdf)")
+    parser.add_argument('--tipos', help="Visualizaciones de la vista nacional separadas por coma (por defecto todas)")
+    parser.add_argument('--tipo-departamentos', default='incidencia', help="Visualización del mapa de cada departamento")
+    parser.add_argument('--n-top', type=int, default=10)
+    parser.add_argument('--escala', type=float, default=1.0, help="Escala de las imágenes PNG")
+    parser.add_argument('--mapa-base', default='white-bg',
+                        help="Estilo de mapbox sin token (white-bg no necesita red)")
+    parser.add_argument('--teselas', help="URL absoluta de teselas {z}/{x}/{y} para el mapa base, "
+                                          "por ejemplo la de la app en /teselas/")
+    parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--forzar', action='store_true', help="Renderizar todo aunque no haya cambiado")
+    args = parser.parse_args()
+
+    try:
+        import kaleido  # noqa: F401
+    except ImportError:
+        raise SystemExit("Los reportes necesitan kaleido: pip install kaleido")
+
+    import app
+
+    app.esperar_datos()
+    if app.error_carga is not None:
+        raise SystemExit(f"Error al cargar los datos: {app.error_carga}")
+    version = app.datos_actuales().version
+
+    formatos = [formato for formato in args.formatos.split(',') if formato]
+    desconocidos = set(formatos) - set(FORMATOS)
+    if desconocidos:
+        raise SystemExit(f"Formatos no soportados: {', '.join(sorted(desconocidos))}")
+    tipos = args.tipos.split(',') if args.tipos else [opcion['value'] for opcion in app.opciones_visualizacion()]
+
+    inicio = time.perf_counter()
+    figuras = figuras_reporte(tipos, args.n_top, args.tipo_departamentos, args.mapa_base, args.teselas)
+    anterior = {} if args.forzar else cargar_manifiesto(args.destino).get('imagenes', {})
+
+    imagenes = {}
+    trabajos = []
+    for base, figura in figuras.items():
+        texto = json.dumps(figura, sort_keys=True, separators=(',', ':'))
+        for formato in formatos:
+            ruta = f'{base}.{formato}'
+            escala = args.escala if formato == 'png' else 1
+            imagenes[ruta] = huella(texto, formato, escala)
+            if anterior.get(ruta) == imagenes[ruta] and os.path.exists(os.path.join(args.destino, ruta)):
+                continue
+            trabajos.append((os.path.join(args.destino, ruta), texto, formato, escala))
+    print(f"{len(trabajos)} imágenes por renderizar, {len(imagenes) - len(trabajos)} sin cambios "
+          f"({time.perf_counter() - inicio:.1f} s preparando las figuras)")
+
+    if trabajos:
+        geometria = app.geometria_departamentos
+        geojson = geometria.geojson[app.NIVEL_GEOMETRIA] if geometria is not None else None
+        procesos = max(1, min(args.procesos, len(trabajos)))
+        # El renderizador recibe todo por initargs: no necesita heredar la app
+        with pool_procesos(procesos, initializer=iniciar_renderizador, initargs=(geojson,),
+                           heredar=False) as pool:
+            total = sum(pool.map(renderizar, trabajos))
+        print(f"{len(trabajos)} imágenes ({total / 1e6:.1f} MB) renderizadas con {procesos} procesos")
+
+    # Las imágenes de corridas anteriores que ya no forman parte del reporte se borran
+    for ruta in set(anterior) - set(imagenes):
+        try:
+            os.remove(os.path.join(args.destino, ruta))
+        except FileNotFoundError:
+            pass
+
+    os.makedirs(os.path.join(args.destino, 'departamentos'), exist_ok=True)
+    escribir_paginas(args.destino, tipos, args.tipo_departamentos, formatos)
+    manifiesto = {
+        'version': version,
+        'generado': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'imagenes': dict(sorted(imagenes.items())),
+    }
+    with open(os.path.join(args.destino, 'manifiesto.json'), 'w', encoding='utf-8') as archivo:
+        json.dump(manifiesto, archivo, indent=2, ensure_ascii=False)
+    ruta_zip = empaquetar(args.destino)
+    print(f"Reporte de la versión {version} en {args.destino} y {ruta_zip} "
+          f"en {time.perf_counter() - inicio:.1f} s")
+
+if __name__ == '__main__':
+    main()
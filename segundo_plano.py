@@ -0,0 +1,240 @@
+import functools
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+from dash import DiskcacheManager
+from dash.exceptions import PreventUpdate
+
+from arranque import pool_procesos
+
+# =============================================================================
+# CALLBACKS EN SEGUNDO PLANO CON UN POOL DE PROCESOS
+# =============================================================================
+
+# Dash ya sabe ejecutar callbacks en segundo plano: el navegador recibe un id
+# de trabajo, consulta el resultado cada `interval` ms y, si el usuario vuelve
+# a disparar el callback, manda el trabajo anterior en `oldJob` para que se
+# termine. Este gestor cambia cómo se ejecutan esos trabajos:
+#
+#   - en un pool de procesos que se reutiliza, en vez de un proceso por clic;
+#   - dos peticiones idénticas (misma clave) comparten un solo trabajo;
+#   - terminar un trabajo solo cancela el cálculo si nadie más lo espera, y la
+#     cancelación es cooperativa: se comprueba en cada aviso de progreso.
+#
+# Todo el estado vive en la caché en disco, así que cualquier worker de
+# gunicorn puede responder las consultas de un trabajo lanzado por otro.
+#
+# Dash no tiene una API pública para esto: el gestor reemplaza métodos internos
+# de DiskcacheManager (call_job_fn, make_job_fn, func_registry,
+# _make_progress_key) tal como están en dash 2.18, la versión fijada en
+# requirements.txt. Al subir de versión hay que revisarlos.
+
+class CacheProtegida:
+    """diskcache.Cache que no se usa mientras se crean los procesos del pool.
+
+    Un proceso creado con fork mientras otro hilo está dentro de una operación
+    de SQLite hereda ese bloqueo a medias y espera para siempre a que se libere.
+    Las operaciones de la caché comparten el bloqueo; el fork lo toma en
+    exclusiva, cuando ninguna está en curso.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._reiniciar_bloqueo()
+
+    def _reiniciar_bloqueo(self):
+        self._pid = os.getpid()
+        self._condicion = threading.Condition()
+        self._en_curso = 0
+
+    @contextmanager
+    def _compartido(self):
+        # Un proceso hijo hereda el bloqueo tomado en exclusiva por el fork
+        if self._pid != os.getpid():
+            self._reiniciar_bloqueo()
+        with self._condicion:
+            self._en_curso += 1
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._en_curso -= 1
+                if not self._en_curso:
+                    self._condicion.notify_all()
+
+    @contextmanager
+    def exclusivo(self):
+        """Bloque sin operaciones de la caché en curso, para crear procesos"""
+        with self._condicion:
+            self._condicion.wait_for(lambda: not self._en_curso)
+            yield
+
+    @contextmanager
+    def transact(self, retry=False):
+        with self._compartido(), self._cache.transact(retry):
+            yield
+
+    def __getattr__(self, nombre):
+        valor = getattr(self._cache, nombre)
+        if not callable(valor):
+            return valor
+
+        @functools.wraps(valor)
+        def protegido(*args, **kwargs):
+            with self._compartido():
+                return valor(*args, **kwargs)
+        return protegido
+
+class TrabajoCancelado(PreventUpdate):
+    """El trabajo fue reemplazado por uno más reciente y nadie espera su resultado"""
+
+# Gestor del proceso; los procesos del pool lo heredan con fork (ver pool_procesos)
+_gestor = None
+
+def _ejecutar_en_proceso(clave_funcion, clave, argumentos, contexto):
+    _gestor.ejecutar(clave_funcion, clave, argumentos, contexto)
+
+class GestorSegundoPlano(DiskcacheManager):
+    """DiskcacheManager con pool de procesos, deduplicación y cancelación cooperativa"""
+
+    def __init__(self, directorio, procesos=2, expira=600, cache_by=None):
+        import diskcache
+
+        global _gestor
+        super().__init__(diskcache.Cache(directorio), cache_by=cache_by, expire=expira)
+        self.handle = CacheProtegida(self.handle)
+        self.procesos = procesos
+        self._pool = None
+        self._lock = threading.Lock()
+        self._clave_en_ejecucion = None
+        _gestor = self
+
+    # Claves auxiliares en la caché
+    @staticmethod
+    def _clave_trabajo(trabajo):
+        return f'trabajo-{trabajo}'
+
+    @staticmethod
+    def _clave_interesados(clave):
+        return f'{clave}-interesados'
+
+    @staticmethod
+    def _clave_ejecutando(clave):
+        return f'{clave}-ejecutando'
+
+    @staticmethod
+    def _clave_cancelado(clave):
+        return f'{clave}-cancelado'
+
+    def _obtener_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Los procesos heredan la app, los datos ya cargados y este gestor
+                self._pool = pool_procesos(self.procesos)
+            return self._pool
+
+    def reiniciar(self):
+        """Descarta el pool para que los trabajos siguientes vean los datos actuales.
+
+        Los trabajos ya enviados terminan en los procesos anteriores.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    # -------------------------------------------------------------------------
+    # Lado del servidor web
+    # -------------------------------------------------------------------------
+
+    def call_job_fn(self, key, job_fn, args, context):
+        trabajo = uuid.uuid4().hex
+        with self.handle.transact():
+            interesados = self.handle.get(self._clave_interesados(key), set())
+            interesados.add(trabajo)
+            self.handle.set(self._clave_interesados(key), interesados, expire=self.expire)
+            self.handle.set(self._clave_trabajo(trabajo), key, expire=self.expire)
+
+            # Si el mismo cálculo ya está en curso o terminado, este trabajo solo espera su resultado
+            nuevo = self.handle.get(self._clave_ejecutando(key)) is None and not self.result_ready(key)
+            if nuevo:
+                self.handle.set(self._clave_ejecutando(key), trabajo, expire=self.expire)
+                self.handle.delete(self._clave_cancelado(key))
+
+        if nuevo:
+            clave_funcion = next(k for k, funcion in self.func_registry.items() if funcion is job_fn)
+            # El pool crea sus procesos dentro de submit
+            with self.handle.exclusivo():
+                self._obtener_pool().submit(_ejecutar_en_proceso, clave_funcion, key, args, context)
+        return trabajo
+
+    def job_running(self, job):
+        clave = self.handle.get(self._clave_trabajo(job)) if job else None
+        return clave is not None and self.handle.get(self._clave_ejecutando(clave)) is not None
+
+    def terminate_job(self, job):
+        """Retira el interés de un trabajo; el cálculo se cancela si ya nadie lo espera"""
+        if not job:
+            return
+        with self.handle.transact():
+            clave = self.handle.get(self._clave_trabajo(job))
+            if clave is None:
+                return
+            self.handle.delete(self._clave_trabajo(job))
+            interesados = self.handle.get(self._clave_interesados(clave), set())
+            interesados.discard(job)
+            if interesados:
+                self.handle.set(self._clave_interesados(clave), interesados, expire=self.expire)
+                return
+            self.handle.delete(self._clave_interesados(clave))
+            if self.handle.get(self._clave_ejecutando(clave)) is not None:
+                self.handle.set(self._clave_cancelado(clave), True, expire=self.expire)
+
+    def terminate_unhealthy_job(self, job):
+        if job and self.handle.get(self._clave_trabajo(job)) is not None and not self.job_running(job):
+            self.terminate_job(job)
+            return True
+        return False
+
+    def get_progress(self, key):
+        # Varios navegadores pueden esperar el mismo trabajo: el progreso no se borra al leerlo
+        return self.handle.get(self._make_progress_key(key))
+
+    # -------------------------------------------------------------------------
+    # Lado del pool
+    # -------------------------------------------------------------------------
+
+    def cancelado(self):
+        return self.handle.get(self._clave_cancelado(self._clave_en_ejecucion)) is not None
+
+    def make_job_fn(self, fn, progress, key=None):
+        def con_cancelacion(*args, **kwargs):
+            if progress:
+                informar = args[0]
+
+                def informar_o_cancelar(valor):
+                    if self.cancelado():
+                        raise TrabajoCancelado()
+                    informar(valor)
+
+                args = (informar_o_cancelar,) + args[1:]
+            return fn(*args, **kwargs)
+
+        return super().make_job_fn(con_cancelacion, progress, key)
+
+    def ejecutar(self, clave_funcion, clave, argumentos, contexto):
+        self._clave_en_ejecucion = clave
+        try:
+            # Un trabajo cancelado mientras esperaba en la cola no llega a empezar
+            if not self.cancelado():
+                job_fn = self.func_registry[clave_funcion]
+                job_fn(clave, self._make_progress_key(clave), argumentos, contexto)
+            # El resultado de un trabajo cancelado no debe quedar en caché para otra petición
+            if self.cancelado():
+                self.clear_cache_entry(clave)
+        finally:
+            self.handle.delete(self._clave_ejecutando(clave))
+            self.handle.delete(self._clave_cancelado(clave))
+            self._clave_en_ejecucion = None
@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+from arranque import ModuloDiferido
+
+np = ModuloDiferido('numpy')
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# =============================================================================
+# SNAPSHOTS DE DATOS COMPARTIDOS ENTRE WORKERS
+# =============================================================================
+
+# Cada snapshot es un directorio inmutable con un .npy por arreglo. Los workers
+# los abren con np.load(mmap_mode='r'), así todos leen las mismas páginas del
+# caché del sistema operativo en lugar de tener cada uno su copia.
+#
+#   <directorio>/ACTUAL          versión vigente
+#   <directorio>/<version>/      meta.json y los .npy de esa versión
+
+ARCHIVO_ACTUAL = 'ACTUAL'
+
+@contextmanager
+def bloqueo(directorio):
+    """Bloqueo exclusivo entre procesos para construir y publicar un snapshot"""
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, '.bloqueo'), 'w') as archivo:
+        if fcntl is not None:
+            fcntl.flock(archivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(archivo, fcntl.LOCK_UN)
+
+def version_publicada(directorio):
+    """Versión vigente, o None si todavía no se ha publicado ninguna"""
+    try:
+        with open(os.path.join(directorio, ARCHIVO_ACTUAL)) as archivo:
+            return archivo.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def publicar_snapshot(directorio, version, arreglos, meta):
+    """Escribe un snapshot y lo marca como vigente.
+
+    Tanto el directorio de la versión como el puntero ACTUAL se reemplazan
+    con os.replace, de modo que un worker nunca ve un snapshot a medias.
+    """
+    destino = os.path.join(directorio, version)
+    if not os.path.isdir(destino):
+        temporal = os.path.join(directorio, f'.{version}.{os.getpid()}.tmp')
+        os.makedirs(temporal, exist_ok=True)
+        for nombre, arreglo in arreglos.items():
+            np.save(os.path.join(temporal, f'{nombre}.npy'), np.ascontiguousarray(arreglo))
+        with open(os.path.join(temporal, 'meta.json'), 'w', encoding='utf-8') as archivo:
+            json.dump(dict(meta, version=version, creado=time.time()), archivo, ensure_ascii=False)
+        os.replace(temporal, destino)
+
+    puntero = os.path.join(directorio, f'.{ARCHIVO_ACTUAL}.{os.getpid()}.tmp')
+    with open(puntero, 'w') as archivo:
+        archivo.write(version)
+    os.replace(puntero, os.path.join(directorio, ARCHIVO_ACTUAL))
+
+def abrir_snapshot(directorio, version):
+    """Arreglos mapeados en memoria (solo lectura) y metadatos de una versión"""
+    origen = os.path.join(directorio, version)
+    with open(os.path.join(origen, 'meta.json'), encoding='utf-8') as archivo:
+        meta = json.load(archivo)
+    arreglos = {
+        nombre[:-4]: np.load(os.path.join(origen, nombre), mmap_mode='r')
+        for nombre in os.listdir(origen) if nombre.endswith('.npy')
+    }
+    return arreglos, meta
+
+def limpiar_snapshots(directorio, conservar=3):
+    """Borra las versiones más antiguas, sin tocar nunca la vigente.
+
+    Los workers que aún tengan mapeada una versión borrada siguen leyéndola
+    sin problema hasta que la suelten (el archivo existe mientras esté abierto).
+    """
+    vigente = version_publicada(directorio)
+    versiones = [
+        os.path.join(directorio, nombre) for nombre in os.listdir(directorio)
+        if not nombre.startswith('.') and os.path.isdir(os.path.join(directorio, nombre))
+    ]
+    versiones.sort(key=os.path.getmtime, reverse=True)
+    for ruta in versiones[conservar:]:
+        if os.path.basename(ruta) != vigente:
+            shutil.rmtree(ruta, ignore_errors=True)
+
+# =============================================================================
+# EJECUCIÓN
+# =============================================================================
+
+def main():
+    """Reconstruye los datos desde las fuentes y publica un snapshot nuevo"""
+    import app
+
+    if not app.DIRECTORIO_SNAPSHOTS:
+        raise SystemExit("Defina DASHBOARD_SNAPSHOTS con el directorio de snapshots")
+    app.esperar_datos()
+    app.recargar_datos()
+    print(f"Snapshot {app.datos_actuales().version} publicado en {app.DIRECTORIO_SNAPSHOTS}")
+
+if __name__ == '__main__':
+    main()
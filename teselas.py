@@ -0,0 +1,242 @@
+import argparse
+import math
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from snapshot import bloqueo
+
+# =============================================================================
+# CACHÉ LOCAL DE TESELAS DEL MAPA BASE
+# =============================================================================
+
+# El mapa base se sirve desde la app: cada tesela se busca primero en disco y
+# solo si falta se pide al servidor de origen y se guarda. El disco tiene un
+# tamaño máximo; al pasarlo se borran las teselas usadas hace más tiempo (cada
+# lectura renueva la fecha de modificación del archivo).
+#
+#   <directorio>/<z>/<x>/<y>.png
+
+ORIGEN_OSM = 'https://tile.openstreetmap.org/{z}/{x}/{y}.png'
+# La política de uso de OpenStreetMap exige identificar la aplicación
+AGENTE = 'dashboard-covid-colombia/1.0 (cache de teselas)'
+ATRIBUCION_OSM = '© OpenStreetMap contributors'
+
+# Al desalojar se baja hasta esta fracción del máximo para no desalojar en cada escritura
+FRACCION_DESALOJO = 0.9
+
+# Colombia continental y San Andrés: (lon_min, lat_min, lon_max, lat_max)
+CAJA_COLOMBIA = (-82.0, -4.3, -66.8, 13.6)
+# Zooms del mapa: la vista inicial (4.2) hasta el nivel municipal sin agrupar
+ZOOMS_DASHBOARD = range(4, 11)
+
+def tesela_de(lon, lat, zoom):
+    """Tesela (x, y) que contiene un punto en un zoom, en la proyección web Mercator"""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def teselas_en_caja(zooms, caja=CAJA_COLOMBIA):
+    """(z, x, y) de todas las teselas que cubren la caja en cada zoom"""
+    lon_min, lat_min, lon_max, lat_max = caja
+    for zoom in zooms:
+        x_min, y_min = tesela_de(lon_min, lat_max, zoom)
+        x_max, y_max = tesela_de(lon_max, lat_min, zoom)
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                yield zoom, x, y
+
+class AlmacenTeselas:
+    """Teselas en disco con descarga bajo demanda y desalojo por tamaño.
+
+    Sin origen solo se sirven las teselas que ya están en disco (por ejemplo,
+    sembradas antes en una máquina con acceso a la red). Solo se aceptan las
+    teselas que cubren la caja en los zooms indicados, para no hacer de proxy
+    abierto del origen.
+    """
+
+    def __init__(self, directorio, max_bytes, origen=ORIGEN_OSM, timeout=10,
+                 zooms=ZOOMS_DASHBOARD, caja=CAJA_COLOMBIA):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.origen = origen
+        self.timeout = timeout
+        # Rango (x_min, x_max, y_min, y_max) de teselas admitidas en cada zoom
+        lon_min, lat_min, lon_max, lat_max = caja
+        self._rangos = {
+            zoom: tesela_de(lon_min, lat_max, zoom) + tesela_de(lon_max, lat_min, zoom)
+            for zoom in zooms
+        }
+        # Bytes en disco según este proceso; se calculan la primera vez que se escribe
+        self._bytes = None
+        self._lock = threading.Lock()
+        self._descargas = {}
+
+    def valida(self, z, x, y):
+        if z not in self._rangos:
+            return False
+        x_min, y_min, x_max, y_max = self._rangos[z]
+        return x_min <= x <= x_max and y_min <= y <= y_max
+
+    def ruta(self, z, x, y):
+        return os.path.join(self.directorio, str(z), str(x), f'{y}.png')
+
+    def leer(self, z, x, y):
+        """Bytes de la tesela en disco, o None si no está"""
+        ruta = self.ruta(z, x, y)
+        try:
+            with open(ruta, 'rb') as archivo:
+                datos = archivo.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+        return datos
+
+    def obtener(self, z, x, y):
+        """Bytes de la tesela desde el disco o el origen; None si no es válida o no está y no hay origen.
+
+        Los errores de red se propagan como OSError.
+        """
+        if not self.valida(z, x, y):
+            return None
+        datos = self.leer(z, x, y)
+        if datos is not None or not self.origen:
+            return datos
+        # Una sola descarga por tesela aunque la pidan varios hilos a la vez
+        with self._lock:
+            lock = self._descargas.setdefault((z, x, y), threading.Lock())
+        try:
+            with lock:
+                datos = self.leer(z, x, y)
+                if datos is None:
+                    datos = self.descargar(z, x, y)
+                    self.guardar(z, x, y, datos)
+            return datos
+        finally:
+            with self._lock:
+                self._descargas.pop((z, x, y), None)
+
+    def descargar(self, z, x, y):
+        peticion = urllib.request.Request(self.origen.format(z=z, x=x, y=y), headers={'User-Agent': AGENTE})
+        with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+            return respuesta.read()
+
+    def guardar(self, z, x, y, datos):
+        ruta = self.ruta(z, x, y)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporal, 'wb') as archivo:
+            archivo.write(datos)
+        os.replace(temporal, ruta)
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self.tamano()
+            else:
+                self._bytes += len(datos)
+            lleno = self._bytes > self.max_bytes
+        if lleno:
+            self.desalojar()
+
+    def archivos(self):
+        """(fecha de uso, bytes, ruta) de cada tesela en disco"""
+        encontrados = []
+        for raiz, _, nombres in os.walk(self.directorio):
+            for nombre in nombres:
+                if not nombre.endswith('.png'):
+                    continue
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    estado = os.stat(ruta)
+                except FileNotFoundError:
+                    continue
+                encontrados.append((estado.st_mtime, estado.st_size, ruta))
+        return encontrados
+
+    def tamano(self):
+        return sum(tamano for _, tamano, _ in self.archivos())
+
+    def desalojar(self):
+        """Borra las teselas usadas hace más tiempo hasta bajar de la fracción del máximo"""
+        # Los demás workers pueden estar desalojando el mismo directorio
+        with bloqueo(self.directorio):
+            archivos = sorted(self.archivos())
+            total = sum(tamano for _, tamano, _ in archivos)
+            objetivo = self.max_bytes * FRACCION_DESALOJO
+            for _, tamano, ruta in archivos:
+                if total <= objetivo:
+                    break
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+                total -= tamano
+        with self._lock:
+            self._bytes = total
+
+def sembrar(almacen, teselas, hilos=2):
+    """Descarga las teselas que falten; devuelve cuántas ya estaban, se descargaron y fallaron"""
+    conteo = {'existentes': 0, 'descargadas': 0, 'fallidas': 0}
+
+    def sembrar_tesela(tesela):
+        if os.path.exists(almacen.ruta(*tesela)):
+            return 'existentes'
+        try:
+            almacen.obtener(*tesela)
+        except OSError:
+            return 'fallidas'
+        return 'descargadas'
+
+    with ThreadPoolExecutor(hilos) as pool:
+        for resultado in pool.map(sembrar_tesela, teselas):
+            conteo[resultado] += 1
+    return conteo
+
+# =============================================================================
+# EJECUCIÓN
+# =============================================================================
+
+def leer_zooms(texto):
+    """'4-10' o '4,5,6' -> lista de zooms"""
+    if '-' in texto:
+        inicio, fin = texto.split('-')
+        return list(range(int(inicio), int(fin) + 1))
+    return [int(zoom) for zoom in texto.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description="Siembra la caché local de teselas del mapa base")
+    parser.add_argument('--directorio', default=os.environ.get('DASHBOARD_TESELAS', 'cache/teselas'))
+    parser.add_argument('--max-mb', type=float, default=float(os.environ.get('DASHBOARD_TESELAS_MAX_MB', 512)))
+    # Sin valor por omisión: la política de uso de OpenStreetMap prohíbe sembrar
+    # desde tile.openstreetmap.org, así que el origen debe admitir descargas masivas
+    parser.add_argument('--origen', required=True,
+                        help="URL con {z}, {x} e {y} de un servidor de teselas que permita sembrar")
+    parser.add_argument('--zoom', default=f'{ZOOMS_DASHBOARD.start}-{ZOOMS_DASHBOARD.stop - 1}',
+                        help="Zooms a sembrar, como rango (4-10) o lista (4,6,8)")
+    parser.add_argument('--caja', default=','.join(str(v) for v in CAJA_COLOMBIA),
+                        help="lon_min,lat_min,lon_max,lat_max")
+    parser.add_argument('--hilos', type=int, default=2)
+    args = parser.parse_args()
+
+    zooms = leer_zooms(args.zoom)
+    caja = tuple(float(v) for v in args.caja.split(','))
+    almacen = AlmacenTeselas(args.directorio, int(args.max_mb * 1024 * 1024), args.origen, zooms=zooms, caja=caja)
+    teselas = list(teselas_en_caja(zooms, caja))
+    print(f"Sembrando {len(teselas)} teselas en {args.directorio} desde {args.origen}")
+
+    inicio = time.perf_counter()
+    conteo = sembrar(almacen, teselas, args.hilos)
+    print(f"{conteo['descargadas']} descargadas, {conteo['existentes']} ya estaban, "
+          f"{conteo['fallidas']} fallidas en {time.perf_counter() - inicio:.1f} s; "
+          f"{almacen.tamano() / 1e6:.1f} MB en disco")
+    if almacen.tamano() >= almacen.max_bytes * FRACCION_DESALOJO:
+        print("Aviso: la caché llegó a su tamaño máximo y desalojó teselas sembradas; aumente --max-mb")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from departamentos import NOMBRES_DEPARTAMENTOS
+
+def datos_de(diarios):
+    df = app.cargar_datos_actualizados(diarios)
+    cubo = app.CuboCasos.desde_datos(df, diarios)
+    return df, cubo, app.calcular_version_datos(df, cubo)
+
+def casos_diarios(rng, dias):
+    fechas = pd.date_range('2021-03-01', periods=dias, freq='D')
+    filas = [(d, f, int(rng.integers(0, 40))) for d in NOMBRES_DEPARTAMENTOS for f in fechas]
+    return pd.DataFrame(filas, columns=['Departamento', 'fecha', 'casos'])
+
+def comparar(incremental, completo):
+    np.testing.assert_array_equal(incremental.agregados_kpis.acumulado, completo.agregados_kpis.acumulado)
+    n = len(completo.df)
+    for metrica in app.METRICAS_RANKING:
+        for regiones in (None, ('Andina',), ('Caribe', 'Insular')):
+            assert (incremental.indice_ranking.top(metrica, n, regiones).tolist()
+                    == completo.indice_ranking.top(metrica, n, regiones).tolist())
+
+@pytest.mark.parametrize('semilla', range(3))
+def test_dias_nuevos_igual_a_reconstruir(semilla):
+    rng = np.random.default_rng(semilla)
+    diarios = casos_diarios(rng, 30)
+    anterior = app.DatosProceso(*datos_de(diarios[diarios['fecha'] < '2021-03-25']))
+    acumulado_anterior = np.array(anterior.agregados_kpis.acumulado)
+    # Además de los días nuevos, una corrección de un día ya publicado
+    diarios.loc[0, 'casos'] += 7
+
+    nuevos = datos_de(diarios)
+    comparar(app.DatosProceso(*nuevos, anterior=anterior), app.DatosProceso(*nuevos))
+    # Los datos ya publicados no cambian
+    np.testing.assert_array_equal(anterior.agregados_kpis.acumulado, acumulado_anterior)
+
+def test_cubo_que_no_continua_se_reconstruye():
+    anterior = app.DatosProceso(*datos_de(None))
+    nuevos = datos_de(casos_diarios(np.random.default_rng(0), 10))
+    assert app.actualizar_agregados_kpis(anterior.agregados_kpis, anterior, nuevos[0], nuevos[1]) is None
+    comparar(app.DatosProceso(*nuevos, anterior=anterior), app.DatosProceso(*nuevos))
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from kpis import AgregadosKPI
+
+DEPARTAMENTOS = np.array([f'D{i}' for i in range(12)], dtype=object)
+REGIONES = np.array(['Andina', 'Caribe', 'Pacífica'] * 4, dtype=object)
+POBLACION = np.arange(1, 13) * 1000
+
+def acumulado_de(diarios):
+    acumulado = np.zeros((diarios.shape[0], diarios.shape[1] + 1), dtype=np.int64)
+    np.cumsum(diarios, axis=1, out=acumulado[:, 1:])
+    return acumulado
+
+def lote(diarios_antes, diarios_despues):
+    """(filas, días, casos) que llevan de unos casos diarios a otros"""
+    delta = diarios_despues.copy()
+    delta[:, :diarios_antes.shape[1]] -= diarios_antes
+    filas, dias = np.nonzero(delta)
+    return filas, dias, delta[filas, dias]
+
+def totales_de(agregados, n_dias, particiones):
+    rangos = [None, (0, 0), (3, n_dias - 1), (n_dias - 1, n_dias - 1)]
+    return [agregados.totales(rango, particiones) for rango in rangos]
+
+@pytest.mark.parametrize('semilla', range(5))
+@pytest.mark.parametrize('particiones', [REGIONES, DEPARTAMENTOS])
+def test_agregar_casos_igual_a_reconstruir(semilla, particiones):
+    rng = np.random.default_rng(semilla)
+    antes = rng.integers(0, 50, (12, 20))
+    # Tres días nuevos y correcciones de algunos días anteriores
+    despues = np.concatenate([antes, rng.integers(0, 50, (12, 3))], axis=1)
+    despues[rng.integers(0, 12, 5), rng.integers(0, 20, 5)] += rng.integers(-3, 10, 5)
+    despues = np.maximum(despues, 0)
+
+    agregados = AgregadosKPI(particiones, acumulado_de(antes), POBLACION).copia()
+    filas, dias, casos = lote(antes, despues)
+    agregados.agregar_casos(particiones[filas], dias, casos, n_dias=despues.shape[1])
+    completo = AgregadosKPI(particiones, acumulado_de(despues), POBLACION)
+
+    np.testing.assert_array_equal(agregados.acumulado, completo.acumulado)
+    for elegidas in (None, tuple(sorted(set(particiones)))[:2]):
+        assert totales_de(agregados, despues.shape[1], elegidas) == totales_de(completo, despues.shape[1], elegidas)
+
+def test_dias_nuevos_sin_casos_amplian_el_acumulado():
+    antes = np.ones((12, 5), dtype=np.int64)
+    agregados = AgregadosKPI(REGIONES, acumulado_de(antes), POBLACION)
+    agregados.agregar_casos([], [], [], n_dias=8)
+    despues = np.concatenate([antes, np.zeros((12, 3), dtype=np.int64)], axis=1)
+    completo = AgregadosKPI(REGIONES, acumulado_de(despues), POBLACION)
+    np.testing.assert_array_equal(agregados.acumulado, completo.acumulado)
+
+def test_copia_no_cambia_el_original_ni_el_cubo():
+    acumulado = acumulado_de(np.ones((12, 5), dtype=np.int64))
+    cubo = acumulado.copy()
+    for particiones in (REGIONES, DEPARTAMENTOS):
+        agregados = AgregadosKPI(particiones, acumulado, POBLACION)
+        antes = agregados.acumulado.copy()
+        copia = agregados.copia()
+        copia.agregar_casos([particiones[0]], [2], [10], n_dias=7)
+        np.testing.assert_array_equal(agregados.acumulado, antes)
+        assert agregados.n_dias == 5 and copia.n_dias == 7
+    np.testing.assert_array_equal(acumulado, cubo)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from ranking import IndiceRanking, top_de_valores
+
+REGIONES = np.array(['Andina', 'Caribe', 'Pacífica'], dtype=object)
+
+def tabla(rng, filas):
+    # Valores enteros pequeños para que haya muchos empates
+    valores = {'casos': rng.integers(0, 20, filas).astype(float), 'incidencia': rng.integers(0, 5, filas) / 2}
+    return valores, rng.choice(REGIONES, filas)
+
+def ordenes(indice):
+    """Orden completo de cada métrica y combinación de particiones"""
+    combinaciones = [None, ('Andina',), ('Caribe', 'Pacífica')]
+    return {
+        (metrica, particiones): indice.top(metrica, len(indice), particiones).tolist()
+        for metrica in indice.valores for particiones in combinaciones
+    }
+
+@pytest.mark.parametrize('semilla', range(5))
+def test_agregar_igual_a_reconstruir(semilla):
+    rng = np.random.default_rng(semilla)
+    valores, particiones = tabla(rng, 40)
+    nuevos, particiones_nuevas = tabla(rng, 15)
+
+    indice = IndiceRanking(valores, particiones)
+    indice.agregar(nuevos, particiones_nuevas)
+    completo = IndiceRanking({m: np.concatenate([valores[m], nuevos[m]]) for m in valores},
+                             np.concatenate([particiones, particiones_nuevas]))
+    assert ordenes(indice) == ordenes(completo)
+
+@pytest.mark.parametrize('semilla', range(5))
+def test_actualizar_igual_a_reconstruir(semilla):
+    rng = np.random.default_rng(semilla)
+    valores, particiones = tabla(rng, 50)
+    filas = rng.choice(50, 12, replace=False)
+    cambios, _ = tabla(rng, 12)
+
+    indice = IndiceRanking(valores, particiones)
+    indice.actualizar(filas, cambios)
+    actualizados = {m: v.copy() for m, v in valores.items()}
+    for metrica in actualizados:
+        actualizados[metrica][filas] = cambios[metrica]
+    completo = IndiceRanking(actualizados, particiones)
+    assert ordenes(indice) == ordenes(completo)
+
+def test_top_coincide_con_seleccion_parcial():
+    rng = np.random.default_rng(7)
+    valores, particiones = tabla(rng, 30)
+    indice = IndiceRanking(valores, particiones)
+    indice.actualizar([0, 5, 29], {'casos': [19, 0, 19], 'incidencia': [2, 0, 2]})
+    for n in (1, 5, 30):
+        assert indice.top('casos', n).tolist() == top_de_valores(indice.valores['casos'], n).tolist()
+
+def test_copia_no_cambia_el_original():
+    rng = np.random.default_rng(3)
+    valores, particiones = tabla(rng, 20)
+    indice = IndiceRanking(valores, particiones)
+    antes = ordenes(indice)
+    copia = indice.copia()
+    copia.actualizar([1, 2], {'casos': [100, -1], 'incidencia': [9, -1]})
+    copia.agregar({'casos': [50], 'incidencia': [3]}, ['Caribe'])
+    assert ordenes(indice) == antes
+    assert len(indice) == 20 and len(copia) == 21